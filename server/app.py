@@ -4,24 +4,13 @@ Provides REAL chord progression analysis and serves web build files
 Pi Network Integration - HTTPS Required
 """
 
-# CRITICAL: Clear Python bytecode cache first!
 import os
-import shutil
 import sys
 
-print("=" * 80)
-print("🧹 CLEARING PYTHON BYTECODE CACHE BEFORE STARTUP")
-print("=" * 80)
-
-# Remove all __pycache__ directories
-for root, dirs, files in os.walk('.'):
-    if '__pycache__' in dirs:
-        cache_path = os.path.join(root, '__pycache__')
-        print(f"Removing: {cache_path}")
-        shutil.rmtree(cache_path)
-
-# Disable bytecode writing for this session
-sys.dont_write_bytecode = True
+# Bytecode is precompiled at build time (python -m compileall), so startup
+# loads cached .pyc files instead of recompiling every module from source.
+# Heavy modules (librosa, yt_dlp, TensorFlow) are imported lazily by the
+# routes and warmed up in the background - see services/model_warmup.py
 
 # DEPLOYMENT MARKER - DO NOT REMOVE
 DEPLOYMENT_VERSION = "v3.0.1-FORCE-REBUILD-20251009"
@@ -29,12 +18,8 @@ DEPLOYMENT_VERSION = "v3.0.1-FORCE-REBUILD-20251009"
 print("=" * 80)
 print(f"🚀 APP.PY STARTING - ChordyPi {DEPLOYMENT_VERSION} with RapidAPI")
 print("=" * 80)
-import tempfile
-import requests
-import random
 import time
 import socket
-import ssl
 from dotenv import load_dotenv
 from flask import Flask, jsonify, request, make_response, send_from_directory, send_file
 from functools import wraps
@@ -98,6 +83,10 @@ load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 # Create Flask app with minimal auto-configuration
 app = Flask(__name__)
 
+# numpy values and chord segments serialize natively in jsonify()
+from utils.json_provider import NumpyJSONProvider
+app.json = NumpyJSONProvider(app)
+
 # Database configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///chordypi.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -263,6 +252,29 @@ def log_request_info():
 # Set max content length (50 MB for audio files)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
 
+# Prometheus text-format metrics at /metrics (request timing hooks included)
+from services.metrics import register_metrics
+register_metrics(app)
+
+# Gzip JSON responses for clients that accept it
+from utils.compression import register_gzip
+register_gzip(app)
+
+# Warm up heavy modules and the AI model according to STARTUP_MODE
+from services.model_warmup import start_warmup, is_ready, get_warmup_status
+start_warmup()
+
+# Concurrency limit + bounded queue for the analysis routes
+from services.admission_control import get_admission_controller
+
+# Per-job temp directories with a disk quota; orphans are swept in the background
+from services.scratch_space import get_scratch_space
+get_scratch_space().start_sweeper()
+
+# Download provider health: circuit breakers and the RapidAPI monthly quota
+from services.circuit_breaker import get_breaker
+from services.rapidapi_quota import get_rapidapi_quota
+
 def check_ffmpeg():
     """Check if FFmpeg is available"""
     try:
@@ -292,6 +304,14 @@ def health_check():
         "web_build_exists": os.path.exists(WEB_BUILD_PATH),
         "real_analysis": "enabled",
         "ffmpeg_available": check_ffmpeg(),
+        "ready": is_ready(),
+        "warmup": get_warmup_status(),
+        "admission": get_admission_controller().stats(),
+        "scratch": get_scratch_space().stats(),
+        "download_providers": {
+            "breakers": {name: get_breaker(name).stats() for name in ('rapidapi', 'yt_dlp')},
+            "rapidapi_quota": get_rapidapi_quota().stats()
+        },
         "dependencies": {
             "yt_dlp": True,
             "librosa": True,
@@ -299,6 +319,16 @@ def health_check():
         }
     })
 
+# Readiness probe - 503 until warmup has finished so new instances
+# are not sent analysis traffic while the model is still loading
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    status = get_warmup_status()
+    return jsonify({
+        "status": "ready" if status['ready'] else "warming_up",
+        "warmup": status
+    }), 200 if status['ready'] else 503
+
 # Test file upload endpoint - for debugging
 @app.route('/api/test-upload', methods=['POST'])
 def test_upload():
@@ -426,14 +456,13 @@ if __name__ == '__main__':
     print("CORS: Enabled for HTTPS origins")
     print("SSL: Self-signed certificate (accept browser warning)")
     
-    # Check dependencies
-    try:
-        import yt_dlp
-        import librosa
-        import numpy as np
+    # Check dependencies without importing them (warmup loads them)
+    import importlib.util
+    missing = [name for name in ('yt_dlp', 'librosa', 'numpy') if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"Missing dependency: {', '.join(missing)}")
+    else:
         print("All Python dependencies available")
-    except ImportError as e:
-        print(f"Missing dependency: {e}")
     
     # Check FFmpeg
     ffmpeg_available = check_ffmpeg()
@@ -0,0 +1,171 @@
+"""
+Benchmark Basic Pitch inference runtimes
+Compares model load time, memory and inference speed for tf / tflite / onnx
+
+Each runtime is measured in a fresh subprocess so import cost and memory are
+not shared between runs. basic_pitch imports TensorFlow whenever it is
+installed, so measure onnx/tflite in an environment built from
+requirements.txt and tf from requirements-tf.txt; each result line says
+whether TensorFlow was loaded (tensorflow_loaded).
+
+Usage:
+    python benchmarks/inference_runtimes.py
+    python benchmarks/inference_runtimes.py --audio song.wav --repeats 5
+    python benchmarks/inference_runtimes.py --runtimes onnx tflite --intra-threads 2 --inter-threads 1
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+# Add the server directory to path so we can import our modules
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+
+def rss_mb():
+    """Current and peak resident memory of this process in MB"""
+    current, peak = None, None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1]) / 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        if sys.platform == 'darwin':
+            peak /= 1024  # macOS reports bytes
+    return current, peak
+
+
+def write_test_audio(path, seconds=30, sr=22050):
+    """Write a mono WAV with a simple C-F-G-C progression"""
+    import numpy as np
+
+    progression = [(60, 64, 67), (65, 69, 72), (67, 71, 74), (60, 64, 67)]
+    seg = seconds / len(progression)
+    chunks = []
+    for chord in progression:
+        t = np.arange(int(seg * sr)) / sr
+        tone = sum(np.sin(2 * np.pi * 440.0 * 2 ** ((m - 69) / 12) * t) for m in chord)
+        chunks.append(0.25 * tone)
+    signal = np.concatenate(chunks)
+    pcm = (np.clip(signal, -1, 1) * 32767).astype('<i2')
+
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.tobytes())
+
+
+def run_worker(runtime, audio_path, repeats, intra, inter):
+    """Measure one runtime inside this process and print a JSON result line"""
+    from services.inference_runtime import load_model
+
+    start = time.perf_counter()
+    from basic_pitch.inference import predict
+    import_seconds = time.perf_counter() - start
+    rss_after_import, _ = rss_mb()
+
+    start = time.perf_counter()
+    model = load_model(runtime, intra_op_threads=intra, inter_op_threads=inter)
+    load_seconds = time.perf_counter() - start
+    rss_after_load, _ = rss_mb()
+
+    timings = []
+    notes = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _, _, note_events = predict(audio_path, model_or_model_path=model)
+        timings.append(time.perf_counter() - start)
+        notes = len(note_events)
+
+    _, peak = rss_mb()
+    print(json.dumps({
+        'runtime': runtime,
+        'import_s': import_seconds,
+        'load_s': load_seconds,
+        'first_inference_s': timings[0],
+        'mean_inference_s': sum(timings[1:]) / len(timings[1:]) if len(timings) > 1 else timings[0],
+        'rss_after_import_mb': rss_after_import,
+        'rss_after_load_mb': rss_after_load,
+        'peak_rss_mb': peak,
+        'notes': notes,
+        'tensorflow_loaded': 'tensorflow' in sys.modules,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--audio', help='Audio file to analyze (default: 30s synthetic progression)')
+    parser.add_argument('--runtimes', nargs='+', help='Runtimes to compare (default: all installed)')
+    parser.add_argument('--repeats', type=int, default=3, help='Inference runs per runtime')
+    parser.add_argument('--intra-threads', type=int, default=None)
+    parser.add_argument('--inter-threads', type=int, default=None)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.audio, args.repeats, args.intra_threads, args.inter_threads)
+        return
+
+    from services.inference_runtime import available_runtimes
+
+    runtimes = args.runtimes or available_runtimes()
+    if not runtimes:
+        print("❌ No Basic Pitch runtime installed (tensorflow, tflite-runtime or onnxruntime)")
+        sys.exit(1)
+
+    audio_path = args.audio
+    temp_audio = None
+    if not audio_path:
+        temp_audio = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
+        temp_audio.close()
+        write_test_audio(temp_audio.name)
+        audio_path = temp_audio.name
+
+    print("=" * 80)
+    print(f"🧪 Basic Pitch runtime benchmark: {', '.join(runtimes)}")
+    print(f"   Audio: {audio_path} | repeats: {args.repeats} | "
+          f"intra: {args.intra_threads or 'default'} | inter: {args.inter_threads or 'default'}")
+    print("=" * 80)
+
+    results = []
+    try:
+        for runtime in runtimes:
+            command = [sys.executable, os.path.abspath(__file__), '--worker', runtime,
+                       '--audio', audio_path, '--repeats', str(args.repeats)]
+            if args.intra_threads:
+                command += ['--intra-threads', str(args.intra_threads)]
+            if args.inter_threads:
+                command += ['--inter-threads', str(args.inter_threads)]
+
+            proc = subprocess.run(command, capture_output=True, text=True, cwd=SERVER_DIR)
+            result_lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+            if proc.returncode != 0 or not result_lines:
+                print(f"❌ {runtime} failed:\n{proc.stderr[-2000:]}")
+                continue
+            results.append(json.loads(result_lines[-1]))
+    finally:
+        if temp_audio:
+            os.remove(temp_audio.name)
+
+    header = f"{'runtime':<8} {'import s':>9} {'load s':>8} {'1st inf s':>10} {'mean inf s':>11} {'RSS load MB':>12} {'peak MB':>9} {'notes':>6}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['runtime']:<8} {r['import_s']:>9.2f} {r['load_s']:>8.2f} {r['first_inference_s']:>10.2f} "
+              f"{r['mean_inference_s']:>11.2f} {r['rss_after_load_mb'] or 0:>12.0f} {r['peak_rss_mb'] or 0:>9.0f} {r['notes']:>6}")
+
+
+if __name__ == '__main__':
+    main()
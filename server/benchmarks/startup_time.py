@@ -0,0 +1,93 @@
+"""
+Benchmark server cold start
+Measures how long `import app` takes and how long until warmup reports ready
+
+Each run is a fresh interpreter, so the numbers match what an autoscaled
+instance sees on boot. Run once with --no-bytecode to compare against a tree
+without precompiled .pyc files.
+
+Usage:
+    python benchmarks/startup_time.py
+    python benchmarks/startup_time.py --modes lazy eager --runs 5
+    python benchmarks/startup_time.py --no-bytecode
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('librosa', 'yt_dlp', 'tensorflow', 'basic_pitch', 'onnxruntime')
+
+# Runs inside the child interpreter
+CHILD_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+import_seconds = time.perf_counter() - start
+heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+from services.model_warmup import wait_until_ready, get_warmup_status
+wait_until_ready(timeout=600)
+ready_seconds = time.perf_counter() - start
+print(json.dumps({
+    'import_s': import_seconds,
+    'ready_s': ready_seconds,
+    'heavy_loaded_at_import': heavy,
+    'warmup': get_warmup_status(),
+}))
+"""
+
+
+def measure(mode, no_bytecode):
+    """Start one interpreter in the given STARTUP_MODE and return its timings"""
+    env = dict(os.environ, STARTUP_MODE=mode)
+    command = [sys.executable]
+    if no_bytecode:
+        # Point the bytecode cache at an empty directory and never write to it
+        command.append('-B')
+        env['PYTHONPYCACHEPREFIX'] = os.path.join(SERVER_DIR, '.benchmark-empty-pycache')
+    command += ['-c', f"HEAVY_MODULES = {HEAVY_MODULES!r}\n" + CHILD_SCRIPT]
+
+    proc = subprocess.run(command, capture_output=True, text=True, cwd=SERVER_DIR, env=env)
+    result_lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+    if proc.returncode != 0 or not result_lines:
+        raise RuntimeError(proc.stderr[-2000:])
+    return json.loads(result_lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['lazy', 'eager'], choices=['lazy', 'eager', 'off'])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--no-bytecode', action='store_true', help='Ignore cached .pyc files (simulates the old startup)')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print(f"🧪 Startup benchmark: modes={args.modes} runs={args.runs} bytecode={'off' if args.no_bytecode else 'on'}")
+    print("=" * 80)
+
+    header = f"{'mode':<6} {'import s (median)':>18} {'ready s (median)':>17}  heavy modules loaded at import"
+    print(header)
+    print("-" * len(header))
+    for mode in args.modes:
+        results = []
+        for _ in range(args.runs):
+            try:
+                results.append(measure(mode, args.no_bytecode))
+            except RuntimeError as e:
+                print(f"❌ {mode} run failed:\n{e}")
+                break
+        if not results:
+            continue
+        import_s = statistics.median(r['import_s'] for r in results)
+        ready_s = statistics.median(r['ready_s'] for r in results)
+        heavy = ', '.join(results[-1]['heavy_loaded_at_import']) or '-'
+        print(f"{mode:<6} {import_s:>18.2f} {ready_s:>17.2f}  {heavy}")
+
+
+if __name__ == '__main__':
+    main()
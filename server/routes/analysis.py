@@ -4,16 +4,23 @@ Provides actual chord analysis using audio processing
 """
 
 from flask import Blueprint, request, jsonify
+import copy
 import os
-import tempfile
 import logging
 
+from services.admission_control import AdmissionRejected, get_admission_controller
+from utils.chord_wire_format import encode_result, requested_format, to_columnar
+from utils.stage_timings import StageTimings, server_timing_header, timings_log_line
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 analysis_bp = Blueprint('analysis', __name__)
 
+# Comment line sent on an idle event stream so proxies keep it open
+SSE_KEEPALIVE_SECONDS = 15
+
 @analysis_bp.route('/api/analyze-song', methods=['POST'])
 def analyze_song():
     """
@@ -48,12 +55,7 @@ def analyze_song():
                 "error": "Request must be either JSON with song_name/url or multipart/form-data with audio file"
             }), 415
         
-        song_name = data.get('song_name', data.get('query', ''))
-        url = data.get('url', '')
-
-        # More lenient validation - accept None/empty as long as ONE field has value
-        song_name = song_name if song_name else ''
-        url = url if url else ''
+        song_name, url, options = _parse_song_request(data)
         
         if not song_name and not url:
             logger.error(f"❌ Missing both song_name and url. Received data: {data}")
@@ -66,227 +68,20 @@ def analyze_song():
         logger.info(f"   Song name: {song_name}")
         logger.info(f"   URL: {url}")
         
-        # STEP 1: Try multi-source real chord detection (APIs, scraping)
+        # Turn the request away now if the analysis queue is full
         try:
-            from services.real_chord_detection import get_real_chords
-            
-            # Extract artist from song name if possible
-            artist = None
-            if ' - ' in song_name:
-                parts = song_name.split(' - ')
-                artist = parts[0].strip()
-                song_title = parts[1].strip()
-            else:
-                song_title = song_name
-            
-            print(f"🔍 Trying external sources: {song_title} by {artist}")
-            real_chords_result = get_real_chords(song_title, artist, url)
-            
-            if real_chords_result and real_chords_result.get('chords'):
-                print(f"✅ SUCCESS! Got chords from: {real_chords_result['source']}")
-                print(f"📊 Accuracy: {real_chords_result['accuracy']}%")
-                print(f"🎸 Chords: {len(real_chords_result['chords'])} changes")
-                
-                return jsonify({
-                    "status": "success",
-                    "song_name": song_name,
-                    "url": url,
-                    "chords": real_chords_result['chords'],
-                    "duration": real_chords_result.get('chords', [{}])[-1].get('time', 240) + 4,
-                    "title": song_name,
-                    "key": real_chords_result['key'],
-                    "bpm": real_chords_result.get('bpm', 120),
-                    "analysis_type": "real_multi_source",
-                    "source": real_chords_result['source'],
-                    "accuracy": real_chords_result['accuracy'],
-                    "analysis_metadata": {
-                        'method': real_chords_result['method'],
-                        'source': real_chords_result['source'],
-                        'accuracy': real_chords_result['accuracy'],
-                        'total_chords': len(real_chords_result['chords'])
-                    }
-                })
-        except ImportError as e:
-            print(f"⚠️ Real chord detection module not available: {e}")
-        except Exception as e:
-            print(f"⚠️ External chord detection failed: {e}")
+            ticket = get_admission_controller().enter()
+        except AdmissionRejected as e:
+            return _busy_response(e)
         
-        # STEP 2: Fallback to AI-enhanced audio analysis
-        print(f"⚠️ Falling back to AI-enhanced audio analysis")
+        # Thin synchronous wrapper: run as a job on the worker pool and wait
+        from services.analysis_jobs import get_job_manager
+        job = get_job_manager().submit(song_name, url, options, ticket=ticket)
+        job.wait()
         
-        try:
-            # Try AI-enhanced detection first
-            from services.enhanced_chord_detection import detect_chords_ai, get_enhanced_detector
-            from utils.audio_processor import download_youtube_audio
-            
-            detector = get_enhanced_detector()
-            if detector.available:
-                print(f"🤖 Using AI-enhanced chord detection (90-95% accuracy)")
-            else:
-                print(f"📊 Using librosa fallback (60-70% accuracy)")
-                print(f"   💡 Install Basic Pitch for AI detection: pip install basic-pitch")
-        except ImportError as e:
-            # Final fallback to old method
-            try:
-                from utils.chord_analyzer import extract_chords_from_audio
-                from utils.audio_processor import download_youtube_audio
-                print(f"📊 Using standard audio analysis for: {song_name or url}")
-            except ImportError as e2:
-                print(f"❌ Audio analyzer not available: {e2}")
-                return jsonify({
-                    "status": "error",
-                    "error": "Chord analysis system not available"
-                }), 500
-
-        # Use the provided URL or fallback for song name
-        analysis_url = url if url else f"ytsearch:{song_name}"
-
-        try:
-            print(f"🎯 Starting AI-enhanced audio analysis for URL: {analysis_url}")
-            
-            # Download audio
-            print("=" * 80)
-            print("🔴 ABOUT TO CALL download_youtube_audio() FROM ROUTES/ANALYSIS.PY")
-            print(f"🔴 URL: {analysis_url}")
-            print("=" * 80)
-            
-            audio_path, duration, title = download_youtube_audio(analysis_url)
-            
-            print("=" * 80)
-            print(f"🔴 download_youtube_audio() RETURNED")
-            print(f"🔴 audio_path: {audio_path}")
-            print(f"🔴 duration: {duration}")
-            print(f"🔴 title: {title}")
-            print("=" * 80)
-            
-            if not audio_path:
-                error_msg = str(title) if title else "Failed to download audio from YouTube"
-                print(f"❌ YouTube download failed: {error_msg}")
-                
-                # Provide helpful error message based on the error
-                if "bot detection" in error_msg.lower() or "sign in" in error_msg.lower():
-                    user_error = "YouTube blocked the download (bot detection). This is a limitation of free cloud hosting. Try: 1) Use a different song, or 2) Wait a few minutes and try again."
-                else:
-                    user_error = f"Could not download audio: {error_msg}"
-                    
-                raise Exception(user_error)
-            
-            # Try AI-enhanced detection first
-            try:
-                from services.enhanced_chord_detection import detect_chords_ai, analyze_song_chords, get_enhanced_detector
-                
-                detector = get_enhanced_detector()
-                
-                # Use AI detection if available
-                if detector.available:
-                    print("🤖 Running AI chord detection...")
-                    result = analyze_song_chords(audio_path)
-                    chords = result['chords']
-                    song_key = result['key']
-                    detection_method = 'AI-Enhanced (Basic Pitch)'
-                    accuracy = 90
-                    
-                    analysis_metadata = {
-                        'method': result['method'],
-                        'total_chord_segments': result['total_chords'],
-                        'unique_chords': result['unique_chords'],
-                        'accuracy': 90,
-                        'detection_engine': 'Spotify Basic Pitch AI',
-                        'note': 'Deep learning model trained on 10,000+ hours of music'
-                    }
-                else:
-                    raise ImportError("Basic Pitch not available")
-                    
-            except (ImportError, Exception) as ai_error:
-                # Fallback to librosa
-                print(f"⚠️ AI detection unavailable: {ai_error}")
-                print("📊 Using librosa fallback...")
-                
-                from utils.chord_analyzer import extract_chords_from_audio
-                chords = extract_chords_from_audio(audio_path, min(duration, 300))
-                song_key = "C Major"
-                detection_method = 'Audio Analysis (Librosa)'
-                accuracy = 70
-                
-                analysis_metadata = {
-                    'method': 'librosa',
-                    'total_chord_segments': len(chords),
-                    'unique_chords': len(set(c.get('chord', '') for c in chords)),
-                    'accuracy': 70,
-                    'detection_engine': 'Librosa Chroma Features',
-                    'note': 'Install Basic Pitch for AI-enhanced detection: pip install basic-pitch'
-                }
-            
-            # Clean up temp file
-            try:
-                import os
-                if os.path.exists(audio_path):
-                    os.remove(audio_path)
-            except:
-                pass
-
-            if not chords:
-                print("❌ Chord detection returned no chords")
-                return jsonify({
-                    "status": "error",
-                    "error": "Could not analyze chord progression for this song"
-                }), 400
-
-            # Convert numpy types to Python types for JSON serialization
-            def convert_to_json_serializable(obj):
-                """Convert numpy types to Python native types"""
-                import numpy as np
-                if isinstance(obj, dict):
-                    return {k: convert_to_json_serializable(v) for k, v in obj.items()}
-                elif isinstance(obj, list):
-                    return [convert_to_json_serializable(item) for item in obj]
-                elif isinstance(obj, (np.integer, np.int32, np.int64)):
-                    return int(obj)
-                elif isinstance(obj, (np.floating, np.float32, np.float64)):
-                    return float(obj)
-                elif isinstance(obj, np.ndarray):
-                    return obj.tolist()
-                else:
-                    return obj
-            
-            # Clean chords data
-            chords = convert_to_json_serializable(chords)
-            analysis_metadata = convert_to_json_serializable(analysis_metadata)
-
-            return jsonify({
-                "status": "success",
-                "song_name": song_name or "URL provided",
-                "url": url or analysis_url,
-                "chords": chords,
-                "duration": float(duration) if duration else 240,
-                "title": title,
-                "key": song_key,
-                "analysis_type": detection_method,
-                "accuracy": int(accuracy) if accuracy else 70,
-                "source": detection_method,
-                "analysis_metadata": analysis_metadata
-            })
-        except Exception as analysis_error:
-            import traceback
-            error_details = traceback.format_exc()
-            print(f"❌ Audio analysis failed: {analysis_error}")
-            print(f"❌ Full error traceback:\n{error_details}")
-
-            error_msg = str(analysis_error)
-            if "Could not detect chord progression" in error_msg:
-                user_msg = "Unable to detect chord progression. Try a different song with clear chords."
-            elif "YouTube download failed" in error_msg or "IP restrictions" in error_msg:
-                user_msg = "YouTube blocked the download request. This is a known issue with cloud servers. We're working on a fix!"
-            else:
-                user_msg = f"Chord analysis failed: {error_msg}"
-
-            return jsonify({
-                "status": "error",
-                "error": user_msg,
-                "song_name": song_name,
-                "analysis_attempted": True,
-                "error_details": error_msg if "YouTube" in error_msg else None
-            }), 400
+        if job.status == 'succeeded':
+            return _result_response(job.result, _wire_format(data))
+        return _job_error_response(job)
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
@@ -298,6 +93,256 @@ def analyze_song():
         }), 500
 
 
+def _busy_response(error):
+    """429 with Retry-After for an AdmissionRejected"""
+    response = jsonify(error.payload)
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def _job_error_response(job):
+    """A failed job's error body and status (with Retry-After when it was turned away)"""
+    response = jsonify(job.error)
+    response.status_code = job.error_status
+    if job.retry_after:
+        response.headers['Retry-After'] = str(job.retry_after)
+    return response
+
+
+def _upload_timeout_response(error):
+    """504 for an upload analysis that ran out of time"""
+    print(f"⏱️ {error}")
+    return jsonify({
+        "status": "error",
+        "error": str(error),
+        "stage": error.stage,
+        "timed_out": True
+    }), 504
+
+
+def _result_response(result, wire_format):
+    """Success response with the analysis' stage timings as a Server-Timing header"""
+    response = jsonify(encode_result(result, wire_format))
+    header = server_timing_header((result.get('analysis_metadata') or {}).get('timings'))
+    if header:
+        response.headers['Server-Timing'] = header
+    return response
+
+
+def _wire_format(data=None):
+    """'columnar' or 'segments' from ?format=, the JSON body or the form"""
+    return requested_format(request.args, data, request.form)
+
+
+def _parse_song_request(data):
+    """Pull song_name, url and analysis options out of a JSON body"""
+    song_name = data.get('song_name', data.get('query', ''))
+    url = data.get('url', '')
+    
+    # More lenient validation - accept None/empty as long as ONE field has value
+    song_name = song_name if song_name else ''
+    url = url if url else ''
+    
+    options = {
+        'analysis_mode': data.get('analysis_mode'),
+        'hedge_deadline': data.get('hedge_deadline'),
+        'deadline_seconds': data.get('deadline_seconds'),
+        # Optional time window in seconds - analyze only this part of the song
+        'start': data.get('start'),
+        'end': data.get('end')
+    }
+    return song_name, url, options
+
+
+@analysis_bp.route('/api/analysis-jobs', methods=['POST'])
+def submit_analysis_job():
+    """
+    Start an analysis in the background
+    Returns 202 with a job id right away; poll the status URL for progress
+    """
+    data = request.get_json(silent=True) or {}
+    song_name, url, options = _parse_song_request(data)
+    
+    if not song_name and not url:
+        return jsonify({
+            "status": "error",
+            "error": "Song name or URL is required for analysis"
+        }), 400
+    
+    try:
+        ticket = get_admission_controller().enter()
+    except AdmissionRejected as e:
+        return _busy_response(e)
+    
+    from services.analysis_jobs import get_job_manager
+    # Progressive jobs publish chord segments on their event stream as they settle
+    options['progressive'] = bool(data.get('progressive'))
+    job = get_job_manager().submit(song_name, url, options, ticket=ticket)
+    
+    return jsonify({
+        "status": "accepted",
+        "job_id": job.id,
+        "job_status": job.status,
+        "status_url": f"/api/analysis-jobs/{job.id}",
+        "events_url": f"/api/analysis-jobs/{job.id}/events",
+        "result_url": f"/api/analysis-jobs/{job.id}/result"
+    }), 202
+
+
+@analysis_bp.route('/api/analysis-jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """Job status with per-stage progress (result included once finished)"""
+    from services.analysis_jobs import get_job_manager
+    job = get_job_manager().get(job_id)
+    if not job:
+        return jsonify({"status": "error", "error": "Analysis job not found"}), 404
+    body = job.to_dict(include_result=True)
+    if 'result' in body:
+        body['result'] = encode_result(body['result'], _wire_format())
+    return jsonify(body)
+
+
+@analysis_bp.route('/api/analysis-jobs/<job_id>/result', methods=['GET'])
+def get_analysis_job_result(job_id):
+    """
+    Final analysis result
+    202 while the job is still running, the analysis error if it failed
+    """
+    from services.analysis_jobs import get_job_manager
+    job = get_job_manager().get(job_id)
+    if not job:
+        return jsonify({"status": "error", "error": "Analysis job not found"}), 404
+    if not job.done:
+        return jsonify(job.to_dict()), 202
+    if job.status == 'succeeded':
+        return _result_response(job.result, _wire_format())
+    return _job_error_response(job)
+
+
+def _sse(event, data, event_id=None):
+    """One server-sent event with a JSON payload"""
+    from flask import current_app
+    message = f"event: {event}\ndata: {current_app.json.dumps(data)}\n\n"
+    return f"id: {event_id}\n{message}" if event_id is not None else message
+
+
+def _job_event_stream(job, wire_format, last_event_id=0):
+    """
+    text/event-stream response following a job until it finishes
+    Events: job, stage, decoded, chords (segments in song time, in order),
+    then result or error. Chord events say which engine produced them - if
+    the engine changes (AI failed, hedge lost) start over with the new one.
+    The result event holds the complete analysis.
+    """
+    from flask import Response, stream_with_context
+
+    def generate():
+        yield _sse('job', {
+            'job_id': job.id,
+            'status_url': f"/api/analysis-jobs/{job.id}",
+            'result_url': f"/api/analysis-jobs/{job.id}/result"
+        })
+        last_id = last_event_id
+        while True:
+            events = job.events_after(last_id, timeout=SSE_KEEPALIVE_SECONDS)
+            for event in events:
+                yield _sse(event['event'], event['data'], event['id'])
+                last_id = event['id']
+            if not events:
+                if job.done:
+                    break
+                yield ": keep-alive\n\n"
+        if job.status == 'succeeded':
+            yield _sse('result', encode_result(job.result, wire_format))
+        else:
+            yield _sse('error', dict(job.error or {}, status_code=job.error_status))
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Let each event through reverse proxies as soon as it is written
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@analysis_bp.route('/api/analysis-jobs/<job_id>/events', methods=['GET'])
+def stream_analysis_job(job_id):
+    """
+    Server-sent events for a job (EventSource reconnects resume after
+    Last-Event-ID)
+    """
+    from services.analysis_jobs import get_job_manager
+    job = get_job_manager().get(job_id)
+    if not job:
+        return jsonify({"status": "error", "error": "Analysis job not found"}), 404
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_event_id = 0
+    return _job_event_stream(job, _wire_format(), last_event_id)
+
+
+@analysis_bp.route('/api/analyze-song/events', methods=['GET'])
+def analyze_song_events():
+    """
+    Progressive analysis over server-sent events
+    Query: song_name/url plus the usual options. Starts a progressive job and
+    streams download progress, the decode, chord segments as soon as each is
+    final and finally the full result - first bars arrive while the rest of
+    the song is still being analyzed.
+    """
+    song_name, url, options = _parse_song_request(request.args)
+    if not song_name and not url:
+        return jsonify({
+            "status": "error",
+            "error": "Song name or URL is required for analysis"
+        }), 400
+    
+    try:
+        ticket = get_admission_controller().enter()
+    except AdmissionRejected as e:
+        return _busy_response(e)
+    
+    from services.analysis_jobs import get_job_manager
+    options['progressive'] = True
+    job = get_job_manager().submit(song_name, url, options, ticket=ticket)
+    print(f"📡 Streaming analysis job {job.id}")
+    return _job_event_stream(job, _wire_format())
+
+
+@analysis_bp.route('/api/analyze-batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analyze a setlist in one request
+    Body: {"songs": ["Artist - Title", "https://youtu.be/...", "<video id>", ...]}
+    plus the usual analysis options. Streams newline-delimited JSON: one line
+    per unique song as soon as it is ready (cache hits first), then a summary.
+    """
+    from flask import Response, current_app, stream_with_context
+    from services.analysis_pipeline import AnalysisError
+    from services.batch_analysis import parse_batch, run_batch
+
+    data = request.get_json(silent=True) or {}
+    _, _, options = _parse_song_request(data)
+    try:
+        items = parse_batch(data, options)
+    except AnalysisError as e:
+        return jsonify(e.payload), e.status_code
+    wire_format = _wire_format(data)
+    print(f"📦 Batch analysis: {len(items)} unique songs")
+
+    def generate():
+        for line in run_batch(items):
+            if 'result' in line:
+                line['result'] = encode_result(line['result'], wire_format)
+            yield current_app.json.dumps(line) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Let each line through reverse proxies as soon as it is written
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def analyze_uploaded_file():
     """
     Analyze an uploaded audio file (MP3, WAV, M4A)
@@ -308,6 +353,15 @@ def analyze_uploaded_file():
     print(f"📥 Request.files keys: {list(request.files.keys())}")
     print("=" * 80)
     
+    from utils.deadline import Deadline, DeadlineExceeded
+    from services.analysis_pipeline import AnalysisError
+    from services.scratch_space import ScratchQuotaExceeded, get_scratch_space
+    deadline = Deadline.from_request(request.form.get('deadline_seconds'))
+    scratch = get_scratch_space()
+    upload_dir = None
+    ticket = None
+    timings = StageTimings()
+    outcome = 'error'
     try:
         # Frontend sends 'audio', but also check 'file' for compatibility
         file = request.files.get('audio') or request.files.get('file')
@@ -332,77 +386,108 @@ def analyze_uploaded_file():
                 "error": f"Unsupported file type: {file_ext}. Supported: MP3, WAV, M4A, OGG, FLAC"
             }), 400
         
-        # Save to temporary file
-        temp_dir = tempfile.gettempdir()
-        temp_path = os.path.join(temp_dir, f"upload_{os.getpid()}_{filename}")
-        
-        print(f"💾 Saving to: {temp_path}")
-        file.save(temp_path)
+        # Take a place in the analysis queue (429 when it is full)
+        ticket = get_admission_controller().enter()
         
-        # Get file duration
+        # Stream into this request's scratch directory (removed when the request
+        # ends), hashing and sniffing the container as we go
+        from utils.upload_handler import stream_upload, UploadRejected
+        from flask import current_app
+        scratch.check_quota(request.content_length or 0)
+        upload_dir = scratch.create_dir('upload')
         try:
-            import librosa
-            y, sr = librosa.load(temp_path, sr=None, duration=300)  # Limit to 5 minutes
-            duration = len(y) / sr
-            print(f"⏱️ Duration: {duration:.1f}s")
-        except Exception as e:
-            print(f"⚠️ Could not get duration: {e}")
-            duration = 240  # Default to 4 minutes
+            with timings.stage('upload') as stage:
+                uploaded = stream_upload(file, scratch_dir=upload_dir,
+                                         max_bytes=current_app.config.get('MAX_CONTENT_LENGTH'))
+                stage.bytes = uploaded.size
+        except UploadRejected as e:
+            print(f"🚫 Upload rejected: {e}")
+            return jsonify({
+                "status": "error",
+                "error": str(e)
+            }), e.status_code
+        temp_path = uploaded.path
+        print(f"💾 Saved {uploaded.size} bytes ({uploaded.format}/{uploaded.codec}) to: {temp_path}")
         
-        # Try AI-enhanced detection
-        try:
-            from services.enhanced_chord_detection import analyze_song_chords, get_enhanced_detector
-            
-            detector = get_enhanced_detector()
+        # Identical audio analyzed with the same mode (and window) is served from the cache
+        from services.analysis_pipeline import (
+            MAX_ANALYSIS_SECONDS, detect_chords, get_analysis_mode, get_time_window, window_suffix
+        )
+        from services.result_cache import get_result_cache
+        analysis_mode = get_analysis_mode(request.form.get('analysis_mode'))
+        window = get_time_window(request.form.get('start'), request.form.get('end'))
+        cache_key = f"{uploaded.cache_key}:{analysis_mode}{window_suffix(window)}"
+        detection = get_result_cache().get(cache_key)
+        from services.metrics import get_metrics
+        get_metrics().cache_lookup('result_upload', detection is not None)
+        
+        if detection is not None:
+            print(f"⚡ Cache hit for upload {uploaded.sha256[:12]}")
+            ticket.release()
+        else:
+            hedge_deadline = request.form.get('hedge_deadline')
             
-            if detector.available:
-                print("🤖 Running AI chord detection on uploaded file...")
-                result = analyze_song_chords(temp_path)
-                chords = result['chords']
-                song_key = result['key']
-                detection_method = 'AI-Enhanced (Basic Pitch)'
-                accuracy = 90
-                
-                analysis_metadata = {
-                    'method': result['method'],
-                    'total_chord_segments': result['total_chords'],
-                    'unique_chords': result['unique_chords'],
-                    'accuracy': 90,
-                    'detection_engine': 'Spotify Basic Pitch AI',
-                    'source': 'user_upload',
-                    'filename': filename
-                }
-            else:
-                raise ImportError("Basic Pitch not available")
+            def analyze_upload(_notify):
+                # Stage timings from decode and the engines land in this request's timings
+                with timings.activate():
+                    ticket.acquire(timeout=deadline.remaining())
+                    deadline.check('decode')
+                    # Decode once - the duration comes from the samples and every
+                    # engine reuses the same signal instead of decoding the file again.
+                    # Only the requested window (or the first 5 minutes) is decoded
+                    audio = temp_path
+                    try:
+                        from utils.audio_signal import decode_audio
+                        start, end = window or (0.0, MAX_ANALYSIS_SECONDS)
+                        with timings.stage('decode') as stage:
+                            audio = decode_audio(temp_path, source_hash=uploaded.sha256,
+                                                 offset=start, max_duration=end - start)
+                            stage.bytes = audio.nbytes
+                        deadline.check('decode')
+                        duration = min(audio.duration, MAX_ANALYSIS_SECONDS)
+                        print(f"⏱️ Duration: {duration:.1f}s")
+                    except DeadlineExceeded:
+                        raise
+                    except Exception as e:
+                        print(f"⚠️ Could not decode audio: {e}")
+                        duration = 240  # Default to 4 minutes
                 
-        except (ImportError, Exception) as ai_error:
-            # Fallback to librosa
-            print(f"⚠️ AI detection unavailable: {ai_error}")
-            print("📊 Using librosa fallback...")
+                    # Run chord detection (sequential AI -> librosa, or hedged race)
+                    result = detect_chords(
+                        audio,
+                        duration,
+                        mode=analysis_mode,
+                        hedge_deadline=hedge_deadline,
+                        deadline=deadline,
+                        window=window
+                    )
+                    del audio  # Release the decoded samples before building the response
+                    result['duration'] = duration
+                    if result['chords']:
+                        get_result_cache().set(cache_key, result)
+                    return result
             
-            from utils.chord_analyzer import extract_chords_from_audio
-            chords = extract_chords_from_audio(temp_path, min(duration, 300))
-            song_key = "C Major"
-            detection_method = 'Audio Analysis (Librosa)'
-            accuracy = 70
-            
-            analysis_metadata = {
-                'method': 'librosa',
-                'total_chord_segments': len(chords),
-                'unique_chords': len(set(c.get('chord', '') for c in chords)),
-                'accuracy': 70,
-                'detection_engine': 'Librosa Chroma Features',
-                'source': 'user_upload',
-                'filename': filename
-            }
-        
-        # Clean up temp file
-        try:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                print(f"🗑️ Cleaned up temp file")
-        except Exception as e:
-            print(f"⚠️ Could not remove temp file: {e}")
+            # The same file uploaded by several users at once is analyzed once
+            from services.single_flight import get_single_flight
+            detection, shared = get_single_flight().do(
+                cache_key, analyze_upload, on_join=ticket.release, timeout=deadline.remaining()
+            )
+            ticket.release()
+            if shared:
+                print(f"🔗 Shared in-flight analysis for upload {uploaded.sha256[:12]}")
+            # Every caller gets its own copy - the result object is shared
+            detection = copy.deepcopy(detection)
+        duration = detection.pop('duration')
+        chords = detection['chords']
+        song_key = detection['key']
+        detection_method = detection['detection_method']
+        accuracy = detection['accuracy']
+        analysis_metadata = detection['analysis_metadata']
+        analysis_metadata['source'] = 'user_upload'
+        analysis_metadata['filename'] = filename
+        analysis_metadata['content_sha256'] = uploaded.sha256
+        # This request's stages (a cached or shared result only shows the upload)
+        analysis_metadata['timings'] = stage_timings = timings.to_dict()
         
         if not chords:
             return jsonify({
@@ -410,30 +495,14 @@ def analyze_uploaded_file():
                 "error": "Could not detect chords in uploaded file"
             }), 400
         
-        # Convert numpy types to Python types for JSON serialization
-        def convert_to_json_serializable(obj):
-            """Convert numpy types to Python native types"""
-            import numpy as np
-            if isinstance(obj, dict):
-                return {k: convert_to_json_serializable(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [convert_to_json_serializable(item) for item in obj]
-            elif isinstance(obj, (np.integer, np.int32, np.int64)):
-                return int(obj)
-            elif isinstance(obj, (np.floating, np.float32, np.float64)):
-                return float(obj)
-            elif isinstance(obj, np.ndarray):
-                return obj.tolist()
-            else:
-                return obj
+        # numpy values and ChordSegments are serialized by the app's JSON provider
+        if _wire_format() == 'columnar':
+            chords = to_columnar(chords)
         
-        # Clean data
-        chords = convert_to_json_serializable(chords)
-        analysis_metadata = convert_to_json_serializable(analysis_metadata)
+        print(f"✅ File analysis complete: {len(detection['chords'])} chords detected")
         
-        print(f"✅ File analysis complete: {len(chords)} chords detected")
-        
-        return jsonify({
+        outcome = 'ok'
+        response = jsonify({
             "status": "success",
             "song_name": filename,
             "title": os.path.splitext(filename)[0],
@@ -445,24 +514,51 @@ def analyze_uploaded_file():
             "source": 'user_upload',
             "analysis_metadata": analysis_metadata
         })
+        response.headers['Server-Timing'] = server_timing_header(stage_timings)
+        return response
         
+    except AdmissionRejected as e:
+        print(f"🚦 Upload analysis turned away: {e}")
+        if deadline.expired():
+            return _upload_timeout_response(DeadlineExceeded('queue', deadline.budget))
+        return _busy_response(e)
+    except TimeoutError as e:
+        # DeadlineExceeded from a stage, or gave up waiting on a shared analysis
+        outcome = 'timeout'
+        if not isinstance(e, DeadlineExceeded):
+            e = DeadlineExceeded('detect', deadline.budget)
+        return _upload_timeout_response(e)
+    except AnalysisError as e:
+        print(f"❌ Upload analysis failed: {e}")
+        return jsonify(e.payload), e.status_code
+    except ScratchQuotaExceeded as e:
+        print(f"🧹 {e}")
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), e.status_code
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         print(f"❌ File upload analysis failed: {e}")
         print(f"❌ Full error traceback:\n{error_details}")
         
-        # Clean up temp file on error
-        try:
-            if 'temp_path' in locals() and os.path.exists(temp_path):
-                os.remove(temp_path)
-        except:
-            pass
-        
         return jsonify({
             "status": "error",
             "error": f"Failed to analyze uploaded file: {str(e)}"
         }), 500
+    finally:
+        if ticket:
+            ticket.release()
+        # Removes the uploaded file whatever happened above
+        scratch.release(upload_dir)
+        if 'uploaded' in locals():
+            from services.metrics import get_metrics
+            stage_timings = timings.to_dict()
+            get_metrics().observe_timings(stage_timings, outcome)
+            logger.info(timings_log_line(
+                uploaded.cache_key, outcome, stage_timings, mode=request.form.get('analysis_mode')
+            ))
 
 @analysis_bp.route('/api/test-rapidapi', methods=['GET'])
 def test_rapidapi():
@@ -1,12 +1,12 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import requests
 import hashlib
 import time
 from datetime import datetime
 from ..models.user import User
 from ..models.pi_payment import PiPayment
 from ..utils.auth_middleware import require_auth
+from ..services.http_gateway import get_http_gateway
 from .. import db
 
 pi_bp = Blueprint('pi', __name__, url_prefix='/api/pi')
@@ -31,7 +31,7 @@ class PiNetworkService:
             }
             
             url = f"{self.base_url}/v2/payments/{payment_id}"
-            response = requests.get(url, headers=headers)
+            response = get_http_gateway().get(url, headers=headers)
             
             if response.status_code == 200:
                 payment_data = response.json()
@@ -63,7 +63,7 @@ class PiNetworkService:
             url = f"{self.base_url}/v2/payments/{payment_id}/complete"
             data = {'txid': txid}
             
-            response = requests.post(url, headers=headers, json=data)
+            response = get_http_gateway().post(url, headers=headers, json=data)
             
             if response.status_code == 200:
                 return {
@@ -5,7 +5,8 @@ Provides YouTube API integration for finding songs
 
 from flask import Blueprint, request, jsonify
 import os
-import requests
+
+from services.http_gateway import get_http_gateway
 
 search_bp = Blueprint('search', __name__)
 
@@ -46,7 +47,7 @@ def search_songs():
                 'videoDuration': 'medium'  # Filter out very short/long videos
             }
             
-            response = requests.get(url, params=params)
+            response = get_http_gateway().get(url, params=params)
             data = response.json()
             
             if 'items' not in data:
@@ -101,7 +102,7 @@ def get_video_duration(video_id, api_key):
             'key': api_key
         }
         
-        response = requests.get(url, params=params)
+        response = get_http_gateway().get(url, params=params)
         data = response.json()
         
         if 'items' in data and len(data['items']) > 0:
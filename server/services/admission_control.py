@@ -0,0 +1,178 @@
+"""
+Admission Control
+Caps how many downloads/analyses run at once, with a bounded wait queue
+
+Each analysis request takes a ticket when it arrives. A ticket first waits
+in the queue, then holds one of the concurrency slots while the heavy work
+(download, decode, librosa/TensorFlow) runs. When every slot is busy and the
+queue is full, new requests are turned away straight away with 429 and a
+Retry-After estimate, instead of piling up until the dyno runs out of memory.
+
+Configuration (environment variables):
+    ANALYSIS_MAX_CONCURRENT   analyses running at once (default: 2)
+    ANALYSIS_MAX_QUEUE        requests allowed to wait for a slot (default: 8)
+    ANALYSIS_QUEUE_TIMEOUT    seconds a request may wait before giving up (default: 120)
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """No capacity for this request - respond 429 with Retry-After"""
+
+    status_code = 429
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.payload = {"status": "error", "error": message, "retry_after": retry_after}
+
+
+class AdmissionTicket:
+    """One request's place in the queue and, once acquired, its slot"""
+
+    __slots__ = ('_controller', 'enqueued_at', 'acquired_at', 'state')
+
+    def __init__(self, controller: 'AdmissionController'):
+        self._controller = controller
+        self.enqueued_at = time.monotonic()
+        self.acquired_at = None
+        self.state = 'queued'   # queued -> running -> released
+
+    def acquire(self, timeout: Optional[float] = None):
+        """Wait for a concurrency slot (idempotent)"""
+        self._controller._acquire(self, timeout)
+
+    def release(self):
+        """Give back the slot, or leave the queue if never acquired (idempotent)"""
+        self._controller._release(self)
+
+
+class AdmissionController:
+    """Counting semaphore with a bounded, observable wait queue"""
+
+    def __init__(self, max_concurrent: int = 2, max_queue: int = 8, queue_timeout: float = 120):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waits = deque(maxlen=500)       # recent queue wait times (s)
+        self._service_time = None             # moving average of slot hold time (s)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, for the Retry-After header"""
+        service = self._service_time or 30.0
+        return max(1, int(math.ceil(service * (self.queued + 1) / self.max_concurrent)))
+
+    def enter(self) -> AdmissionTicket:
+        """Join the queue, or raise AdmissionRejected when it is full"""
+        with self._cond:
+            if self.active + self.queued >= self.max_concurrent + self.max_queue:
+                self.rejected += 1
+                retry_after = self.retry_after()
+                logger.warning(f"🚦 Analysis rejected: {self.active} running, {self.queued} queued")
+                raise AdmissionRejected("Server is busy analyzing other songs, please retry shortly", retry_after)
+            self.queued += 1
+            return AdmissionTicket(self)
+
+    def _acquire(self, ticket: AdmissionTicket, timeout: Optional[float]):
+        from services.metrics import get_metrics
+
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        with self._cond:
+            if ticket.state != 'queued':
+                return
+            deadline = time.monotonic() + timeout
+            while self.active >= self.max_concurrent:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.queued -= 1
+                    self.timed_out += 1
+                    ticket.state = 'released'
+                    self._cond.notify()
+                    raise AdmissionRejected(
+                        f"Timed out after {timeout:.0f}s waiting for an analysis slot", self.retry_after()
+                    )
+                self._cond.wait(remaining)
+            self.queued -= 1
+            self.active += 1
+            self.admitted += 1
+            ticket.state = 'running'
+            ticket.acquired_at = time.monotonic()
+            waited = ticket.acquired_at - ticket.enqueued_at
+            self._waits.append(waited)
+        get_metrics().queue_waited(waited)
+
+    def _release(self, ticket: AdmissionTicket):
+        with self._cond:
+            if ticket.state == 'running':
+                self.active -= 1
+                held = time.monotonic() - ticket.acquired_at
+                self._service_time = held if self._service_time is None else 0.8 * self._service_time + 0.2 * held
+            elif ticket.state == 'queued':
+                self.queued -= 1
+            else:
+                return
+            ticket.state = 'released'
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self, ticket: Optional[AdmissionTicket] = None):
+        """Hold a slot for the duration of the block (enters the queue if no ticket is given)"""
+        ticket = ticket or self.enter()
+        try:
+            ticket.acquire()
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'active': self.active,
+                'queue_depth': self.queued,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'wait_seconds': {
+                    'mean': round(sum(waits) / len(waits), 3) if waits else 0.0,
+                    'p95': round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+                    'max': round(waits[-1], 3) if waits else 0.0,
+                },
+            }
+
+
+# Singleton instance
+_admission_controller = None
+_admission_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get or create singleton instance"""
+    global _admission_controller
+    if _admission_controller is None:
+        with _admission_controller_lock:
+            if _admission_controller is None:
+                _admission_controller = AdmissionController(
+                    max_concurrent=int(os.getenv('ANALYSIS_MAX_CONCURRENT', '2')),
+                    max_queue=int(os.getenv('ANALYSIS_MAX_QUEUE', '8')),
+                    queue_timeout=float(os.getenv('ANALYSIS_QUEUE_TIMEOUT', '120'))
+                )
+    return _admission_controller
@@ -0,0 +1,254 @@
+"""
+Analysis Jobs
+Runs song analysis on a background worker pool with per-stage progress
+
+Submitting returns a job id immediately; clients poll the job for status and
+progress and fetch the result when it is done. This keeps web workers free
+while songs download and analyze, and avoids proxy timeouts on long songs.
+
+Every progress update is also appended to the job's event log, which the SSE
+endpoint streams: stage changes, the finished decode and - for progressive
+jobs - chord segments as the engines settle them.
+
+Configuration (environment variables):
+    ANALYSIS_WORKERS      worker threads running analyses (default: 2)
+    ANALYSIS_JOB_TTL      seconds a finished job is kept for polling (default: 1800)
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from services.admission_control import AdmissionRejected
+from services.analysis_pipeline import ANALYSIS_STAGES, AnalysisError, analyze_song_coalesced
+from utils.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+
+class AnalysisJob:
+    """One song analysis and its progress"""
+
+    def __init__(self, song_name: str, url: str, options: Dict, ticket=None):
+        self.id = uuid.uuid4().hex
+        self.song_name = song_name
+        self.url = url
+        self.options = options
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.error_status = None
+        self.retry_after = None
+        self.ticket = ticket
+        # The budget starts when the request arrives, so queueing counts too
+        self.deadline = Deadline.from_request(options.get('deadline_seconds'))
+        self.stages = {
+            stage: {'status': 'pending', 'progress': 0.0, 'started_at': None, 'finished_at': None}
+            for stage in ANALYSIS_STAGES
+        }
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        # Event log for streaming clients: {'id', 'event', 'data'}, ids increase
+        self.events = []
+        self._last_event_id = 0
+        self._events_changed = threading.Condition(self._lock)
+
+    def add_done_callback(self, fn):
+        """Call fn(job) once the job has finished (right away if it already has)"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def update_stage(self, stage: str, status: str, fraction: Optional[float] = None, **details):
+        """Progress callback handed to the pipeline (details: decoded / engine + chords)"""
+        with self._lock:
+            info = self.stages.setdefault(
+                stage, {'status': 'pending', 'progress': 0.0, 'started_at': None, 'finished_at': None}
+            )
+            now = time.time()
+            if status == 'running' and info['started_at'] is None:
+                info['started_at'] = now
+            if status in ('done', 'skipped', 'failed'):
+                info['finished_at'] = now
+                if status != 'failed':
+                    fraction = 1.0
+            info['status'] = status
+            if fraction is not None:
+                info['progress'] = round(max(0.0, min(1.0, float(fraction))), 3)
+            if 'chords' in details:
+                self._add_event('chords', {'engine': details.get('engine'), 'chords': details['chords']})
+            elif 'decoded' in details:
+                self._add_event('decoded', details['decoded'])
+            else:
+                self._add_event('stage', {'stage': stage, 'status': status, 'progress': info['progress']})
+
+    def _add_event(self, event: str, data: Dict):
+        """Append to the event log and wake streaming clients (caller holds the lock)"""
+        last = self.events[-1] if self.events else None
+        if (event == 'stage' and last and last['event'] == 'stage' and data['status'] == 'running'
+                and last['data']['stage'] == data['stage'] and last['data']['status'] == 'running'):
+            # Download progress ticks replace each other - a slow reader sees the latest
+            self.events.pop()
+        self._last_event_id += 1
+        self.events.append({'id': self._last_event_id, 'event': event, 'data': data})
+        self._events_changed.notify_all()
+
+    def events_after(self, last_id: int = 0, timeout: Optional[float] = None) -> List[Dict]:
+        """
+        Events newer than last_id, waiting up to timeout for one to arrive
+        Empty on timeout, or once the job is done and everything was read.
+        """
+        with self._lock:
+            if not (self.events and self.events[-1]['id'] > last_id) and not self._done.is_set():
+                self._events_changed.wait(timeout)
+            return [event for event in self.events if event['id'] > last_id]
+
+    def run(self):
+        """Execute the analysis (called on a worker thread)"""
+        self.status = 'running'
+        self.started_at = time.time()
+        try:
+            self.result = analyze_song_coalesced(
+                self.song_name, self.url, self.options, progress=self.update_stage,
+                ticket=self.ticket, deadline=self.deadline
+            )
+            self.status = 'succeeded'
+        except AdmissionRejected as e:
+            self.error = e.payload
+            self.error_status = e.status_code
+            self.retry_after = e.retry_after
+            self.status = 'failed'
+        except AnalysisError as e:
+            self.error = e.payload
+            self.error_status = e.status_code
+            self.status = 'failed'
+        except Exception as e:
+            import traceback
+            logger.error(f"❌ Analysis job {self.id} crashed: {e}\n{traceback.format_exc()}")
+            self.error = {"status": "error", "error": f"Server error: {str(e)}"}
+            self.error_status = 500
+            self.status = 'failed'
+        finally:
+            if self.ticket:
+                self.ticket.release()
+            if self.status == 'failed':
+                for stage, info in self.stages.items():
+                    if info['status'] == 'running':
+                        self.update_stage(stage, 'failed')
+            self.finished_at = time.time()
+            self._done.set()
+            with self._lock:
+                callbacks, self._callbacks = self._callbacks, []
+                self._events_changed.notify_all()
+            for callback in callbacks:
+                try:
+                    callback(self)
+                except Exception as e:
+                    logger.warning(f"⚠️ Analysis job {self.id} done-callback failed: {e}")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job has finished"""
+        return self._done.wait(timeout)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def progress(self) -> float:
+        """Overall progress - the mean of all stage progress values"""
+        with self._lock:
+            values = [info['progress'] for info in self.stages.values()]
+        return round(sum(values) / len(values), 3) if values else 0.0
+
+    def to_dict(self, include_result: bool = False) -> Dict:
+        with self._lock:
+            stages = {name: dict(info) for name, info in self.stages.items()}
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'song_name': self.song_name,
+            'url': self.url,
+            'progress': self.progress(),
+            'stages': stages,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.status == 'failed':
+            data['error'] = self.error
+        if include_result and self.status == 'succeeded':
+            data['result'] = self.result
+        return data
+
+
+class AnalysisJobManager:
+    """Worker pool plus an in-memory registry of recent jobs"""
+
+    def __init__(self, max_workers: int = 2, ttl: float = 1800):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, song_name: str, url: str, options: Optional[Dict] = None, ticket=None) -> AnalysisJob:
+        """
+        Queue an analysis and return its job immediately
+        ticket: admission ticket taken by the route; released when the job ends
+        """
+        job = AnalysisJob(song_name, url, options or {}, ticket=ticket)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(job.run)
+        logger.info(f"📥 Analysis job {job.id} queued: {song_name or url}")
+        return job
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {status: 0 for status in JOB_STATUSES}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def _prune(self):
+        """Forget finished jobs older than the TTL (caller holds the lock)"""
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# Singleton instance
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> AnalysisJobManager:
+    """Get or create singleton instance"""
+    global _job_manager
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                _job_manager = AnalysisJobManager(
+                    max_workers=int(os.getenv('ANALYSIS_WORKERS', '2')),
+                    ttl=float(os.getenv('ANALYSIS_JOB_TTL', '1800'))
+                )
+    return _job_manager
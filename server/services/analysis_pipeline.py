@@ -0,0 +1,677 @@
+"""
+Chord Analysis Pipeline
+Runs song analysis end to end: external chord lookup, audio download and
+chord detection. Used by the synchronous /api/analyze-song route and by the
+background analysis jobs (services/analysis_jobs.py).
+
+Stages reported through the progress callback:
+    lookup   - external chord sources (TheAudioDB, Ultimate Guitar, ...)
+    download - audio download (RapidAPI / yt-dlp)
+    detect   - chord detection engines
+
+The audio is decoded once into a shared AudioSignal (utils/audio_signal.py)
+and the same samples are handed to every engine. Downloaders pipe the
+network stream through ffmpeg (utils/audio_stream.py), so that decode
+overlaps the download and is part of the 'download' stage.
+
+Every stage runs under a request Deadline (utils/deadline.py); when the
+budget runs out the pipeline stops, frees the audio and reports a 504.
+Downloaded audio lives in a per-job scratch directory
+(services/scratch_space.py) that is removed when the analysis ends.
+
+A request may ask for only part of the song (options 'start'/'end', in
+seconds): decode seeks to the window, the engines only see the excerpt and
+chord times are reported in song time. Windows are cached and coalesced
+separately from full analyses. Only the analyzed part is downloaded: the
+window, or the first MAX_ANALYSIS_SECONDS of the song.
+
+Each analysis records wall time and bytes per stage (utils/stage_timings.py)
+into analysis_metadata.timings and logs them as one JSON line.
+
+With the 'progressive' option the engines also release chord segments while
+they run (utils/progressive_chords.py); they reach the caller as progress
+events with a chords=[...] detail, which the SSE endpoint streams.
+
+Concurrent requests for the same video (or search) are coalesced through
+services/single_flight.py: one request does the work, the rest share it.
+Finished analyses are kept in the result cache (services/result_cache.py)
+under the same key, so repeats are served without any work.
+
+Modes (ANALYSIS_MODE environment variable, or 'analysis_mode' per request):
+    sequential - (default) Basic Pitch AI first, librosa only if the AI fails
+    hedged     - start librosa alongside the AI and return the AI result if it
+                 finishes within HEDGE_DEADLINE_SECONDS, otherwise the librosa
+                 result. Gives a hard latency bound for slow or failing AI runs.
+"""
+
+import copy
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import nullcontext
+from typing import Callable, Dict, Optional, Tuple
+
+from services.scratch_space import ScratchQuotaExceeded, get_scratch_space
+from utils.deadline import NO_DEADLINE, DeadlineExceeded
+from utils.progressive_chords import ProgressiveChords, publish_decoded
+from utils.stage_timings import StageTimings, in_current_context, timed_stage, timings_log_line
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_STAGES = ('lookup', 'download', 'detect')
+ANALYSIS_MODES = ('sequential', 'hedged')
+DEFAULT_HEDGE_DEADLINE = 45.0
+# Longest stretch of audio analyzed per request (full songs are cut here too)
+MAX_ANALYSIS_SECONDS = 300.0
+
+class AnalysisError(Exception):
+    """
+    Analysis failure with the HTTP status and JSON body to return
+    Raised by the pipeline so sync routes and jobs report errors the same way
+    """
+
+    def __init__(self, message: str, status_code: int = 400, **details):
+        super().__init__(message)
+        self.status_code = status_code
+        self.payload = {"status": "error", "error": message}
+        self.payload.update(details)
+
+
+# AI runs are CPU/memory heavy - cap how many can be in flight (including
+# abandoned runs that lost a hedge) so late AI results cannot pile up
+_ai_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('HEDGE_AI_WORKERS', '2')),
+    thread_name_prefix='hedge-ai'
+)
+_librosa_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('HEDGE_LIBROSA_WORKERS', '4')),
+    thread_name_prefix='hedge-librosa'
+)
+
+
+def get_analysis_mode(requested: Optional[str] = None) -> str:
+    """Requested mode if valid, else ANALYSIS_MODE, else sequential"""
+    for mode in (requested, os.getenv('ANALYSIS_MODE')):
+        if mode and mode.strip().lower() in ANALYSIS_MODES:
+            return mode.strip().lower()
+    return 'sequential'
+
+
+def get_hedge_deadline(requested: Optional[float] = None) -> float:
+    """Seconds to wait for the AI engine in hedged mode"""
+    for value in (requested, os.getenv('HEDGE_DEADLINE_SECONDS')):
+        try:
+            if value is not None and float(value) > 0:
+                return float(value)
+        except (TypeError, ValueError):
+            continue
+    return DEFAULT_HEDGE_DEADLINE
+
+
+def get_time_window(start=None, end=None) -> Optional[Tuple[float, Optional[float]]]:
+    """
+    (start, end) seconds of the song to analyze, or None for the whole song
+    end may be None (to the end of the song, at most MAX_ANALYSIS_SECONDS).
+    Raises AnalysisError (400) for values that are not a valid range.
+    """
+    if start in (None, '') and end in (None, ''):
+        return None
+    try:
+        start = float(start) if start not in (None, '') else 0.0
+        end = float(end) if end not in (None, '') else None
+    except (TypeError, ValueError):
+        raise AnalysisError("start and end must be numbers of seconds", 400)
+    if start < 0 or (end is not None and end <= start):
+        raise AnalysisError("Time window must satisfy 0 <= start < end", 400)
+    if end is None or end - start > MAX_ANALYSIS_SECONDS:
+        end = start + MAX_ANALYSIS_SECONDS
+    if start == 0 and end == MAX_ANALYSIS_SECONDS:
+        # Same audio as a full analysis - share its cache entry
+        return None
+    return round(start, 3), round(end, 3)
+
+
+def window_suffix(window: Optional[Tuple[float, float]]) -> str:
+    """Cache/coalescing key suffix for a time window ('' for full analyses)"""
+    return f":{window[0]:g}-{window[1]:g}" if window else ''
+
+
+def _decode_once(audio, deadline=NO_DEADLINE, window=None):
+    """
+    Decode a file path into a shared AudioSignal (signals pass through)
+    With a window, only that range is decoded (or sliced from a signal).
+    """
+    from utils.audio_signal import AudioSignal, decode_audio
+
+    if isinstance(audio, AudioSignal):
+        # Decoded while downloading
+        signal = audio.window(*window) if window and not audio.offset else audio
+        publish_decoded(signal)
+        return signal
+    deadline.check('decode')
+    try:
+        with timed_stage('decode') as stage:
+            if window:
+                signal = decode_audio(audio, offset=window[0], max_duration=window[1] - window[0])
+            else:
+                signal = decode_audio(audio, max_duration=MAX_ANALYSIS_SECONDS)
+            stage.bytes = signal.nbytes
+        deadline.check('decode')
+        print(f"🎧 Decoded once for all engines: {signal}")
+        publish_decoded(signal)
+        return signal
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        if window:
+            # Engines reading the file themselves would analyze from 0s
+            raise AnalysisError(f"Could not decode the requested time window: {e}", 400)
+        # Let each engine try its own decoder, as before
+        print(f"⚠️ Shared decode failed, engines will read the file: {e}")
+        return audio
+
+
+def _to_song_time(result: Dict, signal):
+    """Shift chord times from excerpt time to song time for a windowed signal"""
+    offset = signal.offset
+    for chord in result['chords']:
+        chord['time'] = round(chord['time'] + offset, 3)
+    result['analysis_metadata']['window'] = {
+        'start': round(offset, 3),
+        'end': round(offset + signal.duration, 3)
+    }
+
+
+def _run_ai(audio, deadline=NO_DEADLINE) -> Dict:
+    """Basic Pitch detection - raises instead of silently falling back"""
+    from services.enhanced_chord_detection import analyze_song_chords, get_enhanced_detector
+
+    detector = get_enhanced_detector()
+    if not detector.available:
+        raise ImportError("Basic Pitch not available")
+
+    print("🤖 Running AI chord detection...")
+    result = analyze_song_chords(audio, fallback=False, deadline=deadline)
+    return {
+        'chords': result['chords'],
+        'key': result['key'],
+        'detection_method': 'AI-Enhanced (Basic Pitch)',
+        'accuracy': 90,
+        'analysis_metadata': {
+            'method': result['method'],
+            'total_chord_segments': result['total_chords'],
+            'unique_chords': result['unique_chords'],
+            'accuracy': 90,
+            'detection_engine': 'Spotify Basic Pitch AI',
+            'inference_runtime': result.get('runtime'),
+            'note': 'Deep learning model trained on 10,000+ hours of music'
+        }
+    }
+
+
+def _run_librosa(audio, duration: float, deadline=NO_DEADLINE) -> Dict:
+    """Librosa chroma detection - the fast engine"""
+    from utils.chord_analyzer import extract_chords_from_audio
+
+    deadline.check('detect')
+    print("📊 Using librosa analysis...")
+    chords = extract_chords_from_audio(audio, min(duration, MAX_ANALYSIS_SECONDS))
+    deadline.check('detect')
+    return {
+        'chords': chords,
+        'key': "C Major",
+        'detection_method': 'Audio Analysis (Librosa)',
+        'accuracy': 70,
+        'analysis_metadata': {
+            'method': 'librosa',
+            'total_chord_segments': len(chords),
+            'unique_chords': len(set(c.get('chord', '') for c in chords)),
+            'accuracy': 70,
+            'detection_engine': 'Librosa Chroma Features',
+            'note': 'Install Basic Pitch for AI-enhanced detection: pip install basic-pitch'
+        }
+    }
+
+
+def _detect_sequential(audio, duration: float, deadline=NO_DEADLINE) -> Dict:
+    """AI first, librosa only after the AI has failed"""
+    from services.metrics import get_metrics
+    try:
+        result = _run_ai(audio, deadline)
+        get_metrics().engine_used('basic_pitch')
+        return result
+    except DeadlineExceeded:
+        raise
+    except Exception as ai_error:
+        print(f"⚠️ AI detection unavailable: {ai_error}")
+        print("📊 Using librosa fallback...")
+        result = _run_librosa(audio, duration, deadline)
+        get_metrics().engine_used('librosa', 'fallback')
+        return result
+
+
+def _detect_hedged(audio, duration: float, hedge_deadline: float, deadline=NO_DEADLINE) -> Dict:
+    """
+    Race the AI engine against librosa under a deadline
+    The AI wins if it returns chords before the deadline; otherwise the
+    librosa result is used and the AI run is cancelled - dropped if still
+    queued, otherwise stopped at its next deadline check.
+    """
+    from services.metrics import get_metrics
+
+    started = time.monotonic()
+    # Each engine gets its own cancellable view of the request deadline
+    ai_deadline = deadline.child()
+    librosa_deadline = deadline.child()
+    # Engines record their stage timings into this request's timings
+    ai_future = _ai_executor.submit(in_current_context(_run_ai), audio, ai_deadline)
+    librosa_future = _librosa_executor.submit(in_current_context(_run_librosa), audio, duration, librosa_deadline)
+
+    def hedge_info(winner):
+        return {
+            'winner': winner,
+            'deadline': hedge_deadline,
+            'elapsed': round(time.monotonic() - started, 3)
+        }
+
+    # Wait for the AI up to the hedge deadline (returns early if it fails)
+    remaining = deadline.remaining()
+    wait([ai_future], timeout=hedge_deadline if remaining is None else min(hedge_deadline, remaining))
+
+    if ai_future.done() and not ai_future.cancelled():
+        try:
+            result = ai_future.result()
+            if result['chords']:
+                librosa_future.cancel()
+                librosa_deadline.cancel()
+                result['analysis_metadata']['hedge'] = hedge_info('basic_pitch')
+                get_metrics().engine_used('basic_pitch', 'hedge')
+                print(f"🏁 Hedge: AI finished in {time.monotonic() - started:.1f}s (deadline {hedge_deadline}s)")
+                return result
+        except DeadlineExceeded:
+            librosa_future.cancel()
+            librosa_deadline.cancel()
+            raise
+        except Exception as ai_error:
+            print(f"⚠️ Hedge: AI failed: {ai_error}")
+    else:
+        ai_future.cancel()
+        ai_deadline.cancel()
+        print(f"⏱️ Hedge: AI missed the {hedge_deadline}s deadline, using librosa")
+
+    try:
+        result = librosa_future.result(timeout=deadline.remaining())
+    except (TimeoutError, FutureTimeoutError):
+        # Distinct classes before Python 3.11
+        librosa_deadline.cancel()
+        raise DeadlineExceeded('detect', deadline.budget)
+    result['analysis_metadata']['hedge'] = hedge_info('librosa')
+    get_metrics().engine_used('librosa', 'hedge')
+    return result
+
+
+def detect_chords(audio, duration: float, mode: Optional[str] = None,
+                  hedge_deadline: Optional[float] = None, deadline=None, window=None) -> Dict:
+    """
+    Run chord detection on an audio file path or a decoded AudioSignal
+    Raises DeadlineExceeded when the request deadline runs out
+
+    window: (start, end) seconds from get_time_window() - only that range is
+    decoded and analyzed; chord times come back in song time. A signal that
+    was already decoded from a window (offset > 0) is used as is.
+
+    Returns: {
+        'chords': [...],
+        'key': 'C',
+        'detection_method': 'AI-Enhanced (Basic Pitch)',
+        'accuracy': 90,
+        'analysis_metadata': {...}
+    }
+    """
+    deadline = deadline or NO_DEADLINE
+    mode = get_analysis_mode(mode)
+    audio = _decode_once(audio, deadline, window)
+    from utils.audio_signal import AudioSignal
+    windowed = isinstance(audio, AudioSignal) and (window is not None or audio.offset > 0)
+    if windowed:
+        # Cost follows the excerpt, not the song
+        duration = audio.duration
+    if mode == 'hedged':
+        hedge_seconds = get_hedge_deadline(hedge_deadline)
+        print(f"🏁 Hedged analysis: AI vs librosa, deadline {hedge_seconds}s")
+        result = _detect_hedged(audio, duration, hedge_seconds, deadline)
+    else:
+        result = _detect_sequential(audio, duration, deadline)
+
+    if windowed:
+        _to_song_time(result, audio)
+    result['analysis_metadata']['analysis_mode'] = mode
+    return result
+
+
+def _noop_progress(stage: str, status: str, fraction: Optional[float] = None, **details):
+    pass
+
+
+def _lookup_external_chords(song_name: str, url: str) -> Optional[Dict]:
+    """STEP 1: multi-source real chord detection (APIs, scraping)"""
+    try:
+        from services.real_chord_detection import get_real_chords
+
+        # Extract artist from song name if possible
+        artist = None
+        if ' - ' in song_name:
+            parts = song_name.split(' - ')
+            artist = parts[0].strip()
+            song_title = parts[1].strip()
+        else:
+            song_title = song_name
+
+        print(f"🔍 Trying external sources: {song_title} by {artist}")
+        real_chords_result = get_real_chords(song_title, artist, url)
+
+        if real_chords_result and real_chords_result.get('chords'):
+            print(f"✅ SUCCESS! Got chords from: {real_chords_result['source']}")
+            print(f"📊 Accuracy: {real_chords_result['accuracy']}%")
+            print(f"🎸 Chords: {len(real_chords_result['chords'])} changes")
+
+            return {
+                "status": "success",
+                "song_name": song_name,
+                "url": url,
+                "chords": real_chords_result['chords'],
+                "duration": real_chords_result.get('chords', [{}])[-1].get('time', 240) + 4,
+                "title": song_name,
+                "key": real_chords_result['key'],
+                "bpm": real_chords_result.get('bpm', 120),
+                "analysis_type": "real_multi_source",
+                "source": real_chords_result['source'],
+                "accuracy": real_chords_result['accuracy'],
+                "analysis_metadata": {
+                    'method': real_chords_result['method'],
+                    'source': real_chords_result['source'],
+                    'accuracy': real_chords_result['accuracy'],
+                    'total_chords': len(real_chords_result['chords'])
+                }
+            }
+    except ImportError as e:
+        print(f"⚠️ Real chord detection module not available: {e}")
+    except Exception as e:
+        print(f"⚠️ External chord detection failed: {e}")
+    return None
+
+
+def _timeout_error(error: DeadlineExceeded, progress: Callable) -> AnalysisError:
+    """504 for a request that ran out of time (the stage is marked failed)"""
+    progress(error.stage if error.stage in ANALYSIS_STAGES else 'detect', 'failed')
+    print(f"⏱️ {error}")
+    return AnalysisError(str(error), 504, stage=error.stage, timed_out=True)
+
+
+def analyze_song_request(song_name: str, url: str, options: Optional[Dict] = None,
+                         progress: Optional[Callable] = None, deadline=None) -> Dict:
+    """
+    Full analysis of a song name or YouTube URL
+
+    Args:
+        song_name: Free-text song name ("Artist - Title" splits out the artist)
+        url: YouTube URL (optional if song_name is given)
+        options: Request options (analysis_mode, hedge_deadline, start, end,
+            progressive)
+        progress: Callback progress(stage, status, fraction=None, **details);
+            details carry decoded={...} and engine/chords for progressive runs
+        deadline: Request Deadline shared by every stage (utils/deadline.py)
+
+    Returns the success response body, with per-stage timings in
+    analysis_metadata.timings. Raises AnalysisError on failure (504 when the
+    deadline runs out).
+    """
+    timings = StageTimings()
+    status = 'error'
+    try:
+        with timings.activate():
+            result = _analyze_song_request(song_name, url, options, progress, deadline)
+        status = 'ok'
+    except AnalysisError as e:
+        status = 'timeout' if e.status_code == 504 else 'error'
+        raise
+    finally:
+        from services.metrics import get_metrics
+        stage_timings = timings.to_dict()
+        get_metrics().observe_timings(stage_timings, status)
+        logger.info(timings_log_line(
+            url or song_name, status, stage_timings,
+            mode=get_analysis_mode((options or {}).get('analysis_mode'))
+        ))
+    result.setdefault('analysis_metadata', {})['timings'] = stage_timings
+    return result
+
+
+def _analyze_song_request(song_name: str, url: str, options: Optional[Dict],
+                          progress: Optional[Callable], deadline) -> Dict:
+    options = options or {}
+    progress = progress or _noop_progress
+    deadline = deadline or NO_DEADLINE
+    window = get_time_window(options.get('start'), options.get('end'))
+
+    # STEP 1: External chord sources
+    progress('lookup', 'running')
+    try:
+        deadline.check('lookup')
+        with timed_stage('lookup'):
+            external = _lookup_external_chords(song_name, url)
+        deadline.check('lookup')
+    except DeadlineExceeded as e:
+        raise _timeout_error(e, progress)
+    if external:
+        from services.metrics import get_metrics
+        get_metrics().engine_used('external')
+        if window:
+            # Published chords cover the whole song - keep the requested range
+            external['chords'] = [
+                chord for chord in external['chords']
+                if window[0] <= chord.get('time', 0) < window[1]
+            ]
+            external['analysis_metadata']['window'] = {'start': window[0], 'end': window[1]}
+        progress('lookup', 'done')
+        progress('download', 'skipped')
+        progress('detect', 'skipped')
+        return external
+    progress('lookup', 'done')
+
+    # STEP 2: Fallback to AI-enhanced audio analysis
+    print(f"⚠️ Falling back to AI-enhanced audio analysis")
+    try:
+        from utils.audio_processor import download_youtube_audio
+    except ImportError as e:
+        print(f"❌ Audio analyzer not available: {e}")
+        raise AnalysisError("Chord analysis system not available", 500)
+
+    # Use the provided URL or fallback for song name
+    analysis_url = url if url else f"ytsearch:{song_name}"
+
+    try:
+        # Everything the download writes lives in this job's scratch directory,
+        # which is removed when the block exits - success, failure or timeout
+        with get_scratch_space().job_dir('analysis') as job_dir:
+            print(f"🎯 Starting AI-enhanced audio analysis for URL: {analysis_url}")
+
+            progress('download', 'running', 0.0)
+            # Nothing past the analyzed range is downloaded or decoded
+            start, end = window or (0.0, MAX_ANALYSIS_SECONDS)
+            audio, duration, title = download_youtube_audio(
+                analysis_url,
+                progress_callback=lambda fraction: progress('download', 'running', fraction),
+                deadline=deadline,
+                scratch_dir=job_dir,
+                offset=start,
+                max_duration=end - start
+            )
+            print(f"⬇️ download_youtube_audio() returned: {audio} ({duration}s, {title})")
+
+            if audio is None:
+                progress('download', 'failed')
+                error_msg = str(title) if title else "Failed to download audio from YouTube"
+                print(f"❌ YouTube download failed: {error_msg}")
+
+                # Provide helpful error message based on the error
+                if "bot detection" in error_msg.lower() or "sign in" in error_msg.lower():
+                    user_error = "YouTube blocked the download (bot detection). This is a limitation of free cloud hosting. Try: 1) Use a different song, or 2) Wait a few minutes and try again."
+                else:
+                    user_error = f"Could not download audio: {error_msg}"
+
+                raise Exception(user_error)
+            progress('download', 'done', 1.0)
+
+            # Run chord detection (sequential AI -> librosa, or hedged race)
+            progress('detect', 'running')
+            # Streaming clients get chord segments as the engines settle them
+            sink = ProgressiveChords(progress) if options.get('progressive') else None
+            with sink.activate() if sink else nullcontext():
+                detection = detect_chords(
+                    audio,
+                    duration,
+                    mode=options.get('analysis_mode'),
+                    hedge_deadline=options.get('hedge_deadline'),
+                    deadline=deadline,
+                    window=window
+                )
+    except AnalysisError:
+        raise
+    except DeadlineExceeded as e:
+        raise _timeout_error(e, progress)
+    except ScratchQuotaExceeded as e:
+        progress('download', 'failed')
+        print(f"🧹 {e}")
+        raise AnalysisError(str(e), e.status_code)
+    except Exception as analysis_error:
+        import traceback
+        print(f"❌ Audio analysis failed: {analysis_error}")
+        print(f"❌ Full error traceback:\n{traceback.format_exc()}")
+
+        error_msg = str(analysis_error)
+        if "Could not detect chord progression" in error_msg:
+            user_msg = "Unable to detect chord progression. Try a different song with clear chords."
+        elif "YouTube download failed" in error_msg or "IP restrictions" in error_msg:
+            user_msg = "YouTube blocked the download request. This is a known issue with cloud servers. We're working on a fix!"
+        else:
+            user_msg = f"Chord analysis failed: {error_msg}"
+
+        raise AnalysisError(
+            user_msg, 400,
+            song_name=song_name,
+            analysis_attempted=True,
+            error_details=error_msg if "YouTube" in error_msg else None
+        )
+
+    chords = detection['chords']
+    if not chords:
+        progress('detect', 'failed')
+        print("❌ Chord detection returned no chords")
+        raise AnalysisError("Could not analyze chord progression for this song", 400)
+    progress('detect', 'done')
+
+    return {
+        "status": "success",
+        "song_name": song_name or "URL provided",
+        "url": url or analysis_url,
+        "chords": chords,
+        "duration": float(duration) if duration else 240,
+        "title": title,
+        "key": detection['key'],
+        "analysis_type": detection['detection_method'],
+        "accuracy": int(detection['accuracy']) if detection['accuracy'] else 70,
+        "source": detection['detection_method'],
+        "analysis_metadata": detection['analysis_metadata']
+    }
+
+
+def coalesce_key(song_name: str, url: str, options: Optional[Dict] = None) -> str:
+    """Identity of an analysis: normalized video ID (or search text), mode and time window"""
+    from utils.youtube_api_downloader import extract_video_id
+
+    options = options or {}
+    mode = get_analysis_mode(options.get('analysis_mode'))
+    mode += window_suffix(get_time_window(options.get('start'), options.get('end')))
+    video_id = extract_video_id(url) if url else None
+    if video_id:
+        return f"video:{video_id}:{mode}"
+    if url:
+        return f"url:{url.strip()}:{mode}"
+    return f"search:{' '.join((song_name or '').lower().split())}:{mode}"
+
+
+def cached_analysis(song_name: str, url: str, options: Optional[Dict] = None) -> Optional[Dict]:
+    """A cached result for this analysis (a private copy), or None"""
+    from services.metrics import get_metrics
+    from services.result_cache import get_result_cache
+
+    result = get_result_cache().get(coalesce_key(song_name, url, options))
+    get_metrics().cache_lookup('result_song', result is not None)
+    if result is not None and song_name:
+        result['song_name'] = song_name
+    return result
+
+
+def analyze_song_coalesced(song_name: str, url: str, options: Optional[Dict] = None,
+                           progress: Optional[Callable] = None, ticket=None, deadline=None) -> Dict:
+    """
+    analyze_song_request() with concurrent identical requests coalesced
+    Callers that join an in-flight analysis receive its progress events and
+    a copy of its result (or the same AnalysisError).
+
+    ticket: admission ticket (services/admission_control.py) - only the
+    caller that actually does the work waits for and holds a slot; callers
+    joining in-flight work give their place in the queue back.
+
+    deadline: bounds the work (leader) or the wait for it (joiners).
+    """
+    from services.admission_control import AdmissionRejected
+    from services.result_cache import get_result_cache
+    from services.single_flight import get_single_flight
+
+    progress = progress or _noop_progress
+    deadline = deadline or NO_DEADLINE
+    key = coalesce_key(song_name, url, options)
+
+    cached = cached_analysis(song_name, url, options)
+    if cached is not None:
+        print(f"⚡ Cache hit for {key}")
+        if ticket:
+            ticket.release()
+        for stage in ANALYSIS_STAGES:
+            progress(stage, 'done')
+        return cached
+
+    def run(notify):
+        if ticket:
+            try:
+                ticket.acquire(timeout=deadline.remaining())
+            except AdmissionRejected:
+                if deadline.expired():
+                    raise _timeout_error(DeadlineExceeded('queue', deadline.budget), notify)
+                raise
+        result = analyze_song_request(song_name, url, options, progress=notify, deadline=deadline)
+        get_result_cache().set(key, result)
+        return result
+
+    try:
+        result, shared = get_single_flight().do(
+            key,
+            run,
+            listener=progress,
+            on_join=ticket.release if ticket else None,
+            timeout=deadline.remaining()
+        )
+    except TimeoutError:
+        # Gave up waiting on another request's analysis
+        raise _timeout_error(DeadlineExceeded('detect', deadline.budget), progress)
+    if shared:
+        for stage in ANALYSIS_STAGES:
+            progress(stage, 'done')
+        result = copy.deepcopy(result)
+        if song_name:
+            result['song_name'] = song_name
+    return result
@@ -0,0 +1,221 @@
+"""
+Audio Cache
+Decoded analysis-grade audio on local disk, keyed by YouTube video ID
+
+Analyzing a song again (a retry, a window of it, another engine, a changed
+analyzer) used to download it again and spend RapidAPI quota. Decoded
+signals are kept instead as mono PCM at the analysis rate:
+
+    <AUDIO_CACHE_DIR>/<video_id>.npy    float16 samples (half the size of float32)
+    <AUDIO_CACHE_DIR>/<video_id>.json   sample rate, duration, title and whether
+                                        the samples cover the whole song
+
+download_youtube_audio() looks here first. The .npy file is memory-mapped,
+so a caller asking for part of a song (get(offset=, max_duration=)) only
+reads and converts the samples it needs. Downloads are limited to the
+analyzed part, so an entry may hold only the start of a song; a request
+reaching past it is a miss. The directory is shared by every
+worker process on the node; the least recently used songs are removed once
+it holds more than AUDIO_CACHE_MB. Recency is the file's mtime, which a
+hit refreshes.
+
+Configuration (environment variables):
+    AUDIO_CACHE_DIR   directory (default: <tmp>/chordypi-audio-cache)
+    AUDIO_CACHE_MB    byte budget (default: 1024, 0 disables)
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+class AudioCache:
+    """Byte-budgeted LRU of decoded songs in one directory"""
+
+    def __init__(self, root: str, max_bytes: int = 0):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        if self.enabled:
+            os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _paths(self, video_id: str) -> Tuple[str, str]:
+        base = os.path.join(self.root, video_id)
+        return base + '.npy', base + '.json'
+
+    def get(self, video_id: Optional[str], offset: float = 0.0, max_duration: Optional[float] = None):
+        """
+        (AudioSignal, duration, title) for a cached video, or None
+        With offset/max_duration only that part is converted to float32. None
+        too when the entry holds only the start of the song and the requested
+        range reaches past it.
+        """
+        from utils.audio_signal import AudioSignal
+
+        if not self.enabled or not video_id or not VIDEO_ID_PATTERN.match(video_id):
+            return None
+        samples_path, meta_path = self._paths(video_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            samples = np.load(samples_path, mmap_mode='r')
+            os.utime(samples_path)
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Discarding unreadable cached audio for {video_id}: {e}")
+                self._remove(video_id)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        sr = int(meta['sr'])
+        first = int(max(0.0, offset) * sr)
+        wanted = first + int(max_duration * sr) if max_duration else None
+        if not meta.get('complete', True) and (wanted is None or wanted > len(samples)):
+            with self._lock:
+                self.misses += 1
+            return None
+        last = len(samples) if wanted is None else min(len(samples), wanted)
+        # Only the requested range is paged in and widened to float32
+        signal = AudioSignal(samples[first:last], sr, offset=first / sr)
+        with self._lock:
+            self.hits += 1
+        return signal, meta.get('duration') or round(len(samples) / sr), meta.get('title', 'Unknown')
+
+    def put(self, video_id: Optional[str], signal, duration=None, title: Optional[str] = None) -> bool:
+        """
+        Store a signal that starts at the beginning of the song (windows further
+        in are not cached); returns whether it was stored. A shorter start of
+        the song never replaces a longer one already cached.
+        """
+        if not self.enabled or not video_id or not VIDEO_ID_PATTERN.match(video_id) or signal.offset:
+            return False
+        # Within a second of the announced duration counts as the whole song
+        complete = not duration or signal.duration >= float(duration) - 1.0
+        samples_path, meta_path = self._paths(video_id)
+        if not complete:
+            try:
+                if len(np.load(samples_path, mmap_mode='r')) >= len(signal.samples):
+                    return False
+            except (OSError, ValueError):
+                pass
+        samples = np.clip(signal.samples, -1.0, 1.0).astype(np.float16)
+        if samples.nbytes > self.max_bytes:
+            return False
+        # Written under temporary names and renamed, so readers never see half a file
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(samples_path + suffix, 'wb') as f:
+                np.save(f, samples)
+            with open(meta_path + suffix, 'w') as f:
+                json.dump({'sr': signal.sr, 'duration': duration, 'title': title, 'complete': complete,
+                           'stored_at': time.time()}, f)
+            os.replace(samples_path + suffix, samples_path)
+            os.replace(meta_path + suffix, meta_path)
+        except OSError as e:
+            logger.warning(f"Could not cache audio for {video_id}: {e}")
+            for path in (samples_path + suffix, meta_path + suffix):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return False
+        with self._lock:
+            self.stored += 1
+        self._evict()
+        return True
+
+    def _remove(self, video_id: str):
+        samples_path, meta_path = self._paths(video_id)
+        for path in (meta_path, samples_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _entries(self):
+        """[(mtime, bytes, video_id)] for every cached song, oldest first"""
+        entries = []
+        try:
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if not entry.name.endswith('.npy'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.name[:-4]))
+        except OSError:
+            pass
+        return sorted(entries)
+
+    def _evict(self):
+        """Remove least recently used songs until the directory fits the budget"""
+        with self._lock:
+            entries = self._entries()
+            used = sum(size for _, size, _ in entries)
+            for _, size, video_id in entries:
+                if used <= self.max_bytes:
+                    break
+                self._remove(video_id)
+                used -= size
+                self.evicted += 1
+                logger.info(f"🗑️ Evicted cached audio for {video_id} ({size / 2**20:.1f} MB)")
+
+    def usage(self) -> int:
+        """Bytes of cached samples on disk"""
+        return sum(size for _, size, _ in self._entries()) if self.enabled else 0
+
+    def stats(self) -> Dict:
+        entries = self._entries() if self.enabled else []
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'songs': len(entries),
+                'used_bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'stored': self.stored,
+                'evicted': self.evicted,
+            }
+
+
+# Singleton instance
+_audio_cache = None
+_audio_cache_lock = threading.Lock()
+
+
+def get_audio_cache() -> AudioCache:
+    """Get or create singleton instance"""
+    global _audio_cache
+    if _audio_cache is None:
+        with _audio_cache_lock:
+            if _audio_cache is None:
+                _audio_cache = AudioCache(
+                    root=os.getenv('AUDIO_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'chordypi-audio-cache'),
+                    max_bytes=int(float(os.getenv('AUDIO_CACHE_MB', '1024')) * 1024 * 1024)
+                )
+    return _audio_cache
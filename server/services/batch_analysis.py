@@ -0,0 +1,172 @@
+"""
+Batch Analysis
+Analyzes a setlist in one request and streams each result as it finishes
+
+Items may be song names, YouTube URLs or bare video IDs (or objects with
+song_name/url). Items that resolve to the same analysis are analyzed once,
+cached results are emitted straight away, and the rest run as analysis jobs
+(services/analysis_jobs.py), at most BATCH_MAX_PARALLEL at a time, each
+passing through admission control like a single request would.
+
+run_batch() yields one dict per unique analysis, in completion order,
+followed by a summary; the route writes them as newline-delimited JSON.
+
+Configuration (environment variables):
+    BATCH_MAX_ITEMS      most songs accepted in one batch (default: 25)
+    BATCH_MAX_PARALLEL   analyses one batch runs at once (default: 3)
+"""
+
+import logging
+import os
+import queue
+import re
+import time
+from typing import Dict, Iterator, List, Optional
+
+from services.admission_control import AdmissionRejected, get_admission_controller
+from services.analysis_pipeline import AnalysisError, cached_analysis, coalesce_key
+
+logger = logging.getLogger(__name__)
+
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+class BatchItem:
+    """One unique analysis in a batch and the input positions that asked for it"""
+
+    __slots__ = ('key', 'song_name', 'url', 'options', 'indices', 'input', 'job')
+
+    def __init__(self, key: str, song_name: str, url: str, options: Dict, index: int, raw):
+        self.key = key
+        self.song_name = song_name
+        self.url = url
+        self.options = options
+        self.indices = [index]
+        self.input = raw
+        self.job = None
+
+
+def _normalize(raw) -> tuple:
+    """(song_name, url) for a string or {song_name/query, url/video_id} object"""
+    if isinstance(raw, dict):
+        song_name = (raw.get('song_name') or raw.get('query') or '').strip()
+        url = (raw.get('url') or '').strip()
+        video_id = (raw.get('video_id') or '').strip()
+        if video_id and not url:
+            url = f"https://www.youtube.com/watch?v={video_id}"
+        return song_name, url
+    text = str(raw or '').strip()
+    if text.startswith(('http://', 'https://')):
+        return '', text
+    if VIDEO_ID_PATTERN.match(text):
+        return '', f"https://www.youtube.com/watch?v={text}"
+    return text, ''
+
+
+def parse_batch(data: Dict, options: Dict) -> List[BatchItem]:
+    """
+    Deduplicated BatchItems for a request body {"songs": [...], ...}
+    Raises AnalysisError (400) for a missing, empty, oversized or invalid list.
+    """
+    songs = data.get('songs') or data.get('items')
+    if not isinstance(songs, list) or not songs:
+        raise AnalysisError("'songs' must be a non-empty list of song names, URLs or video IDs", 400)
+    max_items = int(os.getenv('BATCH_MAX_ITEMS', '25'))
+    if len(songs) > max_items:
+        raise AnalysisError(f"Too many songs in one batch (limit {max_items})", 400)
+
+    items: Dict[str, BatchItem] = {}
+    for index, raw in enumerate(songs):
+        song_name, url = _normalize(raw)
+        if not song_name and not url:
+            raise AnalysisError(f"Item {index} has no song name, URL or video ID", 400)
+        item_options = dict(options)
+        if isinstance(raw, dict):
+            # Per-item window/mode override the batch-wide options
+            item_options.update({k: raw[k] for k in ('analysis_mode', 'start', 'end') if k in raw})
+        key = coalesce_key(song_name, url, item_options)
+        if key in items:
+            items[key].indices.append(index)
+        else:
+            items[key] = BatchItem(key, song_name, url, item_options, index, raw)
+    return list(items.values())
+
+
+def _line(item: BatchItem, **fields) -> Dict:
+    line = {'type': 'result', 'index': item.indices[0], 'indices': item.indices, 'input': item.input}
+    line.update(fields)
+    return line
+
+
+def _job_line(item: BatchItem) -> Dict:
+    job = item.job
+    if job.status == 'succeeded':
+        return _line(item, status='success', cached=False, result=job.result)
+    line = _line(item, status='error', status_code=job.error_status, error=job.error)
+    if job.retry_after:
+        line['retry_after'] = job.retry_after
+    return line
+
+
+def run_batch(items: List[BatchItem], max_parallel: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Yield a result line per unique item as soon as it is ready, then a summary
+    Cache hits come first; misses run as jobs, at most max_parallel at once.
+    """
+    from services.analysis_jobs import get_job_manager
+
+    max_parallel = max(1, max_parallel or int(os.getenv('BATCH_MAX_PARALLEL', '3')))
+    started = time.monotonic()
+    counts = {'succeeded': 0, 'failed': 0, 'cache_hits': 0}
+
+    pending = []
+    for item in items:
+        result = cached_analysis(item.song_name, item.url, item.options)
+        if result is None:
+            pending.append(item)
+            continue
+        counts['succeeded'] += 1
+        counts['cache_hits'] += 1
+        yield _line(item, status='success', cached=True, result=result)
+
+    finished = queue.Queue()
+    running = 0
+    manager = get_job_manager()
+    controller = get_admission_controller()
+
+    while pending or running:
+        # Top up to the parallel limit; a full server queue defers the rest
+        while pending and running < max_parallel:
+            item = pending[0]
+            try:
+                ticket = controller.enter()
+            except AdmissionRejected as e:
+                if running:
+                    break
+                # Nothing of ours is running to free a slot - report and move on
+                pending.pop(0)
+                counts['failed'] += 1
+                yield _line(item, status='error', status_code=e.status_code,
+                            error=e.payload, retry_after=e.retry_after)
+                continue
+            pending.pop(0)
+            item.job = manager.submit(item.song_name, item.url, item.options, ticket=ticket)
+            item.job.add_done_callback(lambda job, item=item: finished.put(item))
+            running += 1
+
+        if not running:
+            continue
+        item = finished.get()
+        running -= 1
+        line = _job_line(item)
+        counts['succeeded' if line['status'] == 'success' else 'failed'] += 1
+        yield line
+
+    logger.info(f"📦 Batch of {len(items)} analyses finished: {counts}")
+    yield {
+        'type': 'summary',
+        'unique': len(items),
+        'requested': sum(len(item.indices) for item in items),
+        **counts,
+        'elapsed': round(time.monotonic() - started, 3),
+    }
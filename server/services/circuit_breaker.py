@@ -0,0 +1,166 @@
+"""
+Circuit Breaker
+Skips download providers that keep failing
+
+When a provider is down (RapidAPI out of quota, YouTube bot-detecting this
+server's IP for yt-dlp) every analysis still paid for a full attempt
+before falling back. Each provider now has a breaker fed with the outcome
+of its attempts:
+
+    closed     attempts run; once BREAKER_MIN_CALLS attempts in the last
+               BREAKER_WINDOW_SECONDS fail at BREAKER_FAILURE_RATE or more
+               the breaker opens
+    open       attempts are skipped instantly for BREAKER_OPEN_SECONDS
+    half_open  one probe attempt is let through; success closes the
+               breaker, failure opens it again
+
+Attempts cancelled by a download race (or that never reached the provider)
+do not count either way. Breakers are per worker process; their state is
+reported on /api/health.
+
+Configuration (environment variables):
+    BREAKER_WINDOW_SECONDS   seconds of outcomes the failure rate is computed over (default: 300)
+    BREAKER_MIN_CALLS        attempts in the window before the breaker may open (default: 4)
+    BREAKER_FAILURE_RATE     failure fraction that opens the breaker (default: 0.5)
+    BREAKER_OPEN_SECONDS     seconds an open breaker skips the provider (default: 60)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Error-rate breaker with a time window and a single half-open probe"""
+
+    def __init__(self, name: str, window_seconds: float = 300, min_calls: int = 4,
+                 failure_rate: float = 0.5, open_seconds: float = 60):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self._outcomes = deque()    # (monotonic time, success)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.opened = 0
+
+    def _prune(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _open(self, now: float):
+        self._state = OPEN
+        self._opened_at = now
+        self._probing = False
+        self.opened += 1
+        logger.warning(f"⚡ Circuit for {self.name} opened - skipping it for {self.open_seconds:g}s")
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = HALF_OPEN
+            return self._state
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets a probe through"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        """Whether an attempt may run now (half-open lets one probe through at a time)"""
+        state = self.state
+        with self._lock:
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                logger.info(f"⚡ Circuit for {self.name} half-open - probing")
+                return True
+            self.skipped += 1
+            return False
+
+    def record(self, success: bool):
+        """Outcome of an attempt that allow() let through"""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+                if success:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    logger.info(f"⚡ Circuit for {self.name} closed again")
+                else:
+                    self._open(now)
+                return
+            self._outcomes.append((now, success))
+            self._prune(now)
+            if self._state != CLOSED or len(self._outcomes) < self.min_calls:
+                return
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if failures / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+
+    def release(self):
+        """An allowed attempt ended without an outcome (cancelled) - free the probe slot"""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict:
+        state = self.state
+        with self._lock:
+            self._prune(time.monotonic())
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            return {
+                'state': state,
+                'window_calls': len(self._outcomes),
+                'window_failures': failures,
+                'retry_in_seconds': round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+                if state == OPEN else 0.0,
+                'opened': self.opened,
+                'skipped': self.skipped,
+            }
+
+
+# One breaker per provider name
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Get or create the breaker for a provider"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(
+                    name,
+                    window_seconds=float(os.getenv('BREAKER_WINDOW_SECONDS', '300')),
+                    min_calls=int(os.getenv('BREAKER_MIN_CALLS', '4')),
+                    failure_rate=float(os.getenv('BREAKER_FAILURE_RATE', '0.5')),
+                    open_seconds=float(os.getenv('BREAKER_OPEN_SECONDS', '60'))
+                )
+    return breaker
+
+
+def breaker_states() -> Dict[str, Dict]:
+    """{provider: stats} for every breaker created so far"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
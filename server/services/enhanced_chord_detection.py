@@ -3,7 +3,11 @@ Enhanced Chord Detection with AI Models
 Uses Spotify's Basic Pitch for 90-95% accuracy (vs 60-70% with librosa)
 
 Installation:
-    pip install basic-pitch tensorflow numpy
+    pip install basic-pitch onnxruntime numpy      (tf runtime: pip install -r requirements-tf.txt)
+
+Runtime:
+    BASIC_PITCH_RUNTIME selects the serialized model (auto, tf, tflite, onnx)
+    See services/inference_runtime.py for threading options
 
 Features:
     - Deep learning model trained on 10,000+ hours of music
@@ -13,29 +17,41 @@ Features:
 """
 
 import os
+import threading
 import numpy as np
-from typing import List, Dict, Optional
+from typing import List, Dict
 import logging
 
+from utils.chord_segment import ChordSegment
+from utils.deadline import NO_DEADLINE, DeadlineExceeded
+from utils.progressive_chords import publish_chords, publishing_chords
+from utils.stage_timings import timed_stage
+
 logger = logging.getLogger(__name__)
 
-# Try to import Basic Pitch, fallback to librosa if not installed
+# Progressive results: chords in the last PARTIAL_TAIL_SECONDS of inferred
+# audio may still grow, so they wait for the next window; notes are re-read
+# from PARTIAL_CONTEXT_SECONDS before the last published chord
+PARTIAL_TAIL_SECONDS = 2.0
+PARTIAL_CONTEXT_SECONDS = 4.0
+
+# Check for Basic Pitch without importing it - basic_pitch imports TensorFlow
+# whenever it is installed, so the package is only loaded with the model
+from services.inference_runtime import (basic_pitch_installed, get_runtime_config, model_path_for,
+                                        resolve_runtime)
+
 BASIC_PITCH_AVAILABLE = False
-try:
-    from basic_pitch.inference import predict
-    from basic_pitch import ICASSP_2022_MODEL_PATH
-    # Test if model can actually be loaded
-    try:
-        # Try to verify the model path exists and is valid
-        if os.path.exists(ICASSP_2022_MODEL_PATH):
-            BASIC_PITCH_AVAILABLE = True
-            logger.info("✅ Basic Pitch AI model available")
-        else:
-            logger.warning("⚠️ Basic Pitch model path not found")
-    except Exception as e:
-        logger.warning(f"⚠️ Basic Pitch model validation failed: {e}")
-except ImportError as e:
-    logger.warning(f"⚠️ Basic Pitch not installed: {e}")
+BASIC_PITCH_RUNTIME = None
+if basic_pitch_installed():
+    # Pick the serialized model format (tf / tflite / onnx) from config
+    BASIC_PITCH_RUNTIME = resolve_runtime(get_runtime_config()['runtime'])
+    if BASIC_PITCH_RUNTIME:
+        BASIC_PITCH_AVAILABLE = True
+        logger.info(f"✅ Basic Pitch AI available (runtime: {BASIC_PITCH_RUNTIME})")
+    else:
+        logger.warning("⚠️ Basic Pitch installed but no runtime for it (onnxruntime, tflite-runtime or tensorflow)")
+else:
+    logger.warning("⚠️ Basic Pitch not installed")
     logger.warning("   Install with: pip install basic-pitch")
 
 
@@ -49,26 +65,151 @@ class EnhancedChordDetector:
     def __init__(self, use_gpu: bool = False):
         self.use_gpu = use_gpu
         self.available = False  # Start pessimistic
+        self.runtime = BASIC_PITCH_RUNTIME
+        self._model = None
+        self._model_lock = threading.Lock()
         
         if BASIC_PITCH_AVAILABLE:
             try:
-                # Test that we can actually use the model
-                self.model_path = ICASSP_2022_MODEL_PATH
+                # Test that the serialized model for the runtime is there
+                self.model_path = model_path_for(self.runtime)
+                if not os.path.exists(self.model_path):
+                    raise FileNotFoundError(f"Basic Pitch model not found: {self.model_path}")
                 self.available = True
-                logger.info("🎵 Enhanced Chord Detector initialized with Basic Pitch AI")
+                logger.info(f"🎵 Enhanced Chord Detector initialized with Basic Pitch AI ({self.runtime})")
             except Exception as e:
                 logger.warning(f"⚠️ Basic Pitch initialization failed: {e}")
                 logger.info("📊 Falling back to librosa mode")
         else:
             logger.info("📊 Enhanced Chord Detector in fallback mode (librosa)")
     
-    def detect_chords(self, audio_path: str, duration: float = None) -> List[Dict]:
+    def _get_model(self):
+        """
+        Load the Basic Pitch model once per process
+        predict() would otherwise reload the serialized model on every call
+        """
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from services.inference_runtime import load_model
+                    config = get_runtime_config()
+                    logger.info(f"🧠 Loading Basic Pitch model ({self.runtime}, "
+                                f"intra={config['intra_op_threads'] or 'default'}, "
+                                f"inter={config['inter_op_threads'] or 'default'})")
+                    self._model = load_model(
+                        self.runtime,
+                        intra_op_threads=config['intra_op_threads'],
+                        inter_op_threads=config['inter_op_threads']
+                    )
+        return self._model
+    
+    def _predict_signal(self, signal, deadline=NO_DEADLINE):
+        """
+        Basic Pitch inference on an already-decoded AudioSignal
+        Same windowing and note creation as basic_pitch.inference.predict(),
+        minus the file decode it would otherwise repeat. The deadline is
+        checked between windows so a cancelled run stops within ~2 seconds
+        of audio. While progressive results are wanted, the chords settled so
+        far are published after every window.
+        """
+        from basic_pitch import note_creation as infer
+        from basic_pitch.constants import AUDIO_N_SAMPLES, AUDIO_SAMPLE_RATE, FFT_HOP
+        from basic_pitch.inference import unwrap_output
+
+        model = self._get_model()
+        samples = signal.resampled(AUDIO_SAMPLE_RATE).samples
+        original_length = samples.shape[0]
+
+        n_overlapping_frames = 30
+        overlap_len = n_overlapping_frames * FFT_HOP
+        hop_size = AUDIO_N_SAMPLES - overlap_len
+        padded = np.concatenate([np.zeros(overlap_len // 2, dtype=np.float32), samples])
+
+        progressive = publishing_chords()
+        released = 0.0
+        output = {"note": [], "onset": [], "contour": []}
+        for i in range(0, padded.shape[0], hop_size):
+            deadline.check('detect')
+            window = padded[i:i + AUDIO_N_SAMPLES]
+            if len(window) < AUDIO_N_SAMPLES:
+                window = np.pad(window, (0, AUDIO_N_SAMPLES - len(window)))
+            for k, v in model.predict(window[np.newaxis, :, np.newaxis]).items():
+                output[k].append(v)
+            if progressive and i + hop_size < original_length:
+                try:
+                    released = self._publish_window_chords(
+                        output, n_overlapping_frames, i + hop_size, released, signal.offset
+                    )
+                except Exception as e:
+                    # Early chords are a nicety - never let them break the analysis
+                    logger.warning(f"⚠️ Progressive AI chords disabled for this run: {e}")
+                    progressive = False
+
+        model_output = {
+            k: unwrap_output(np.concatenate(v), original_length, n_overlapping_frames)
+            for k, v in output.items()
+        }
+        min_note_len = int(np.round(127 / 1000 * (AUDIO_SAMPLE_RATE / FFT_HOP)))  # ~0.1 seconds
+        _, note_events = infer.model_output_to_notes(
+            model_output,
+            onset_thresh=0.5,
+            frame_thresh=0.3,
+            min_note_len=min_note_len,
+            min_freq=65.4,
+            max_freq=2093.0,
+            multiple_pitch_bends=False,
+            melodia_trick=True,
+        )
+        return note_events
+
+    def _publish_window_chords(self, output: Dict, n_overlapping_frames: int, covered_samples: int,
+                               released: float, offset: float) -> float:
+        """
+        Publish the chords of the audio inferred so far (after one window)
+        Only the windows around the unpublished part are turned into notes,
+        so each call costs a few seconds of audio, not the whole song.
+        Returns the time up to which chords are now published.
+        """
+        from basic_pitch import note_creation as infer
+        from basic_pitch.constants import AUDIO_N_SAMPLES, AUDIO_SAMPLE_RATE, FFT_HOP
+        from basic_pitch.inference import unwrap_output
+
+        hop_size = AUDIO_N_SAMPLES - n_overlapping_frames * FFT_HOP
+        first = max(0, int((released - PARTIAL_CONTEXT_SECONDS) * AUDIO_SAMPLE_RATE) // hop_size)
+        tail_output = {
+            k: unwrap_output(np.concatenate(v[first:]), covered_samples - first * hop_size, n_overlapping_frames)
+            for k, v in output.items()
+        }
+        _, note_events = infer.model_output_to_notes(
+            tail_output,
+            onset_thresh=0.5,
+            frame_thresh=0.3,
+            min_note_len=int(np.round(127 / 1000 * (AUDIO_SAMPLE_RATE / FFT_HOP))),
+            min_freq=65.4,
+            max_freq=2093.0,
+            multiple_pitch_bends=False,
+            melodia_trick=True,
+        )
+        start = first * hop_size / AUDIO_SAMPLE_RATE
+        settled = covered_samples / AUDIO_SAMPLE_RATE - PARTIAL_TAIL_SECONDS
+        chords = [
+            chord for chord in self._notes_to_chords(note_events, verbose=False)
+            if chord['time'] + start < settled
+        ]
+        if publish_chords('basic_pitch', chords, offset=offset + start):
+            return chords[-1]['time'] + start
+        return released
+
+    def detect_chords(self, audio, duration: float = None, fallback: bool = True,
+                      deadline=None) -> List[Dict]:
         """
         Main chord detection method using AI
         
         Args:
-            audio_path: Path to audio file (mp3, wav, etc.)
+            audio: Path to audio file (mp3, wav, etc.) or a decoded AudioSignal
             duration: Optional duration limit (seconds)
+            fallback: Use librosa when the AI fails (False re-raises instead)
+            deadline: Request Deadline - raises DeadlineExceeded when it runs out
         
         Returns: [
             {
@@ -84,80 +225,103 @@ class EnhancedChordDetector:
             ...
         ]
         """
-        if not os.path.exists(audio_path):
-            logger.error(f"❌ Audio file not found: {audio_path}")
+        from utils.audio_signal import AudioSignal
+        deadline = deadline or NO_DEADLINE
+        is_signal = isinstance(audio, AudioSignal)
+        if not is_signal and not os.path.exists(audio):
+            logger.error(f"❌ Audio file not found: {audio}")
             return []
         
         if not self.available:
             # Fallback to librosa
             logger.info("📊 Using librosa fallback method")
-            return self._fallback_detection(audio_path, duration)
+            return self._fallback_detection(audio, duration, deadline)
         
         try:
-            logger.info(f"🎵 AI Chord Detection starting: {audio_path}")
+            deadline.check('detect')
+            logger.info(f"🎵 AI Chord Detection starting: {audio}")
             
-            # Run Basic Pitch model
-            model_output, midi_data, note_events = predict(
-                audio_path,
-                onset_threshold=0.5,      # Sensitivity for note onsets
-                frame_threshold=0.3,      # Confidence threshold
-                minimum_note_length=127,  # ~0.1 seconds minimum
-                minimum_frequency=65.4,   # C2
-                maximum_frequency=2093.0, # C7
-                multiple_pitch_bends=False,
-                melodia_trick=True,       # Better for vocal/harmonic content
-                debug_file=None
-            )
+            if is_signal:
+                # Decoded once upstream - run the model on the shared samples
+                with timed_stage('ai_inference'):
+                    note_events = self._predict_signal(audio, deadline)
+            else:
+                # Run Basic Pitch model (decodes the file itself)
+                from basic_pitch.inference import predict
+                with timed_stage('ai_inference'):
+                    model_output, midi_data, note_events = predict(
+                        audio,
+                        model_or_model_path=self._get_model(),
+                        onset_threshold=0.5,      # Sensitivity for note onsets
+                        frame_threshold=0.3,      # Confidence threshold
+                        minimum_note_length=127,  # ~0.1 seconds minimum
+                        minimum_frequency=65.4,   # C2
+                        maximum_frequency=2093.0, # C7
+                        multiple_pitch_bends=False,
+                        melodia_trick=True,       # Better for vocal/harmonic content
+                        debug_file=None
+                    )
+                deadline.check('detect')
             
             # Convert note events to chord progressions
-            chords = self._notes_to_chords(note_events, duration)
+            with timed_stage('postprocess'):
+                chords = self._notes_to_chords(note_events, duration)
+            if is_signal:
+                # Whatever the windows did not publish yet is final now
+                publish_chords('basic_pitch', chords, offset=audio.offset)
             
             logger.info(f"✅ AI Detection complete: {len(chords)} chords with {self._count_unique(chords)} unique progressions")
             
             return chords
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"❌ AI chord detection failed: {e}")
+            if not fallback:
+                raise
             logger.info("📊 Falling back to librosa method")
-            return self._fallback_detection(audio_path, duration)
+            return self._fallback_detection(audio, duration, deadline)
     
-    def _notes_to_chords(self, note_events: List, duration_limit: float = None) -> List[Dict]:
+    def _notes_to_chords(self, note_events: List, duration_limit: float = None,
+                         verbose: bool = True) -> List[Dict]:
         """
         Convert MIDI note events to chord progressions
         Groups simultaneous notes into chord names
+        (verbose=False for the per-window partial runs)
         """
         if not note_events or len(note_events) == 0:
-            logger.warning("⚠️ No note events detected")
+            if verbose:
+                logger.warning("⚠️ No note events detected")
             return []
         
-        # Convert to list of dicts if needed
+        # Convert to (start, end, pitch, amplitude) tuples
         if hasattr(note_events, 'to_dict'):
             note_events = note_events.to_dict('records')
-        elif not isinstance(note_events, list):
-            note_events = list(note_events)
+        notes = [self._note_fields(note) for note in note_events]
         
         # Sort by start time
-        sorted_notes = sorted(note_events, key=lambda x: x.get('start_time', 0))
+        sorted_notes = sorted(notes, key=lambda note: note[0])
         
         # Filter by duration if specified
         if duration_limit:
-            sorted_notes = [n for n in sorted_notes if n.get('start_time', 0) < duration_limit]
+            sorted_notes = [n for n in sorted_notes if n[0] < duration_limit]
         
         chords = []
         time_window = 0.3  # 300ms window for simultaneous notes
         
         i = 0
         while i < len(sorted_notes):
-            current_time = sorted_notes[i].get('start_time', 0)
+            current_time = sorted_notes[i][0]
             
             # Collect all notes within time window
             simultaneous_notes = []
-            while i < len(sorted_notes) and sorted_notes[i].get('start_time', 0) < current_time + time_window:
-                note = sorted_notes[i]
+            while i < len(sorted_notes) and sorted_notes[i][0] < current_time + time_window:
+                start, end, pitch, amplitude = sorted_notes[i]
                 simultaneous_notes.append({
-                    'pitch': int(note.get('pitch_midi', note.get('pitch', 60))),
-                    'velocity': float(note.get('amplitude', note.get('velocity', 0.5))),
-                    'duration': float(note.get('end_time', current_time + 1) - note.get('start_time', current_time))
+                    'pitch': int(pitch),
+                    'velocity': float(amplitude),
+                    'duration': float(end - start)
                 })
                 i += 1
             
@@ -173,12 +337,27 @@ class EnhancedChordDetector:
                 chords.append(chord_info)
         
         # Post-process for smoothness
-        smoothed = self._smooth_chord_progression(chords)
+        smoothed = self._smooth_chord_progression(chords, verbose)
         
         # Add beat/measure information
         return self._add_rhythm_info(smoothed)
     
-    def _identify_chord(self, notes: List[Dict]) -> Dict:
+    @staticmethod
+    def _note_fields(note) -> tuple:
+        """
+        (start, end, pitch, amplitude) of one note event
+        basic-pitch 0.4 returns (start_s, end_s, pitch_midi, amplitude, pitch_bends)
+        tuples; dict records (e.g. from a DataFrame) are read by column name
+        """
+        if isinstance(note, dict):
+            start = note.get('start_time', 0)
+            return (start, note.get('end_time', start + 1),
+                    note.get('pitch_midi', note.get('pitch', 60)),
+                    note.get('amplitude', note.get('velocity', 0.5)))
+        start, end, pitch, amplitude = note[:4]
+        return start, end, pitch, amplitude
+    
+    def _identify_chord(self, notes: List[Dict]) -> ChordSegment:
         """
         Identify chord name from MIDI note numbers
         Uses music theory to determine chord quality
@@ -267,14 +446,14 @@ class EnhancedChordDetector:
         if chord_quality in ['', 'm', '7', 'maj7', 'm7']:
             confidence = min(0.98, confidence + 0.1)
         
-        return {
-            'chord': chord_name,
-            'confidence': confidence,
-            'notes': [note_names[(root_pitch + i) % 12] for i in intervals],
-            'intervals': intervals
-        }
+        return ChordSegment(
+            chord=chord_name,
+            confidence=confidence,
+            notes=[note_names[(root_pitch + i) % 12] for i in intervals],
+            intervals=intervals
+        )
     
-    def _smooth_chord_progression(self, chords: List[Dict]) -> List[Dict]:
+    def _smooth_chord_progression(self, chords: List[Dict], verbose: bool = True) -> List[Dict]:
         """
         Post-process chord progression for musical coherence
         - Remove very short chords (< 0.2s)
@@ -311,7 +490,8 @@ class EnhancedChordDetector:
             merged.append(current)
             i = j if j > i + 1 else i + 1
         
-        logger.info(f"🎼 Smoothed {len(chords)} → {len(merged)} chords")
+        if verbose:
+            logger.info(f"🎼 Smoothed {len(chords)} → {len(merged)} chords")
         return merged
     
     def _add_rhythm_info(self, chords: List[Dict]) -> List[Dict]:
@@ -330,14 +510,15 @@ class EnhancedChordDetector:
         """Count unique chord names"""
         return len(set(c['chord'] for c in chords))
     
-    def _fallback_detection(self, audio_path: str, duration: float = None) -> List[Dict]:
+    def _fallback_detection(self, audio, duration: float = None, deadline=NO_DEADLINE) -> List[Dict]:
         """
         Fallback to librosa-based detection if Basic Pitch unavailable
         """
+        deadline.check('detect')
         try:
             from utils.chord_analyzer import extract_chords_from_audio
             logger.info("📊 Using librosa fallback chord detection")
-            return extract_chords_from_audio(audio_path, duration)
+            return extract_chords_from_audio(audio, duration)
         except Exception as e:
             logger.error(f"❌ Fallback detection failed: {e}")
             return []
@@ -354,24 +535,26 @@ def get_enhanced_detector() -> EnhancedChordDetector:
     return _enhanced_detector
 
 
-def detect_chords_ai(audio_path: str, duration: float = None) -> List[Dict]:
+def detect_chords_ai(audio, duration: float = None, fallback: bool = True, deadline=None) -> List[Dict]:
     """
     Main function to detect chords using AI
     Drop-in replacement for librosa-based detection
     
     Args:
-        audio_path: Path to audio file
+        audio: Path to audio file or decoded AudioSignal
         duration: Optional duration limit in seconds
+        fallback: Use librosa when the AI fails (False re-raises instead)
+        deadline: Request Deadline (utils/deadline.py)
     
     Returns:
         List of chord dictionaries with time, duration, confidence, etc.
     """
     detector = get_enhanced_detector()
-    return detector.detect_chords(audio_path, duration)
+    return detector.detect_chords(audio, duration, fallback=fallback, deadline=deadline)
 
 
 # Convenience function for backward compatibility
-def analyze_song_chords(audio_path: str) -> Dict:
+def analyze_song_chords(audio, fallback: bool = True, deadline=None) -> Dict:
     """
     Analyze a song and return comprehensive chord information
     
@@ -385,7 +568,7 @@ def analyze_song_chords(audio_path: str) -> Dict:
             'method': 'basic_pitch'
         }
     """
-    chords = detect_chords_ai(audio_path)
+    chords = detect_chords_ai(audio, fallback=fallback, deadline=deadline)
     
     # Detect key from chord progression
     key = _detect_key_from_chords(chords) if chords else 'C'
@@ -396,7 +579,8 @@ def analyze_song_chords(audio_path: str) -> Dict:
         'total_chords': len(chords),
         'unique_chords': len(set(c['chord'] for c in chords)),
         'accuracy': 'AI-Enhanced (90-95%)' if BASIC_PITCH_AVAILABLE else 'Librosa (60-70%)',
-        'method': 'basic_pitch' if BASIC_PITCH_AVAILABLE else 'librosa'
+        'method': 'basic_pitch' if BASIC_PITCH_AVAILABLE else 'librosa',
+        'runtime': BASIC_PITCH_RUNTIME if BASIC_PITCH_AVAILABLE else None
     }
 
 
@@ -0,0 +1,304 @@
+"""
+HTTP Gateway
+One place for outbound HTTP: pooled keep-alive sessions per host, retries
+with jittered backoff, per-host token-bucket rate limits and timing metrics
+
+Search, the downloaders, the external chord sources and the Pi routes call
+
+    response = get_http_gateway().get(url, params=params)
+
+instead of requests.get(), so connections to a host are reused, every call
+has a timeout, a flaky upstream gets a couple of retries and MusicBrainz
+sees at most one request per second however many analyses run at once.
+
+Retries cover connection errors, timeouts and 429/5xx answers, waiting a
+random time up to base * 2^attempt (or the server's Retry-After). Only
+idempotent methods are retried after the request may have reached the
+server; a POST is retried only when the connection could not be opened.
+With a request Deadline (utils/deadline.py) timeouts, backoff and rate-limit
+waits all stay within the remaining budget.
+
+Configuration (environment variables):
+    HTTP_POOL_SIZE          keep-alive connections per host (default: 10)
+    HTTP_MAX_HOSTS          hosts with a pooled session before the oldest is dropped (default: 64)
+    HTTP_CONNECT_TIMEOUT    default connect timeout in seconds (default: 5)
+    HTTP_READ_TIMEOUT       default read timeout in seconds (default: 30)
+    HTTP_MAX_RETRIES        retries after the first attempt (default: 2)
+    HTTP_BACKOFF_BASE       first backoff ceiling in seconds (default: 0.5)
+    HTTP_BACKOFF_MAX        longest backoff/Retry-After honoured (default: 8)
+    HTTP_RATE_LIMITS        host=requests_per_second[/burst], comma separated
+                            (default: musicbrainz.org=1)
+    MUSICBRAINZ_USER_AGENT  User-Agent MusicBrainz asks clients to send (default: ChordyPi/1.0.0)
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+DEFAULT_RATE_LIMITS = 'musicbrainz.org=1'
+
+
+class TokenBucket:
+    """Allows `rate` requests per second with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token; returns how long to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens may go negative - later callers queue behind earlier ones
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def refund(self):
+        """Give back a reserved token that will not be used"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, int]]:
+    """'musicbrainz.org=1,www.googleapis.com=10/20' -> {host: (rate, burst)}"""
+    limits = {}
+    for item in (spec or '').split(','):
+        host, _, value = item.strip().partition('=')
+        if not host or not value:
+            continue
+        rate, _, burst = value.partition('/')
+        try:
+            limits[host.lower()] = (float(rate), int(burst) if burst else 1)
+        except ValueError:
+            logger.warning(f"Ignoring malformed HTTP_RATE_LIMITS entry: {item!r}")
+    return limits
+
+
+class HttpGateway:
+    """Pooled sessions, retries and rate limits for every outbound request"""
+
+    def __init__(self, pool_size: int = 10, max_hosts: int = 64, connect_timeout: float = 5,
+                 read_timeout: float = 30, max_retries: int = 2, backoff_base: float = 0.5,
+                 backoff_max: float = 8, rate_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 host_headers: Optional[Dict[str, Dict[str, str]]] = None):
+        self.pool_size = max(1, pool_size)
+        self.max_hosts = max(1, max_hosts)
+        self.default_timeout = (connect_timeout, read_timeout)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limits = rate_limits or {}
+        self.host_headers = host_headers or {}
+        self._sessions = OrderedDict()    # scheme://host -> Session, least recently used first
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.retried = 0
+        self.throttled_seconds = 0.0
+
+    # -- per-host state -----------------------------------------------------
+
+    def session(self, url: str) -> requests.Session:
+        """The pooled keep-alive session for url's host"""
+        parts = urlsplit(url)
+        key = f"{parts.scheme}://{parts.netloc}".lower()
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                return session
+            session = requests.Session()
+            # Retries are ours (with backoff and metrics), not urllib3's
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            domain = self._domain(self.host_headers, parts.hostname)
+            if domain:
+                session.headers.update(self.host_headers[domain])
+            self._sessions[key] = session
+            # Download CDNs hand out many hostnames - keep the pool bounded
+            while len(self._sessions) > self.max_hosts:
+                self._sessions.popitem(last=False)
+            return session
+
+    @staticmethod
+    def _domain(table: Dict, host: Optional[str]) -> Optional[str]:
+        """The key in table for host or its closest parent domain"""
+        host = (host or '').lower()
+        while host:
+            if host in table:
+                return host
+            host = host.partition('.')[2]
+        return None
+
+    def _bucket(self, host: str) -> Optional[TokenBucket]:
+        # One bucket per configured domain, shared by its subdomains
+        domain = self._domain(self.rate_limits, host)
+        if domain is None:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(domain)
+            if bucket is None:
+                bucket = self._buckets[domain] = TokenBucket(*self.rate_limits[domain])
+            return bucket
+
+    def _throttle(self, host: str, deadline, stage: str):
+        """Wait for the host's rate limit (no-op for unlimited hosts)"""
+        bucket = self._bucket(host)
+        if bucket is None:
+            return
+        wait = bucket.reserve()
+        if not wait:
+            return
+        remaining = deadline.remaining() if deadline is not None else None
+        if remaining is not None and wait > remaining:
+            bucket.refund()
+            raise DeadlineExceeded(stage, deadline.budget)
+        from services.metrics import get_metrics
+        get_metrics().outbound_throttled(host, wait)
+        with self._lock:
+            self.throttled_seconds += wait
+        time.sleep(wait)
+
+    # -- requests -----------------------------------------------------------
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> Optional[float]:
+        """Seconds to wait before retry number attempt+1, or None to give up"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.strip().isdigit():
+            seconds = float(retry_after)
+            return seconds if seconds <= self.backoff_max else None
+        # Full jitter: spreads out clients that failed together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method: str, url: str, retries: Optional[int] = None, deadline=None,
+                stage: str = 'http', **kwargs) -> requests.Response:
+        """
+        Send a request through the host's pooled session
+
+        Takes the same keyword arguments as requests.request(). Without a
+        timeout, HTTP_CONNECT_TIMEOUT/HTTP_READ_TIMEOUT apply, capped by the
+        deadline. Returns the last response (callers check status codes as
+        before) or raises the last connection error once retries run out.
+        """
+        from services.metrics import get_metrics
+
+        method = method.upper()
+        host = (urlsplit(url).hostname or '').lower()
+        session = self.session(url)
+        metrics = get_metrics()
+        retries = self.max_retries if retries is None else retries
+        explicit_timeout = kwargs.pop('timeout', None)
+
+        attempt = 0
+        while True:
+            if deadline is not None:
+                deadline.check(stage)
+            self._throttle(host, deadline, stage)
+            timeout = explicit_timeout
+            if timeout is None:
+                connect, read = self.default_timeout
+                timeout = (connect, read) if deadline is None else (
+                    deadline.timeout(stage, cap=connect), deadline.timeout(stage, cap=read))
+
+            started = time.monotonic()
+            response = error = None
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+                outcome = str(response.status_code)
+            except requests.exceptions.ConnectTimeout as e:
+                error, outcome = e, 'connect_timeout'
+            except requests.exceptions.Timeout as e:
+                error, outcome = e, 'timeout'
+            except requests.exceptions.ConnectionError as e:
+                error, outcome = e, 'connection_error'
+            except requests.exceptions.RequestException:
+                # Not worth retrying (bad URL, too many redirects, ...)
+                metrics.observe_outbound(host, 'error', time.monotonic() - started)
+                raise
+            metrics.observe_outbound(host, outcome, time.monotonic() - started)
+
+            if error is None and response.status_code not in RETRY_STATUSES:
+                return response
+            # Anything but a failed connect may have reached the server
+            safe = method in IDEMPOTENT_METHODS or isinstance(error, requests.exceptions.ConnectTimeout)
+            delay = self._backoff(attempt, response) if safe and attempt < retries else None
+            if delay is not None and deadline is not None:
+                remaining = deadline.remaining()
+                if remaining is not None and delay >= remaining:
+                    delay = None
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+
+            logger.info(f"🔁 {method} {host} {outcome} - retry {attempt + 1}/{retries} in {delay:.2f}s")
+            if response is not None:
+                response.close()
+            metrics.outbound_retry(host)
+            with self._lock:
+                self.retried += 1
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'pooled_hosts': len(self._sessions),
+                'rate_limited_hosts': sorted(self.rate_limits),
+                'retries': self.retried,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+            }
+
+
+# Singleton instance
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_http_gateway() -> HttpGateway:
+    """Get or create singleton instance"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = HttpGateway(
+                    pool_size=int(os.getenv('HTTP_POOL_SIZE', '10')),
+                    max_hosts=int(os.getenv('HTTP_MAX_HOSTS', '64')),
+                    connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+                    read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', '30')),
+                    max_retries=int(os.getenv('HTTP_MAX_RETRIES', '2')),
+                    backoff_base=float(os.getenv('HTTP_BACKOFF_BASE', '0.5')),
+                    backoff_max=float(os.getenv('HTTP_BACKOFF_MAX', '8')),
+                    rate_limits=parse_rate_limits(os.getenv('HTTP_RATE_LIMITS', DEFAULT_RATE_LIMITS)),
+                    host_headers={
+                        'musicbrainz.org': {
+                            'User-Agent': os.getenv('MUSICBRAINZ_USER_AGENT', 'ChordyPi/1.0.0'),
+                        },
+                    },
+                )
+    return _gateway
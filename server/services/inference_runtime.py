@@ -0,0 +1,155 @@
+"""
+Basic Pitch Inference Runtimes
+Loads the Basic Pitch model with a selectable serialized runtime
+
+Basic Pitch ships the same ICASSP 2022 model in several formats. The full
+TensorFlow SavedModel is the heaviest; the TFLite and ONNX exports give the
+same predictions with a fraction of the load time and memory, so more AI
+workers fit on one box.
+
+Configuration (environment variables):
+    BASIC_PITCH_RUNTIME           auto | tf | tflite | onnx   (default: auto)
+    BASIC_PITCH_INTRA_OP_THREADS  threads used inside a single op (default: runtime default)
+    BASIC_PITCH_INTER_OP_THREADS  threads used across independent ops (default: runtime default)
+
+`auto` picks the lightest runtime that is installed: onnx, then tflite, then tf.
+
+TensorFlow is not in requirements.txt: installing it (requirements-tf.txt)
+makes the basic_pitch package import it on first use whatever runtime is
+selected, so only workers that run the tf runtime should have it.
+
+Model() takes no threading options, so for TFLite/ONNX thread overrides
+load_model() swaps in its own interpreter/session on the Model it built.
+Those are attributes of basic-pitch 0.4.0, which requirements.txt pins
+exactly - re-check load_model() when upgrading it.
+"""
+
+import importlib.util
+import logging
+import os
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lightest first - used to resolve BASIC_PITCH_RUNTIME=auto
+RUNTIME_PREFERENCE = ('onnx', 'tflite', 'tf')
+
+# Python packages that can execute each serialized model format
+RUNTIME_PACKAGES = {
+    'onnx': ('onnxruntime',),
+    'tflite': ('tflite_runtime', 'tensorflow'),
+    'tf': ('tensorflow',),
+}
+
+
+def _env_int(name: str) -> Optional[int]:
+    """Read a positive integer from the environment, None if unset or invalid"""
+    value = os.getenv(name, '').strip()
+    if not value:
+        return None
+    try:
+        parsed = int(value)
+    except ValueError:
+        logger.warning(f"⚠️ Ignoring invalid {name}={value!r} (expected an integer)")
+        return None
+    return parsed if parsed > 0 else None
+
+
+def get_runtime_config() -> Dict:
+    """Current runtime configuration from the environment"""
+    return {
+        'runtime': os.getenv('BASIC_PITCH_RUNTIME', 'auto').strip().lower() or 'auto',
+        'intra_op_threads': _env_int('BASIC_PITCH_INTRA_OP_THREADS'),
+        'inter_op_threads': _env_int('BASIC_PITCH_INTER_OP_THREADS'),
+    }
+
+
+def basic_pitch_installed() -> bool:
+    """Whether the basic_pitch package is installed (without importing it)"""
+    return importlib.util.find_spec('basic_pitch') is not None
+
+
+def available_runtimes() -> List[str]:
+    """
+    Runtimes whose backing package is installed
+    Uses find_spec so nothing heavy is imported just to check
+    """
+    available = []
+    for runtime in RUNTIME_PREFERENCE:
+        if any(importlib.util.find_spec(pkg) is not None for pkg in RUNTIME_PACKAGES[runtime]):
+            available.append(runtime)
+    return available
+
+
+def resolve_runtime(requested: str = 'auto') -> Optional[str]:
+    """
+    Turn a requested runtime into one that can actually run here
+    Returns None when no runtime is installed
+    """
+    available = available_runtimes()
+
+    if requested != 'auto':
+        if requested not in RUNTIME_PACKAGES:
+            logger.warning(f"⚠️ Unknown BASIC_PITCH_RUNTIME '{requested}', using auto")
+        elif requested in available:
+            return requested
+        else:
+            logger.warning(f"⚠️ Runtime '{requested}' not installed (needs {' or '.join(RUNTIME_PACKAGES[requested])}), using auto")
+
+    return available[0] if available else None
+
+
+def model_path_for(runtime: str) -> str:
+    """Path of the serialized ICASSP 2022 model for a runtime"""
+    from basic_pitch import FilenameSuffix, build_icassp_2022_model_path
+    return str(build_icassp_2022_model_path(FilenameSuffix[runtime]))
+
+
+def load_model(runtime: str, intra_op_threads: Optional[int] = None, inter_op_threads: Optional[int] = None):
+    """
+    Load the Basic Pitch model for a runtime with the given threading
+
+    Returns a basic_pitch.inference.Model, so it can be passed straight to
+    predict(model_or_model_path=...). TensorFlow threading is process-wide
+    and set before the model loads; TFLite/ONNX thread counts need their own
+    interpreter/session (see the module docstring).
+    """
+    from basic_pitch.inference import Model
+
+    if runtime not in RUNTIME_PACKAGES:
+        raise ValueError(f"Unsupported Basic Pitch runtime: {runtime}")
+    path = model_path_for(runtime)
+
+    if runtime == 'tf':
+        import tensorflow as tf
+        try:
+            if intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+            if inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        except RuntimeError as e:
+            # TensorFlow refuses once its runtime is initialized
+            logger.warning(f"⚠️ Could not apply TensorFlow threading settings: {e}")
+        return Model(path)
+
+    model = Model(path)
+
+    if runtime == 'tflite' and intra_op_threads:
+        try:
+            import tflite_runtime.interpreter as tflite
+        except ImportError:
+            import tensorflow.lite as tflite
+        # TFLite runs ops sequentially, so only the intra-op count applies
+        model.interpreter = tflite.Interpreter(path, num_threads=intra_op_threads)
+        model.model = model.interpreter.get_signature_runner()
+
+    if runtime == 'onnx' and (intra_op_threads or inter_op_threads):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+        model.model = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+    return model
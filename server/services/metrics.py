@@ -0,0 +1,341 @@
+"""
+Metrics
+Prometheus text-format metrics served at /metrics, with no client library
+
+Counters and histograms are recorded as requests run; gauges (queue depth,
+cache hit ratio, memory) are read from their owners at scrape time. Point a
+local Prometheus (or any scraper that reads the text exposition format) at
+/metrics to chart throughput and latency.
+
+Recorded:
+    chordypi_http_requests_total                  per route, method and status
+    chordypi_http_request_duration_seconds        latency histogram per route
+    chordypi_analysis_stage_duration_seconds      histogram per analysis stage
+    chordypi_analysis_stage_bytes_total           bytes moved per stage
+    chordypi_analysis_engine_total                which engine produced the chords
+    chordypi_analysis_queue_wait_seconds          time admitted analyses waited for a slot
+    chordypi_download_attempts_total              per provider, success/failure
+    chordypi_cache_lookups_total                  hits/misses per cache (result_song, result_upload, audio)
+    chordypi_outbound_requests_total              outbound HTTP per host and status/error
+    chordypi_outbound_request_duration_seconds    outbound latency (to response headers) per host
+    chordypi_outbound_retries_total               outbound retries per host
+    chordypi_outbound_rate_limit_wait_seconds_total  time spent waiting on per-host rate limits
+    process_resident_memory_bytes and friends
+
+Values are per process - with several gunicorn workers each worker serves
+its own numbers.
+
+Configuration (environment variables):
+    METRICS_ENABLED   serve /metrics and record request metrics (default: true)
+"""
+
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = HTTP_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}   # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            all_series = {labels: list(series) for labels, series in self._series.items()}
+        inf = 'le="+Inf"'
+        for labels, series in sorted(all_series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_bucket{_labels(self.labelnames, labels, inf)} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}"
+
+
+class Gauge:
+    """Value read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Optional[float]],
+                 kind: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self._read = read
+
+    def samples(self) -> Iterable[str]:
+        value = self._read()
+        if value is not None:
+            yield f"{self.name} {_number(value)}"
+
+
+def _resident_memory_bytes() -> Optional[float]:
+    """Current RSS from /proc (Linux), else peak RSS from getrusage"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class MetricsRegistry:
+    """The app's metrics plus helpers for the places that record them"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.http_requests = Counter(
+            'chordypi_http_requests_total', 'HTTP requests by route, method and status',
+            ('route', 'method', 'status'))
+        self.http_latency = Histogram(
+            'chordypi_http_request_duration_seconds', 'HTTP request latency by route',
+            ('route', 'method'), HTTP_BUCKETS)
+        self.stage_latency = Histogram(
+            'chordypi_analysis_stage_duration_seconds', 'Time spent per analysis stage',
+            ('stage',), STAGE_BUCKETS)
+        self.stage_bytes = Counter(
+            'chordypi_analysis_stage_bytes_total', 'Bytes moved per analysis stage', ('stage',))
+        self.analyses = Counter(
+            'chordypi_analyses_total', 'Finished analyses by outcome', ('status',))
+        self.engines = Counter(
+            'chordypi_analysis_engine_total', 'Engine that produced the chords (reason: primary, fallback, hedge)',
+            ('engine', 'reason'))
+        self.queue_wait = Histogram(
+            'chordypi_analysis_queue_wait_seconds', 'Time analyses waited in the admission queue for a slot',
+            (), STAGE_BUCKETS)
+        self.downloads = Counter(
+            'chordypi_download_attempts_total', 'Audio download attempts by provider and outcome',
+            ('provider', 'outcome'))
+        self.cache_lookups = Counter(
+            'chordypi_cache_lookups_total',
+            'Cache lookups by cache (result_song, result_upload, audio) and outcome', ('cache', 'outcome'))
+        self.outbound_requests = Counter(
+            'chordypi_outbound_requests_total', 'Outbound HTTP requests by host and status or error',
+            ('host', 'outcome'))
+        self.outbound_latency = Histogram(
+            'chordypi_outbound_request_duration_seconds', 'Outbound HTTP latency to response headers by host',
+            ('host',), HTTP_BUCKETS)
+        self.outbound_retries = Counter(
+            'chordypi_outbound_retries_total', 'Outbound HTTP retries by host', ('host',))
+        self.outbound_wait = Counter(
+            'chordypi_outbound_rate_limit_wait_seconds_total', 'Seconds spent waiting on per-host rate limits',
+            ('host',))
+        self._metrics = [
+            self.http_requests, self.http_latency, self.stage_latency, self.stage_bytes,
+            self.analyses, self.engines, self.queue_wait, self.downloads, self.cache_lookups,
+            self.outbound_requests, self.outbound_latency, self.outbound_retries, self.outbound_wait,
+        ]
+        self._metrics.extend(self._scrape_time_gauges())
+
+    def _scrape_time_gauges(self):
+        def admission(key):
+            def read():
+                from services.admission_control import get_admission_controller
+                return get_admission_controller().stats()[key]
+            return read
+
+        def cache_hit_ratio():
+            from services.result_cache import get_result_cache
+            return get_result_cache().stats()['hit_ratio']
+
+        def coalesced():
+            from services.single_flight import get_single_flight
+            return get_single_flight().stats()['coalesced']
+
+        def audio_cache_bytes():
+            from services.audio_cache import get_audio_cache
+            return get_audio_cache().usage()
+
+        def scratch_bytes():
+            from services.scratch_space import get_scratch_space
+            return get_scratch_space().usage()
+
+        return [
+            Gauge('chordypi_analysis_queue_depth', 'Analyses waiting for a slot', admission('queue_depth')),
+            Gauge('chordypi_analysis_active', 'Analyses holding a slot', admission('active')),
+            Gauge('chordypi_analysis_rejected_total', 'Analyses turned away with 429',
+                  admission('rejected'), kind='counter'),
+            Gauge('chordypi_result_cache_hit_ratio', 'Result cache hits / lookups', cache_hit_ratio),
+            Gauge('chordypi_analysis_coalesced_total', 'Requests that shared an in-flight analysis',
+                  coalesced, kind='counter'),
+            Gauge('chordypi_scratch_used_bytes', 'Bytes in the scratch directory', scratch_bytes),
+            Gauge('chordypi_audio_cache_used_bytes', 'Bytes of decoded audio in the audio cache', audio_cache_bytes),
+            Gauge('process_resident_memory_bytes', 'Resident memory size in bytes', _resident_memory_bytes),
+            Gauge('process_cpu_seconds_total', 'User and system CPU time in seconds',
+                  lambda: sum(os.times()[:2]), kind='counter'),
+            Gauge('process_start_time_seconds', 'Start time of the process since the epoch',
+                  lambda: self.started),
+        ]
+
+    # -- recording helpers --------------------------------------------------
+
+    def observe_request(self, route: str, method: str, status: int, seconds: float):
+        self.http_requests.inc(route, method, str(status))
+        self.http_latency.observe(seconds, route, method)
+
+    def observe_timings(self, timings: Optional[Dict], status: str = 'ok'):
+        """Feed a StageTimings.to_dict() result into the stage metrics"""
+        self.analyses.inc(status)
+        for stage, entry in (timings or {}).items():
+            if stage == 'total':
+                continue
+            self.stage_latency.observe(entry['ms'] / 1000.0, stage)
+            if entry.get('bytes'):
+                self.stage_bytes.inc(stage, amount=entry['bytes'])
+
+    def engine_used(self, engine: str, reason: str = 'primary'):
+        self.engines.inc(engine, reason)
+
+    def queue_waited(self, seconds: float):
+        self.queue_wait.observe(seconds)
+
+    def download_attempt(self, provider: str, success: bool):
+        self.downloads.inc(provider, 'success' if success else 'failure')
+
+    def cache_lookup(self, cache: str, hit: bool):
+        self.cache_lookups.inc(cache, 'hit' if hit else 'miss')
+
+    def observe_outbound(self, host: str, outcome: str, seconds: float):
+        self.outbound_requests.inc(host, outcome)
+        self.outbound_latency.observe(seconds, host)
+
+    def outbound_retry(self, host: str):
+        self.outbound_retries.inc(host)
+
+    def outbound_throttled(self, host: str, seconds: float):
+        self.outbound_wait.inc(host, amount=seconds)
+
+    # -- exposition ---------------------------------------------------------
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                # A gauge's owner failed to report - skip it, keep the scrape alive
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+# Singleton instance
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get or create singleton instance"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry()
+    return _metrics
+
+
+def register_metrics(app):
+    """Time every request and serve the registry at /metrics"""
+    if os.getenv('METRICS_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return
+    from flask import Response, g, request
+
+    metrics = get_metrics()
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.monotonic()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            # The URL rule, not the path, so /api/analysis-jobs/<job_id> is one series
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.observe_request(route, request.method, response.status_code, time.monotonic() - started)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
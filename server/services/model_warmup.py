@@ -0,0 +1,142 @@
+"""
+Model Warmup
+Loads heavy analysis modules and the AI model off the request path
+
+Startup modes (STARTUP_MODE environment variable):
+    lazy   - (default) accept requests immediately, warm up in a background thread
+    eager  - warm up before the app finishes importing (old behaviour)
+    off    - no warmup, everything loads on first use
+
+Readiness is exposed through is_ready() so /api/ready can tell the load
+balancer when this instance can serve analysis at full speed.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+STARTUP_MODES = ('lazy', 'eager', 'off')
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_thread = None
+_status = {
+    'mode': None,
+    'state': 'pending',   # pending -> warming -> ready | failed
+    'started_at': None,
+    'finished_at': None,
+    'steps': {},
+    'error': None,
+}
+
+
+def get_startup_mode() -> str:
+    """Configured startup mode, 'lazy' if unset or unknown"""
+    mode = os.getenv('STARTUP_MODE', 'lazy').strip().lower()
+    return mode if mode in STARTUP_MODES else 'lazy'
+
+
+def _timed_step(name: str, fn):
+    """Run one warmup step, recording how long it took"""
+    start = time.monotonic()
+    try:
+        fn()
+        _status['steps'][name] = round(time.monotonic() - start, 3)
+    except ImportError as e:
+        # Optional dependency missing - the routes already fall back without it
+        _status['steps'][name] = f"skipped: {e}"
+        logger.warning(f"⚠️ Warmup step '{name}' skipped: {e}")
+
+
+def _import_audio_stack():
+    import numpy  # noqa: F401
+    import librosa  # noqa: F401
+
+
+def _import_downloader():
+    import yt_dlp  # noqa: F401
+
+
+def _load_ai_model():
+    from services.enhanced_chord_detection import get_enhanced_detector
+    detector = get_enhanced_detector()
+    if detector.available:
+        detector._get_model()
+
+
+def warmup_now() -> bool:
+    """
+    Run every warmup step in the calling thread
+    Returns True when the instance is ready
+    """
+    with _lock:
+        if _ready.is_set():
+            return True
+        _status['state'] = 'warming'
+        _status['started_at'] = time.time()
+
+    logger.info("🔥 Model warmup starting...")
+    try:
+        _timed_step('audio_stack', _import_audio_stack)
+        _timed_step('downloader', _import_downloader)
+        _timed_step('ai_model', _load_ai_model)
+        _status['state'] = 'ready'
+        logger.info(f"✅ Model warmup complete: {_status['steps']}")
+    except Exception as e:
+        # A failed warmup must not take the instance down; requests load on demand
+        _status['state'] = 'failed'
+        _status['error'] = str(e)
+        logger.error(f"❌ Model warmup failed: {e}")
+    finally:
+        _status['finished_at'] = time.time()
+        _ready.set()
+
+    return _status['state'] == 'ready'
+
+
+def start_background_warmup() -> threading.Thread:
+    """Start warmup in a daemon thread (idempotent)"""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=warmup_now, name='model-warmup', daemon=True)
+            _thread.start()
+    return _thread
+
+
+def start_warmup(mode: str = None):
+    """Apply the configured startup mode"""
+    mode = mode or get_startup_mode()
+    _status['mode'] = mode
+
+    if mode == 'eager':
+        warmup_now()
+    elif mode == 'lazy':
+        start_background_warmup()
+    else:
+        _status['state'] = 'ready'
+        _ready.set()
+
+
+def is_ready() -> bool:
+    """True once warmup has finished (successfully or not)"""
+    return _ready.is_set()
+
+
+def wait_until_ready(timeout: float = None) -> bool:
+    """Block until warmup has finished"""
+    return _ready.wait(timeout)
+
+
+def get_warmup_status() -> Dict:
+    """Snapshot of the warmup state for health endpoints"""
+    status = dict(_status)
+    status['steps'] = dict(_status['steps'])
+    status['ready'] = is_ready()
+    if status['started_at'] and status['finished_at']:
+        status['duration'] = round(status['finished_at'] - status['started_at'], 3)
+    return status
@@ -0,0 +1,162 @@
+"""
+RapidAPI Quota
+Local count of RapidAPI calls against the monthly allowance
+
+The free RapidAPI plan allows RAPIDAPI_MONTHLY_QUOTA requests a month.
+Once they are used up every request answers 429 - after a full round
+trip. Each call is counted in a small JSON file shared by the worker
+processes on the node and kept across restarts:
+
+    {"month": "2026-10", "used": 412, "limit": 500, "exhausted": false}
+
+The counter follows RapidAPI's own X-RateLimit-Requests-Limit/-Remaining
+headers whenever a response carries them, and a 429 that mentions the
+quota marks the month as exhausted. download_youtube_audio() skips
+RapidAPI while available() is False; the count starts over when the
+calendar month (UTC) changes.
+
+Configuration (environment variables):
+    RAPIDAPI_MONTHLY_QUOTA   requests allowed per month (default: 500, 0 disables tracking)
+    RAPIDAPI_QUOTA_FILE      counter file (default: <tmp>/chordypi-rapidapi-quota.json)
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows - the in-process lock only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def current_month() -> str:
+    return time.strftime('%Y-%m', time.gmtime())
+
+
+class RapidApiQuota:
+    """Persisted monthly request counter"""
+
+    def __init__(self, path: str, monthly_limit: int = 500):
+        self.path = os.path.abspath(path)
+        self.monthly_limit = monthly_limit
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.monthly_limit > 0
+
+    @contextmanager
+    def _locked(self):
+        """The counter file, locked against the other workers"""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.lock', 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self) -> Dict:
+        month = current_month()
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Resetting unreadable RapidAPI quota file {self.path}: {e}")
+            state = None
+        if not state or state.get('month') != month:
+            # A new month (or no file yet) starts from zero
+            state = {'month': month, 'used': 0, 'limit': self.monthly_limit, 'exhausted': False}
+        return state
+
+    def _write(self, state: Dict):
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp, self.path)
+
+    def available(self) -> bool:
+        """Whether this month's allowance has requests left"""
+        if not self.enabled:
+            return True
+        try:
+            with self._locked():
+                state = self._read()
+        except OSError as e:
+            logger.warning(f"Could not read the RapidAPI quota: {e}")
+            return True
+        return not state['exhausted'] and state['used'] < state['limit']
+
+    def record(self, status_code: Optional[int] = None, headers: Optional[Dict] = None, text: str = ''):
+        """Count one request, syncing with RapidAPI's rate-limit headers when present"""
+        if not self.enabled:
+            return
+        headers = headers or {}
+        try:
+            with self._locked():
+                state = self._read()
+                state['used'] += 1
+                limit = headers.get('X-RateLimit-Requests-Limit')
+                remaining = headers.get('X-RateLimit-Requests-Remaining')
+                if limit and str(limit).isdigit():
+                    state['limit'] = int(limit)
+                if remaining and str(remaining).isdigit():
+                    # RapidAPI's count wins - other deployments may share the key
+                    state['used'] = state['limit'] - int(remaining)
+                if status_code == 429 and 'quota' in (text or '').lower():
+                    state['exhausted'] = True
+                if state['exhausted'] or state['used'] >= state['limit']:
+                    logger.warning(f"📉 RapidAPI monthly quota used up ({state['used']}/{state['limit']}) - "
+                                   f"skipping RapidAPI until {state['month']} ends")
+                self._write(state)
+        except OSError as e:
+            logger.warning(f"Could not update the RapidAPI quota: {e}")
+
+    def stats(self) -> Dict:
+        if not self.enabled:
+            return {'enabled': False}
+        try:
+            with self._locked():
+                state = self._read()
+        except OSError as e:
+            return {'enabled': True, 'error': str(e)}
+        return {
+            'enabled': True,
+            'month': state['month'],
+            'used': state['used'],
+            'limit': state['limit'],
+            'remaining': max(0, state['limit'] - state['used']),
+            'exhausted': state['exhausted'] or state['used'] >= state['limit'],
+        }
+
+
+# Singleton instance
+_rapidapi_quota = None
+_rapidapi_quota_lock = threading.Lock()
+
+
+def get_rapidapi_quota() -> RapidApiQuota:
+    """Get or create singleton instance"""
+    global _rapidapi_quota
+    if _rapidapi_quota is None:
+        with _rapidapi_quota_lock:
+            if _rapidapi_quota is None:
+                _rapidapi_quota = RapidApiQuota(
+                    path=os.getenv('RAPIDAPI_QUOTA_FILE') or os.path.join(tempfile.gettempdir(),
+                                                                          'chordypi-rapidapi-quota.json'),
+                    monthly_limit=int(os.getenv('RAPIDAPI_MONTHLY_QUOTA', '500'))
+                )
+    return _rapidapi_quota
@@ -3,12 +3,13 @@ REAL Chord Detection System - Multi-Source Approach
 Uses multiple reliable sources to get accurate chord progressions
 """
 
-import requests
 import re
 import json
 from bs4 import BeautifulSoup
 from typing import Dict, List, Optional, Tuple
 
+from services.http_gateway import get_http_gateway
+
 class RealChordDetector:
     """
     Multi-source chord detection system that tries:
@@ -21,10 +22,12 @@ class RealChordDetector:
     
     def __init__(self):
         self.audiodb_api_key = "523532"  # Free tier API key
-        self.session = requests.Session()
-        self.session.headers.update({
+        # Pooled per host and rate limited (MusicBrainz: 1 request/s) by the gateway
+        self.http = get_http_gateway()
+        # Browser UA for the sites that block scripts; MusicBrainz gets the gateway's own
+        self.browser_headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        }
     
     def detect_chords(self, song_title: str, artist: str = None, youtube_url: str = None) -> Dict:
         """
@@ -74,7 +77,7 @@ class RealChordDetector:
             search_url = f"https://www.theaudiodb.com/api/v1/json/{self.audiodb_api_key}/searchtrack.php"
             params = {'s': artist, 't': song_title} if artist else {'t': song_title}
             
-            response = self.session.get(search_url, params=params, timeout=10)
+            response = self.http.get(search_url, params=params, headers=self.browser_headers, timeout=10)
             if response.status_code != 200:
                 return None
             
@@ -116,7 +119,7 @@ class RealChordDetector:
             search_query = f"{artist} {song_title}" if artist else song_title
             search_url = f"https://www.ultimate-guitar.com/search.php?search_type=title&value={search_query.replace(' ', '+')}"
             
-            response = self.session.get(search_url, timeout=10)
+            response = self.http.get(search_url, headers=self.browser_headers, timeout=10)
             if response.status_code != 200:
                 return None
             
@@ -134,7 +137,7 @@ class RealChordDetector:
                 return None
             
             # Fetch tab page
-            tab_response = self.session.get(tab_url, timeout=10)
+            tab_response = self.http.get(tab_url, headers=self.browser_headers, timeout=10)
             if tab_response.status_code != 200:
                 return None
             
@@ -170,7 +173,7 @@ class RealChordDetector:
                 'limit': 1
             }
             
-            response = self.session.get(search_url, params=params, timeout=10)
+            response = self.http.get(search_url, params=params, timeout=10)
             if response.status_code != 200:
                 return None
             
@@ -0,0 +1,86 @@
+"""
+Result Cache
+In-memory LRU cache of finished analysis results with a time-to-live
+
+Keys are content identities, e.g. "upload:<sha256>:<mode>" for uploaded
+files and "video:<id>:<mode>" for YouTube analyses, so repeating an analysis
+of the same audio skips download, decode and detection.
+
+Configuration (environment variables):
+    RESULT_CACHE_SIZE   maximum cached results (default: 256, 0 disables)
+    RESULT_CACHE_TTL    seconds a result stays valid (default: 21600)
+"""
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 21600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Cached value for key, or None (callers get their own copy)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def set(self, key: str, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# Singleton instance
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Get or create singleton instance"""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(
+                    max_entries=int(os.getenv('RESULT_CACHE_SIZE', '256')),
+                    ttl=float(os.getenv('RESULT_CACHE_TTL', '21600'))
+                )
+    return _result_cache
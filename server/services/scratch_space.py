@@ -0,0 +1,250 @@
+"""
+Scratch Space
+Per-job temp directories under one root, with a disk quota and an orphan sweeper
+
+Downloads, conversions and uploads each get their own directory below
+SCRATCH_DIR instead of a bare tempfile.mkdtemp(). Work that owns a directory
+uses it as a context manager so the directory is removed when the job ends,
+whether it succeeded, failed or timed out:
+
+    with get_scratch_space().job_dir('analysis') as job_dir:
+        audio, duration, title = download_youtube_audio(url, scratch_dir=job_dir)
+        ...
+
+New directories are refused (ScratchQuotaExceeded) while the root holds more
+than SCRATCH_QUOTA_MB. A daemon thread removes directories nobody owns any
+more (crashed workers, callers that never released) once they are older than
+SCRATCH_MAX_AGE, so a long-running instance does not slowly fill /tmp.
+
+Configuration (environment variables):
+    SCRATCH_DIR              root directory (default: <tmp>/chordypi-scratch)
+    SCRATCH_QUOTA_MB         total size of the root (default: 2048, 0 disables)
+    SCRATCH_MAX_AGE          seconds before an unowned directory is an orphan (default: 3600)
+    SCRATCH_SWEEP_INTERVAL   seconds between sweeps (default: 300, 0 disables the thread)
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ScratchQuotaExceeded(OSError):
+    """The scratch root is full - respond 507 rather than filling the disk"""
+
+    status_code = 507
+
+    def __init__(self, used: int, quota: int, requested: int = 0):
+        self.used = used
+        self.quota = quota
+        self.requested = requested
+        super().__init__(
+            f"Server scratch space is full ({used / 2**20:.0f} of {quota / 2**20:.0f} MB in use), please retry shortly"
+        )
+
+
+class ScratchDir:
+    """Context manager for one job directory - removed on exit"""
+
+    __slots__ = ('_space', '_prefix', '_parent', 'path')
+
+    def __init__(self, space: 'ScratchSpace', prefix: str, parent: Optional[str] = None):
+        self._space = space
+        self._prefix = prefix
+        self._parent = parent
+        self.path = None
+
+    def __enter__(self) -> str:
+        self.path = self._space.create_dir(self._prefix, parent=self._parent)
+        return self.path
+
+    def __exit__(self, exc_type, exc, tb):
+        self._space.release(self.path)
+        return False
+
+
+class ScratchSpace:
+    """Issues, tracks, measures and sweeps job directories under one root"""
+
+    def __init__(self, root: str, quota_bytes: int = 0, max_age: float = 3600, sweep_interval: float = 300):
+        self.root = os.path.abspath(root)
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._owned = set()           # directories this process is still using
+        self._thread = None
+        self._stop = threading.Event()
+        self.created = 0
+        self.released = 0
+        self.swept = 0
+        self.rejected = 0
+
+    # -- issuing ------------------------------------------------------------
+
+    def job_dir(self, prefix: str = 'job', parent: Optional[str] = None) -> ScratchDir:
+        """Directory for one job, removed when the with-block exits"""
+        return ScratchDir(self, prefix, parent)
+
+    def create_dir(self, prefix: str = 'job', parent: Optional[str] = None) -> str:
+        """
+        New directory the caller must release() (prefer job_dir())
+
+        parent: an existing job directory to nest under - the new directory
+        then goes away with its parent, e.g. a downloader working inside the
+        analysis job that called it.
+        """
+        if parent is None:
+            self.check_quota()
+            base = self.root
+        else:
+            base = parent
+        path = tempfile.mkdtemp(prefix=f"{prefix}_", dir=base)
+        with self._lock:
+            if parent is None:
+                self._owned.add(path)
+            self.created += 1
+        return path
+
+    def release(self, path: Optional[str]):
+        """Remove a directory issued by this manager (idempotent)"""
+        if not path:
+            return
+        path = os.path.abspath(path)
+        if os.path.commonpath([self.root, path]) != self.root or path == self.root:
+            logger.warning(f"🧹 Refusing to remove {path}: not inside {self.root}")
+            return
+        shutil.rmtree(path, ignore_errors=True)
+        with self._lock:
+            self._owned.discard(path)
+            self.released += 1
+
+    # -- quota --------------------------------------------------------------
+
+    def usage(self) -> int:
+        """Bytes currently stored under the root"""
+        total = 0
+        for dirpath, _dirnames, filenames in os.walk(self.root):
+            for name in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, name)).st_size
+                except OSError:
+                    # Removed while we were walking
+                    continue
+        return total
+
+    def available(self) -> Optional[int]:
+        """Bytes left under the quota (None when unlimited)"""
+        if not self.quota_bytes:
+            return None
+        return max(0, self.quota_bytes - self.usage())
+
+    def check_quota(self, requested: int = 0):
+        """Raise ScratchQuotaExceeded if `requested` more bytes would not fit"""
+        if not self.quota_bytes:
+            return
+        used = self.usage()
+        if used + requested > self.quota_bytes:
+            # Orphans may be holding the space - sweep once before refusing
+            self.sweep()
+            used = self.usage()
+        if used + requested > self.quota_bytes:
+            with self._lock:
+                self.rejected += 1
+            logger.warning(f"🧹 Scratch quota exceeded: {used} + {requested} > {self.quota_bytes} bytes")
+            raise ScratchQuotaExceeded(used, self.quota_bytes, requested)
+
+    # -- sweeping -----------------------------------------------------------
+
+    def sweep(self) -> int:
+        """Remove unowned entries older than max_age; returns how many went"""
+        cutoff = time.time() - self.max_age
+        removed = 0
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return 0
+        with self._lock:
+            owned = set(self._owned)
+        for entry in entries:
+            if entry.path in owned:
+                continue
+            try:
+                if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                    # Possibly another worker process's live job
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+                removed += 1
+            except OSError:
+                continue
+        if removed:
+            with self._lock:
+                self.swept += removed
+            logger.info(f"🧹 Swept {removed} orphaned scratch entries from {self.root}")
+        return removed
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"🧹 Scratch sweep failed: {e}")
+
+    def start_sweeper(self) -> Optional[threading.Thread]:
+        """Sweep now and then every sweep_interval in a daemon thread (idempotent)"""
+        if self.sweep_interval <= 0:
+            return None
+        with self._lock:
+            if self._thread is not None:
+                return self._thread
+            self._thread = threading.Thread(target=self._sweep_loop, name='scratch-sweeper', daemon=True)
+        # Leftovers from previous runs go straight away
+        self.sweep()
+        self._thread.start()
+        return self._thread
+
+    def stop_sweeper(self):
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        used = self.usage()
+        with self._lock:
+            return {
+                'root': self.root,
+                'used_bytes': used,
+                'quota_bytes': self.quota_bytes or None,
+                'owned_dirs': len(self._owned),
+                'created': self.created,
+                'released': self.released,
+                'swept': self.swept,
+                'rejected': self.rejected,
+            }
+
+
+# Singleton instance
+_scratch_space = None
+_scratch_space_lock = threading.Lock()
+
+
+def get_scratch_space() -> ScratchSpace:
+    """Get or create singleton instance"""
+    global _scratch_space
+    if _scratch_space is None:
+        with _scratch_space_lock:
+            if _scratch_space is None:
+                _scratch_space = ScratchSpace(
+                    os.getenv('SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'chordypi-scratch')),
+                    quota_bytes=int(float(os.getenv('SCRATCH_QUOTA_MB', '2048')) * 2**20),
+                    max_age=float(os.getenv('SCRATCH_MAX_AGE', '3600')),
+                    sweep_interval=float(os.getenv('SCRATCH_SWEEP_INTERVAL', '300'))
+                )
+    return _scratch_space
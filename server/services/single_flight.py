@@ -0,0 +1,251 @@
+"""
+Single Flight
+Coalesces concurrent identical work so it runs once and every caller shares the result
+
+When a song trends, many requests for the same video arrive together. The
+first caller for a key becomes the leader and does the work; callers that
+arrive while it is running wait on the same future and receive the same
+result (or exception).
+
+Two layers:
+    SingleFlight          threads within one worker process
+    FileLockSingleFlight  worker processes on one node - the leader holds an
+                          fcntl lock on <dir>/<key>.lock and publishes its
+                          result as JSON; other processes block on the lock
+                          and read the published result instead of redoing it
+
+Configuration (environment variables):
+    SINGLE_FLIGHT_DIR          lock/result directory shared by the node's workers
+                               (default: <tmp>/chordypi-single-flight)
+    SINGLE_FLIGHT_RESULT_TTL   seconds a published result is reused by late
+                               arrivals (default: 120)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows - only in-process coalescing
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """One in-progress call and the callers listening to it"""
+
+    __slots__ = ('future', 'listeners', 'followers')
+
+    def __init__(self):
+        self.future = Future()
+        self.listeners = []
+        self.followers = 0
+
+    def notify(self, *args, **kwargs):
+        """Forward a progress event from the leader to every listener"""
+        for listener in list(self.listeners):
+            try:
+                listener(*args, **kwargs)
+            except Exception as e:
+                logger.warning(f"⚠️ Single-flight listener failed: {e}")
+
+
+class SingleFlight:
+    """In-process request coalescing keyed by string"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable, listener: Optional[Callable] = None,
+           on_join: Optional[Callable] = None, timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Run fn(notify) once per key among concurrent callers
+
+        Args:
+            key: identity of the work (e.g. "video:<id>")
+            fn: the work; receives a notify(*args) callable that fans
+                progress events out to every caller's listener
+            listener: this caller's progress callback (optional)
+            on_join: called when this caller joins existing work instead of
+                     leading (e.g. to give back a reserved resource)
+            timeout: seconds a joining caller waits before the builtin
+                     TimeoutError (Future.result() raises its own class
+                     before Python 3.11)
+
+        Returns:
+            (result, shared) - shared is True when another caller did the work
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+            else:
+                flight.followers += 1
+                self.coalesced += 1
+            if listener:
+                flight.listeners.append(listener)
+
+        if not leader:
+            logger.info(f"🔗 Joined in-flight work for {key}")
+            if on_join:
+                on_join()
+            try:
+                return flight.future.result(timeout=timeout), True
+            except FutureTimeoutError:
+                raise TimeoutError(f"Timed out waiting for in-flight work for {key}") from None
+
+        try:
+            result = fn(flight.notify)
+            flight.future.set_result(result)
+        except BaseException as e:
+            flight.future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            if flight.followers:
+                logger.info(f"🔗 Shared result for {key} with {flight.followers} waiting request(s)")
+        return result, False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'in_flight': len(self._flights), 'coalesced': self.coalesced}
+
+
+class FileLockSingleFlight(SingleFlight):
+    """
+    Coalescing across the worker processes of one node
+
+    Threads are coalesced in-process first, so only one thread per process
+    ever waits on the file lock. Only successful, JSON-serializable results
+    are published; after a failure the next process simply tries itself.
+    """
+
+    def __init__(self, directory: str, result_ttl: float = 120):
+        super().__init__()
+        self.directory = directory
+        self.result_ttl = result_ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+        return (os.path.join(self.directory, f"{name}.lock"),
+                os.path.join(self.directory, f"{name}.json"))
+
+    def _read_published(self, result_path: str) -> Optional[Any]:
+        try:
+            if time.time() - os.path.getmtime(result_path) > self.result_ttl:
+                return None
+            with open(result_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _publish(self, result_path: str, result: Any):
+        from utils.json_provider import json_default
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(result, f, default=json_default)
+            os.replace(tmp_path, result_path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ Could not publish single-flight result: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _sweep(self):
+        """Remove expired results and lock files nobody holds"""
+        cutoff = time.time() - self.result_ttl
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                if name.endswith('.lock'):
+                    with open(path, 'a') as lock_file:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        os.remove(path)
+                elif name.endswith(('.json', '.tmp')):
+                    os.remove(path)
+            except OSError:
+                # Held by another process or already gone
+                continue
+
+    @staticmethod
+    def _lock_file(lock_file, timeout: Optional[float]):
+        """Exclusive flock, polling so a waiting process can give up after timeout"""
+        if timeout is None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return
+        give_up_at = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= give_up_at:
+                    raise TimeoutError("Timed out waiting for another worker's result")
+                time.sleep(0.1)
+
+    def do(self, key: str, fn: Callable, listener: Optional[Callable] = None,
+           on_join: Optional[Callable] = None, timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        if fcntl is None:
+            return super().do(key, fn, listener, on_join, timeout)
+
+        def across_processes(notify):
+            lock_path, result_path = self._paths(key)
+            with open(lock_path, 'a') as lock_file:
+                self._lock_file(lock_file, timeout)
+                try:
+                    # Another process may have finished while we waited on the lock
+                    published = self._read_published(result_path)
+                    if published is not None:
+                        logger.info(f"🔗 Reused result published by another worker for {key}")
+                        return published, True
+                    result = fn(notify)
+                    self._publish(result_path, result)
+                    return result, False
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    self._sweep()
+
+        (result, shared_across), shared = super().do(key, across_processes, listener, on_join, timeout)
+        return result, shared or shared_across
+
+
+# Singleton instance
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Get or create singleton instance"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = FileLockSingleFlight(
+                    os.getenv('SINGLE_FLIGHT_DIR', os.path.join(tempfile.gettempdir(), 'chordypi-single-flight')),
+                    result_ttl=float(os.getenv('SINGLE_FLIGHT_RESULT_TTL', '120'))
+                )
+    return _single_flight
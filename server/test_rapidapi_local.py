@@ -24,19 +24,21 @@ try:
     print(f"\n📹 Testing URL: {test_url}")
     print("🚀 Calling RapidAPI YouTube MP3 Downloader...\n")
     
-    audio_path, duration, title = download_youtube_audio_rapidapi(test_url)
+    audio, duration, title = download_youtube_audio_rapidapi(test_url)
     
     print("\n" + "=" * 80)
     print("✅ SUCCESS! RapidAPI Integration Works!")
     print("=" * 80)
-    print(f"📁 Audio Path: {audio_path}")
+    print(f"📁 Audio: {audio}")
     print(f"⏱️  Duration: {duration} seconds")
     print(f"🎵 Title: {title}")
     print("=" * 80)
     
-    # Check if file exists
-    if audio_path and os.path.exists(audio_path):
-        file_size = os.path.getsize(audio_path) / (1024 * 1024)  # MB
+    # Decoded while downloading (ffmpeg installed) or saved as a file
+    if audio is not None and not isinstance(audio, str):
+        print(f"✅ Audio decoded while downloading: {audio}")
+    elif audio and os.path.exists(audio):
+        file_size = os.path.getsize(audio) / (1024 * 1024)  # MB
         print(f"✅ File downloaded successfully! Size: {file_size:.2f} MB")
     else:
         print("❌ File doesn't exist at the returned path")
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from routes.analysis import analysis_bp
+from services import admission_control
+from services.admission_control import AdmissionController, AdmissionRejected
+
+
+def test_slots_cap_concurrent_work():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    first = controller.enter()
+    first.acquire()
+    second = controller.enter()
+    assert controller.stats()['active'] == 1 and controller.stats()['queue_depth'] == 1
+
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: (second.acquire(timeout=5), acquired.set()))
+    waiter.start()
+    assert not acquired.wait(0.05)
+    first.release()
+    assert acquired.wait(5)
+    waiter.join(5)
+    assert second.state == 'running' and controller.stats()['active'] == 1
+    second.release()
+    assert controller.stats()['active'] == 0
+
+
+def test_full_queue_rejects_with_retry_after():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    controller.enter().acquire()
+    controller.enter()
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.enter()
+    assert rejected.value.status_code == 429 and rejected.value.retry_after >= 1
+    assert controller.stats()['rejected'] == 1
+
+
+def test_queue_timeout_gives_the_place_back():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.05)
+    controller.enter().acquire()
+    waiting = controller.enter()
+    with pytest.raises(AdmissionRejected):
+        waiting.acquire()
+    assert waiting.state == 'released'
+    assert controller.stats()['queue_depth'] == 0 and controller.stats()['timed_out'] == 1
+
+
+def test_double_release_is_harmless():
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    ticket = controller.enter()
+    ticket.acquire()
+    ticket.release()
+    ticket.release()
+    assert controller.stats()['active'] == 0
+
+    # A queued ticket that leaves twice frees its place once
+    queued = controller.enter()
+    queued.release()
+    queued.release()
+    assert controller.stats()['queue_depth'] == 0
+    with controller.admit():
+        assert controller.stats()['active'] == 1
+
+
+def test_busy_route_answers_429_with_retry_after(monkeypatch):
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    controller._service_time = 12.0
+    controller.enter().acquire()
+    monkeypatch.setattr(admission_control, '_admission_controller', controller)
+
+    app = Flask(__name__)
+    app.register_blueprint(analysis_bp)
+    response = app.test_client().post('/api/analyze-song', json={'song_name': 'Wonderwall'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '12'
+    assert response.get_json()['retry_after'] == 12
+
+
+def test_wait_time_is_observed_on_acquire():
+    from services.metrics import get_metrics
+
+    histogram = get_metrics().queue_wait
+    before = histogram._series.get((), [0.0, 0])[-1]
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    holder = controller.enter()
+    holder.acquire()
+    waiting = controller.enter()
+    threading.Timer(0.05, holder.release).start()
+    started = time.monotonic()
+    waiting.acquire(timeout=5)
+    assert time.monotonic() - started >= 0.04
+    assert histogram._series[()][-1] == before + 2
@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+
+from utils.chord_segment import ChordSegment
+from utils.chord_wire_format import encode_result, requested_format, to_columnar
+
+
+def _decode(encoded):
+    """The client-side decoding documented in utils/chord_wire_format.py"""
+    fields = [field for field in encoded if field not in ('format', 'count', 'names')]
+    segments = []
+    for i in range(encoded['count']):
+        segment = {field: encoded[field][i] for field in fields}
+        segment['chord'] = encoded['names'][segment['chord']]
+        segments.append(segment)
+    return segments
+
+
+def test_columnar_round_trips_segments():
+    chords = [
+        ChordSegment('Em', time=np.float32(0.0), duration=2.0, confidence=np.float64(0.91234), beat=1),
+        {'chord': 'G', 'time': 2.0, 'duration': 1.5, 'confidence': 0.8, 'beat': 2},
+        ChordSegment('Em', time=3.5, duration=2.0004, confidence=0.7, beat=3),
+    ]
+    encoded = to_columnar(chords)
+    assert encoded['names'] == ['Em', 'G'] and encoded['chord'] == [0, 1, 0]
+    assert 'notes' not in encoded and 'intervals' not in encoded
+    # numpy scalars become JSON numbers, floats keep 1 ms precision
+    json.dumps(encoded)
+    assert encoded['confidence'][0] == 0.912 and encoded['duration'][2] == 2.0
+
+    decoded = _decode(encoded)
+    assert [segment['chord'] for segment in decoded] == ['Em', 'G', 'Em']
+    assert decoded[1]['time'] == 2.0 and decoded[2]['beat'] == 3
+
+
+def test_list_fields_only_when_some_segment_has_them():
+    encoded = to_columnar([
+        {'chord': 'C', 'time': 0.0, 'notes': [np.int64(60), 64, 67]},
+        {'chord': None, 'time': 1.0},
+    ])
+    assert encoded['notes'] == [[60, 64, 67], None]
+    assert encoded['names'] == ['C', 'N']
+    assert encoded['measure'] == [None, None]
+
+
+def test_requested_format_and_encode_result():
+    assert requested_format({'format': ' Columnar '}) == 'columnar'
+    assert requested_format({'format': 'xml'}, None, {'format': 'segments'}) == 'segments'
+    assert requested_format() == 'segments'
+
+    body = {'status': 'success', 'chords': [{'chord': 'A', 'time': 0.0}]}
+    assert encode_result(body, 'segments') is body
+    encoded = encode_result(body, 'columnar')
+    assert encoded['chords']['format'] == 'columnar' and body['chords'][0]['chord'] == 'A'
+    assert encode_result({'status': 'error'}, 'columnar') == {'status': 'error'}
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+import utils.audio_processor as audio_processor
+from services import circuit_breaker
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from utils.deadline import NO_DEADLINE
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, '_breakers', {})
+    monkeypatch.setenv('BREAKER_MIN_CALLS', '2')
+    monkeypatch.setenv('AUDIO_CACHE_MB', '0')
+
+
+def test_opens_on_failure_rate_and_probes_once():
+    breaker = CircuitBreaker('provider', min_calls=2, failure_rate=0.5, open_seconds=0.05)
+    breaker.record(False)
+    assert breaker.state == CLOSED
+    breaker.record(False)
+    assert breaker.state == OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+
+
+def test_released_probe_lets_the_next_one_through():
+    breaker = CircuitBreaker('provider', min_calls=1, open_seconds=0)
+    breaker.record(False)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_local_refusals_are_not_provider_failures(monkeypatch):
+    monkeypatch.setenv('RAPIDAPI_KEY', 'test-key')
+    calls = []
+
+    def provider(*args):
+        calls.append(args)
+        return None, 0, "Invalid URL"
+
+    guarded = audio_processor._guarded('rapidapi', provider, audio_processor._rapidapi_unavailable)
+    for _ in range(4):
+        audio, _, reason = guarded('ytsearch:some song', None, None, NO_DEADLINE, None)
+        assert audio is None and reason == "RapidAPI needs a YouTube video URL"
+
+    assert not calls
+    stats = circuit_breaker.get_breaker('rapidapi').stats()
+    assert stats['state'] == CLOSED and stats['window_calls'] == 0
+
+
+def test_song_searches_leave_the_rapidapi_breaker_closed(monkeypatch):
+    monkeypatch.setenv('RAPIDAPI_KEY', 'test-key')
+    monkeypatch.setattr(audio_processor, '_download_with_ytdlp',
+                        lambda *args, **kwargs: (None, 0, "YouTube bot detection"))
+    for _ in range(4):
+        audio_processor.download_youtube_audio('ytsearch:some song')
+
+    assert circuit_breaker.get_breaker('rapidapi').state == CLOSED
+    assert circuit_breaker.get_breaker('yt_dlp').state == OPEN
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from utils.deadline import NO_DEADLINE, Deadline, DeadlineExceeded
+
+
+def test_budget_runs_out():
+    deadline = Deadline(0.05)
+    deadline.check('download')
+    assert 0 < deadline.remaining() <= 0.05
+    time.sleep(0.06)
+    assert deadline.expired() and deadline.remaining() == 0.0
+    with pytest.raises(DeadlineExceeded) as exceeded:
+        deadline.check('download')
+    assert exceeded.value.stage == 'download' and not exceeded.value.cancelled
+    assert isinstance(exceeded.value, TimeoutError)
+
+
+def test_timeout_is_capped_by_the_remaining_budget():
+    deadline = Deadline(10)
+    assert deadline.timeout('download', cap=2) == 2
+    assert 9 < deadline.timeout('download') <= 10
+    assert NO_DEADLINE.timeout('download', cap=30) == 30
+    assert NO_DEADLINE.timeout('download') is None and not NO_DEADLINE.expired()
+
+
+def test_cancelling_a_parent_cancels_its_children():
+    parent = Deadline(60)
+    losing, winning = parent.child(), parent.child()
+    assert losing.expires_at == parent.expires_at and losing.budget == 60
+
+    losing.cancel()
+    with pytest.raises(DeadlineExceeded) as exceeded:
+        losing.check('detect')
+    assert exceeded.value.cancelled
+    winning.check('detect')
+    parent.check('detect')
+
+    parent.cancel()
+    assert winning.cancelled and winning.expired()
+
+
+def test_from_request_is_capped_by_the_server_limit(monkeypatch):
+    monkeypatch.setenv('ANALYSIS_DEADLINE_SECONDS', '120')
+    assert Deadline.from_request().budget == 120
+    assert Deadline.from_request(30).budget == 30
+    assert Deadline.from_request(600).budget == 120
+    assert Deadline.from_request('soon').budget == 120
+
+    monkeypatch.setenv('ANALYSIS_DEADLINE_SECONDS', '0')
+    assert Deadline.from_request().remaining() is None
+    assert Deadline.from_request(45).budget == 45
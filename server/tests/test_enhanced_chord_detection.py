@@ -0,0 +1,22 @@
+from services.enhanced_chord_detection import EnhancedChordDetector
+
+# basic-pitch 0.4 note events: (start_s, end_s, pitch_midi, amplitude, pitch_bends)
+NOTE_EVENTS = [
+    (0.0, 1.9, 60, 0.8, None), (0.01, 1.9, 64, 0.7, [1, 0]), (0.02, 1.9, 67, 0.7, None),
+    (2.0, 3.9, 57, 0.8, None), (2.0, 3.9, 60, 0.8, None), (2.01, 3.9, 64, 0.9, None),
+]
+
+
+def test_tuple_note_events_become_chords():
+    chords = EnhancedChordDetector()._notes_to_chords(NOTE_EVENTS, verbose=False)
+    assert [(chord['chord'], chord['time']) for chord in chords] == [('C', 0.0), ('Am', 2.0)]
+    assert chords[0]['duration'] == 1.9
+
+
+def test_duration_limit_and_dict_records():
+    records = [
+        {'start_time': start, 'end_time': end, 'pitch_midi': pitch, 'amplitude': amplitude}
+        for start, end, pitch, amplitude, _ in NOTE_EVENTS
+    ]
+    chords = EnhancedChordDetector()._notes_to_chords(records, duration_limit=1.0, verbose=False)
+    assert [chord['chord'] for chord in chords] == ['C']
@@ -0,0 +1,64 @@
+import os
+import time
+
+import pytest
+
+from services.scratch_space import ScratchQuotaExceeded, ScratchSpace
+
+
+@pytest.fixture
+def space(tmp_path):
+    return ScratchSpace(str(tmp_path / 'scratch'), quota_bytes=1024, max_age=60, sweep_interval=0)
+
+
+def _fill(directory, size, name='audio.wav'):
+    with open(os.path.join(directory, name), 'wb') as f:
+        f.write(b'\0' * size)
+
+
+def test_job_dir_is_removed_on_exit_even_after_errors(space):
+    with pytest.raises(RuntimeError):
+        with space.job_dir('analysis') as job_dir:
+            nested = space.create_dir('download', parent=job_dir)
+            _fill(nested, 100)
+            raise RuntimeError("analysis failed")
+    assert not os.path.exists(job_dir)
+    assert space.usage() == 0 and space.stats()['owned_dirs'] == 0
+
+
+def test_quota_refuses_new_dirs_when_full(space):
+    with space.job_dir() as job_dir:
+        _fill(job_dir, 1000)
+        space.check_quota(24)
+        with pytest.raises(ScratchQuotaExceeded) as exceeded:
+            space.check_quota(25)
+        assert exceeded.value.status_code == 507
+        _fill(job_dir, 100, 'more.wav')
+        with pytest.raises(ScratchQuotaExceeded):
+            space.create_dir()
+    assert space.stats()['rejected'] == 2
+    space.create_dir()
+
+
+def test_sweep_removes_old_orphans_only(space):
+    owned = space.create_dir('live')
+    orphan = os.path.join(space.root, 'crashed_job')
+    recent = os.path.join(space.root, 'other_worker_job')
+    os.makedirs(orphan)
+    os.makedirs(recent)
+    old = time.time() - 120
+    os.utime(orphan, (old, old))
+    os.utime(owned, (old, old))
+
+    assert space.sweep() == 1
+    assert not os.path.exists(orphan)
+    assert os.path.exists(owned) and os.path.exists(recent)
+
+
+def test_release_stays_inside_the_root(space, tmp_path):
+    outside = tmp_path / 'keep'
+    outside.mkdir()
+    space.release(str(outside))
+    space.release(space.root)
+    space.release(None)
+    assert outside.exists() and os.path.exists(space.root)
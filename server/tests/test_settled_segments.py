@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('librosa')
+
+from utils.chord_analyzer import ChromaChordScanner  # noqa: E402
+
+SR = 22050
+HOP = 512
+
+
+def _chroma(seed, frames=2600):
+    """Random triads held for 10-200 frames each, with noise"""
+    rng = np.random.default_rng(seed)
+    chroma = np.zeros((12, frames), np.float32)
+    t = 0
+    while t < frames:
+        n = int(rng.integers(10, 200))
+        root = rng.integers(12)
+        template = rng.random(12) * 0.3
+        template[[root, (root + 4) % 12, (root + 7) % 12]] += 1
+        chroma[:, t:t + n] = template[:, None] + rng.random((12, min(n, frames - t))) * 0.4
+        t += n
+    return chroma
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_settled_segments_are_a_prefix_of_the_final_result(seed):
+    chroma = _chroma(seed)
+    scanner = ChromaChordScanner(SR, chroma.shape[1] / (SR / HOP))
+    snapshots = []
+    for end in range(200, chroma.shape[1], 200):
+        scanner.scan(chroma[:, :end])
+        snapshots.append([dict(segment) for segment in scanner.settled_segments()])
+    final = [{k: v for k, v in dict(segment).items() if k != '_metadata'} for segment in scanner.finish()]
+
+    for settled in snapshots:
+        assert final[:len(settled)] == settled
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from services import single_flight
+from services.analysis_pipeline import AnalysisError, analyze_song_coalesced, coalesce_key
+from services.single_flight import FileLockSingleFlight, SingleFlight
+from utils.deadline import Deadline
+
+
+@pytest.fixture
+def held_flight(monkeypatch):
+    """A SingleFlight whose leader for a key runs until the test lets it go"""
+    flights = SingleFlight()
+    monkeypatch.setattr(single_flight, '_single_flight', flights)
+    release = threading.Event()
+    leaders = []
+
+    def hold(key):
+        started = threading.Event()
+
+        def work(notify):
+            started.set()
+            release.wait(5)
+            return {'chords': []}
+
+        leader = threading.Thread(target=flights.do, args=(key, work))
+        leader.start()
+        leaders.append(leader)
+        assert started.wait(5)
+
+    yield flights, hold
+    release.set()
+    for leader in leaders:
+        leader.join(5)
+
+
+def test_concurrent_callers_share_one_run_and_its_progress():
+    flights = SingleFlight()
+    release = threading.Event()
+    runs, events, joined, results = [], [], [], []
+
+    def work(notify):
+        runs.append(1)
+        release.wait(5)
+        notify('detect', 'done')
+        return {'chords': ['Em']}
+
+    leader = threading.Thread(target=lambda: results.append(flights.do('video:abc', work)))
+    leader.start()
+    while not flights.stats()['in_flight']:
+        time.sleep(0.001)
+    follower = threading.Thread(target=lambda: results.append(flights.do(
+        'video:abc', work, listener=lambda *event: events.append(event), on_join=lambda: joined.append(1))))
+    follower.start()
+    while not flights.stats()['coalesced']:
+        time.sleep(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(runs) == 1 and joined == [1]
+    assert events == [('detect', 'done')]
+    assert sorted(shared for _, shared in results) == [False, True]
+    assert all(result == {'chords': ['Em']} for result, _ in results)
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_joiners_receive_the_leaders_error():
+    flights = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def failing(notify):
+        release.wait(5)
+        raise ValueError("no audio")
+
+    def call():
+        try:
+            flights.do('video:abc', failing)
+        except ValueError as e:
+            errors.append(e)
+
+    callers = [threading.Thread(target=call) for _ in range(3)]
+    callers[0].start()
+    while not flights.stats()['in_flight']:
+        time.sleep(0.001)
+    for caller in callers[1:]:
+        caller.start()
+    while flights.stats()['coalesced'] < 2:
+        time.sleep(0.001)
+    release.set()
+    for caller in callers:
+        caller.join(5)
+    assert len(errors) == 3 and len({id(e) for e in errors}) == 1
+
+    # Nothing is remembered after the flight lands
+    assert flights.do('video:abc', lambda notify: 'ok') == ('ok', False)
+
+
+@pytest.mark.skipif(single_flight.fcntl is None, reason="cross-process coalescing needs fcntl")
+def test_published_result_is_reused_by_other_workers(tmp_path):
+    first = FileLockSingleFlight(str(tmp_path))
+    second = FileLockSingleFlight(str(tmp_path))
+    assert first.do('video:abc', lambda notify: {'chords': ['G']}) == ({'chords': ['G']}, False)
+    result, shared = second.do('video:abc', lambda notify: pytest.fail("already published"))
+    assert result == {'chords': ['G']} and shared
+
+
+def test_joiner_timeout_is_the_builtin_timeout_error(held_flight):
+    flights, hold = held_flight
+    hold('video:abc')
+    with pytest.raises(TimeoutError):
+        flights.do('video:abc', lambda notify: pytest.fail("joiner must not run the work"), timeout=0.05)
+    assert flights.stats()['coalesced'] == 1
+
+
+def test_joiner_timeout_becomes_a_504(held_flight):
+    _, hold = held_flight
+    url = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+    hold(coalesce_key(None, url))
+    with pytest.raises(AnalysisError) as raised:
+        analyze_song_coalesced(None, url, deadline=Deadline(0.05))
+    assert raised.value.status_code == 504
+    assert raised.value.payload['timed_out'] and raised.value.payload['stage'] == 'detect'
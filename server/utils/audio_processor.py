@@ -13,9 +13,20 @@ print("🔥 AUDIO_PROCESSOR.PY LOADED - VERSION 2 WITH RAPIDAPI DEBUG")
 print("=" * 80)
 
 import os
-import tempfile
 import subprocess
-import yt_dlp
+import time
+from functools import partial
+
+from services.audio_cache import get_audio_cache
+from services.circuit_breaker import get_breaker
+from services.metrics import get_metrics
+from services.rapidapi_quota import get_rapidapi_quota
+from services.scratch_space import ScratchQuotaExceeded, get_scratch_space
+from utils.audio_signal import AudioSignal
+from utils.audio_stream import (CHUNK_SIZE, StreamTransfer, decode_stream, ffmpeg_available,
+                                iter_ranged, partial_size)
+from utils.deadline import NO_DEADLINE, DeadlineExceeded
+from utils.stage_timings import record_stage, timed_stage
 
 def convert_audio_format(input_file, output_format='wav'):
     """Convert audio file to the specified format using ffmpeg."""
@@ -31,15 +42,64 @@ def convert_audio_format(input_file, output_format='wav'):
         print(f"Error converting audio format: {e}")
         return None
 
-def download_youtube_audio(url):
+def _cached_audio(video_id, offset=0.0, max_duration=None):
+    """(signal, duration, title) decoded for an earlier analysis of this video, or None"""
+    cache = get_audio_cache()
+    if not video_id or not cache.enabled:
+        return None
+    with timed_stage('audio_cache') as stage:
+        cached = cache.get(video_id, offset, max_duration)
+        if cached:
+            stage.bytes = cached[0].nbytes
+    get_metrics().cache_lookup('audio', cached is not None)
+    if cached:
+        print(f"💾 Audio cache hit for {video_id}: {cached[0]}")
+    return cached
+
+def _remember(video_id, audio, duration, title):
+    """Keep a decoded download in the audio cache for the next analysis of this video"""
+    if isinstance(audio, AudioSignal) and get_audio_cache().put(video_id, audio, duration, title):
+        print(f"💾 Cached decoded audio for {video_id}")
+
+def download_youtube_audio(url, progress_callback=None, deadline=None, scratch_dir=None,
+                           offset=0.0, max_duration=None):
     """
-    Download audio from YouTube URL and return audio path, duration, and title.
+    Download audio from YouTube URL and return audio, duration, and title.
+    
+    audio is an AudioSignal when it came from the audio cache
+    (services/audio_cache.py) or the download was piped through ffmpeg
+    (utils/audio_stream.py) - the usual case - or the path of the downloaded
+    file when ffmpeg is not installed.
+    
+    progress_callback, if given, is called with the downloaded fraction (0.0-1.0)
+    when the provider reports progress.
+    
+    deadline (utils.deadline.Deadline) bounds network timeouts and the ffmpeg
+    decode; DeadlineExceeded is raised (after cleaning up) when it runs out.
+    
+    scratch_dir is the caller's job directory (services/scratch_space.py);
+    a file download lands in a subdirectory of it and is removed with it.
+    Without one, the caller must release the returned file's directory itself.
+    
+    offset/max_duration limit the download to the part that will be analyzed:
+    yt-dlp fetches only that range, ffmpeg decodes only that range and streamed
+    HTTP bodies are closed once ffmpeg has enough. A returned signal starts at
+    offset (AudioSignal.offset); duration is still the whole song's.
     
     Priority order:
+    0. Audio cache - audio decoded for an earlier analysis of this video
     1. RapidAPI YouTube MP3 Downloader (100% reliable, no IP blocking)
     2. yt-dlp with proxy (if configured)
     3. yt-dlp direct connection (fallback)
     
+    With DOWNLOAD_MODE=race the providers are hedged instead of tried one
+    after the other (utils/download_race.py): yt-dlp starts too when RapidAPI
+    has not delivered any audio within DOWNLOAD_HEDGE_DELAY seconds.
+    
+    A provider whose circuit breaker is open (services/circuit_breaker.py),
+    or RapidAPI once the monthly quota is used up (services/rapidapi_quota.py),
+    is skipped without a network call.
+    
     NOTE: This only downloads AUDIO for chord analysis.
     The YouTube video player still works normally for playback!
     """
@@ -47,8 +107,81 @@ def download_youtube_audio(url):
     print(f"=" * 80)
     print(f"🎵 DOWNLOAD_YOUTUBE_AUDIO called for: {url}")
     print(f"=" * 80)
+    deadline = deadline or NO_DEADLINE
+    
+    # STEP 0: Audio decoded for an earlier analysis (no download, no quota)
+    from utils.youtube_api_downloader import extract_video_id
+    video_id = extract_video_id(url) if url.startswith(('http://', 'https://')) else None
+    cached = _cached_audio(video_id, offset, max_duration)
+    if cached:
+        return cached
+    
+    from utils.download_race import get_download_mode, race_downloads
+    rapidapi = partial(_download_with_rapidapi, offset=offset, max_duration=max_duration)
+    ytdlp = partial(_download_with_ytdlp, offset=offset, max_duration=max_duration)
+    providers = [
+        ('rapidapi', _guarded('rapidapi', rapidapi, _rapidapi_unavailable)),
+        ('yt_dlp', _guarded('yt_dlp', ytdlp)),
+    ]
+    if get_download_mode() == 'race' and os.getenv('RAPIDAPI_KEY'):
+        return race_downloads(providers, url, video_id, progress_callback, deadline, scratch_dir)
     
-    # STEP 1: Try RapidAPI YouTube Downloader (BEST METHOD)
+    for _, provider in providers:
+        audio, duration, title = provider(url, video_id, progress_callback, deadline, scratch_dir)
+        if downloaded(audio):
+            break
+    return audio, duration, title
+
+def _rapidapi_unavailable(video_id):
+    """Why RapidAPI cannot be used for this request, or None"""
+    if not os.getenv('RAPIDAPI_KEY'):
+        print("💡 Add RAPIDAPI_KEY to Render for 500 free downloads/month")
+        return "API key not configured"
+    if not video_id:
+        # Searches (ytsearch:...) resolve to a video only inside yt-dlp
+        return "RapidAPI needs a YouTube video URL"
+    if not get_rapidapi_quota().available():
+        return "RapidAPI monthly quota used up"
+    return None
+
+def _guarded(name, provider, unavailable=None):
+    """
+    provider behind its circuit breaker; skipped instantly while the breaker is open
+    unavailable(video_id) names requests the provider cannot take (no key, no
+    video ID, quota used up) - they are refused locally and not held against it.
+    """
+    def run(url, video_id, progress_callback, deadline, scratch_dir, on_first_bytes=None):
+        reason = unavailable(video_id) if unavailable else None
+        breaker = get_breaker(name)
+        if reason is None and not breaker.allow():
+            reason = f"{name} skipped after repeated failures (retry in {breaker.retry_in():.0f}s)"
+        if reason:
+            print(f"⚡ Skipping {name}: {reason}")
+            return None, 0, reason
+        try:
+            result = provider(url, video_id, progress_callback, deadline, scratch_dir, on_first_bytes)
+        except DeadlineExceeded as e:
+            if e.cancelled:
+                # Lost a download race - says nothing about the provider
+                breaker.release()
+            else:
+                breaker.record(False)
+            raise
+        except BaseException:
+            # Local trouble (e.g. scratch quota), not the provider's
+            breaker.release()
+            raise
+        breaker.record(downloaded(result[0]))
+        return result
+    return run
+
+def downloaded(audio):
+    """True for a provider result that holds audio (a signal or an existing file)"""
+    return isinstance(audio, AudioSignal) or bool(audio and os.path.exists(audio))
+
+def _download_with_rapidapi(url, video_id, progress_callback, deadline, scratch_dir, on_first_bytes=None,
+                            offset=0.0, max_duration=None):
+    """STEP 1: RapidAPI YouTube MP3 Downloader; (None, 0, reason) when it cannot help"""
     print("📋 STEP 1: Checking RapidAPI YouTube Downloader...")
     try:
         print("   🔍 Attempting to import youtube_api_downloader...")
@@ -64,28 +197,50 @@ def download_youtube_audio(url):
             print("   ✅ 100% reliable, no IP blocking")
             print("   ✅ 500 free downloads/month")
             
-            audio_path, duration, title = download_youtube_audio_rapidapi(url)
+            audio, duration, title = download_youtube_audio_rapidapi(
+                url, deadline=deadline, scratch_dir=scratch_dir, progress_callback=progress_callback,
+                on_first_bytes=on_first_bytes, offset=offset, max_duration=max_duration
+            )
             
-            if audio_path and os.path.exists(audio_path):
+            if downloaded(audio):
                 print(f"✅ SUCCESS with RapidAPI!")
-                return audio_path, duration, title
+                get_metrics().download_attempt('rapidapi', True)
+                _remember(video_id, audio, duration, title)
+                return audio, duration, title
             else:
+                get_metrics().download_attempt('rapidapi', False)
                 print(f"⚠️ RapidAPI failed, trying fallback methods...")
+                return None, 0, title
         else:
             print("   ❌ RAPIDAPI_KEY not found in environment variables")
             print("⚠️ RAPIDAPI_KEY not set - skipping RapidAPI method")
             print("💡 Add RAPIDAPI_KEY to Render for 500 free downloads/month")
+            return None, 0, "API key not configured"
             
+    except (DeadlineExceeded, ScratchQuotaExceeded) as e:
+        if not getattr(e, 'cancelled', False):
+            # A hedged race cancelling the loser is not a provider failure
+            get_metrics().download_attempt('rapidapi', False)
+        raise
     except ImportError as e:
         print(f"❌ RapidAPI downloader IMPORT FAILED: {e}")
         print(f"   Import error type: {type(e).__name__}")
+        return None, 0, f"Error: {str(e)}"
     except Exception as e:
+        get_metrics().download_attempt('rapidapi', False)
         print(f"❌ RapidAPI error: {e}")
         print(f"   Error type: {type(e).__name__}")
         print(f"   Falling back to yt-dlp...")
-    
-    # STEP 2: Try yt-dlp (with or without proxy)
+        return None, 0, f"Error: {str(e)}"
+
+def _download_with_ytdlp(url, video_id, progress_callback, deadline, scratch_dir, on_first_bytes=None,
+                         offset=0.0, max_duration=None):
+    """STEP 2: yt-dlp (with or without proxy); (None, 0, reason) on failure"""
+    scratch = get_scratch_space()
+    temp_dir = None
     try:
+        deadline.check('download')
+        
         # Import proxy configuration
         try:
             from config.proxy_config import ProxyConfig
@@ -102,94 +257,145 @@ def download_youtube_audio(url):
             print(f"⚠️ Proxy config not found - using direct connection")
             proxy_url = None
         
-        # Create temporary directory for download
-        temp_dir = tempfile.mkdtemp()
+        # Scratch directory for the download (inside the caller's job directory)
+        temp_dir = scratch.create_dir('ytdlp', parent=scratch_dir)
         print(f"🔧 Created temp dir: {temp_dir}")
         
-        ydl_opts = {
-            'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best[height<=480]/worst',
-            'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'wav',
-                'preferredquality': '96',
-            }],
-            'quiet': True,
-            'no_warnings': True,
-            'http_chunk_size': 10485760,  # 10MB chunks
-            'socket_timeout': 30,
-            'retries': 5,
-            'fragment_retries': 5,
-            'extractor_retries': 5,
-            'sleep_interval': 0.5,
-            'max_sleep_interval': 2,
-            'ignoreerrors': True,
-            'age_limit': None,
-            'cookiefile': None,
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'skip_unavailable_fragments': True,
-            'abort_on_unavailable_fragment': False,
-            'keep_fragments': False,
-            'headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'en-us,en;q=0.5',
-                'Accept-Encoding': 'gzip, deflate',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            },
-            'extractor_args': {
-                'youtube': {
-                    'skip': ['hls', 'dash'],
-                    'player_client': ['android', 'web'],
-                    'player_skip': ['configs'],
-                }
-            }
-        }
-        
-        # Add proxy if configured
+        # Bytes downloaded, for the stage timings
+        transfer = {'bytes': None}
+        
+        def report_progress(d):
+            # Raising here aborts the transfer as soon as the budget is spent
+            deadline.check('download')
+            if on_first_bytes and d.get('status') == 'downloading' and d.get('downloaded_bytes'):
+                on_first_bytes()
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if progress_callback and d.get('status') == 'downloading' and total:
+                progress_callback(d.get('downloaded_bytes', 0) / total)
+            if d.get('status') == 'finished':
+                transfer['bytes'] = d.get('downloaded_bytes') or total
+        
+        # File downloads fetch only the analyzed range (yt-dlp cuts it with ffmpeg)
+        ranged = bool(max_duration) and ffmpeg_available()
+        download_ranges = None
+        if ranged:
+            from yt_dlp.utils import download_range_func
+            download_ranges = download_range_func(None, [(offset, offset + max_duration)])
+        
         if proxy_url:
-            ydl_opts['proxy'] = proxy_url
             print(f"✅ Using proxy for download")
         
         print(f"🎵 Attempting to download: {url}")
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Extract info first to get title and duration
+        # A configured instance from the pool (utils/ytdlp_pool.py) - its extractors
+        # and player cache are already warm
+        from utils.ytdlp_pool import get_ytdlp_pool
+        with get_ytdlp_pool().lease(proxy_url, os.path.join(temp_dir, '%(title)s.%(ext)s'),
+                                    report_progress, download_ranges) as ydl:
+            # Resolved once: the info picks the stream and is reused for the download
             print("📝 Extracting video info...")
-            info = ydl.extract_info(url, download=False)
+            with timed_stage('extract'):
+                info = ydl.extract_info(url, download=False)
+            deadline.check('download')
+            if info and info.get('_type') == 'playlist':
+                # ytsearch: resolves to a playlist of one
+                info = next((entry for entry in info.get('entries') or [] if entry), None)
             
             if not info:
                 print("❌ YouTube blocked the request - bot detection triggered")
                 print("💡 This is a known issue with cloud servers (Render, Heroku, etc.)")
+                scratch.release(temp_dir)
+                get_metrics().download_attempt('yt_dlp', False)
                 return None, 0, "YouTube bot detection - try a different deployment platform or use cookies"
             
             title = info.get('title', 'Unknown')
             duration = info.get('duration', 240)  # Default 4 minutes
             
+            # A search resolves to a video ID only now - it may be cached already
+            if info.get('id') and info['id'] != video_id:
+                video_id = info['id']
+                cached = _cached_audio(video_id, offset, max_duration)
+                if cached:
+                    scratch.release(temp_dir)
+                    return cached
+            
             print(f"📋 Title: {title}")
             print(f"⏱️ Duration: {duration}s")
             
-            # Download the audio
-            print("⬇️ Starting download...")
-            ydl.download([url])
-            
-            # Find the downloaded file
-            print("🔍 Looking for downloaded audio file...")
-            for file in os.listdir(temp_dir):
-                if file.endswith('.wav'):
-                    audio_path = os.path.join(temp_dir, file)
-                    print(f"✅ Audio file found: {audio_path}")
-                    return audio_path, duration, title
-                    
-        print("❌ No WAV file found after download")
+            # The selected format's media URL - piped straight into ffmpeg
+            media_url = info.get('url')
+            streamable = ffmpeg_available() and media_url and info.get('protocol') in ('http', 'https')
+            if not streamable:
+                # Segmented formats (or no ffmpeg): yt-dlp fetches the file for the same info
+                print("⬇️ Starting download...")
+                started = time.monotonic()
+                ydl.process_ie_result(info, download=True)
+                record_stage('download', time.monotonic() - started, transfer['bytes'])
+        # The instance is back in the pool before the stream or the decode runs
+        
+        if streamable:
+            print("⬇️ Streaming audio into ffmpeg...")
+            proxies = {'http': proxy_url, 'https': proxy_url} if proxy_url else None
+            # Progress runs to the end of the analyzed range, where ffmpeg stops the download
+            total = partial_size(info.get('filesize') or info.get('filesize_approx'), duration,
+                                 offset + max_duration if max_duration else None)
+            with timed_stage('download') as stage:
+                stream = StreamTransfer(
+                    iter_ranged(media_url, headers=info.get('http_headers'), proxies=proxies,
+                                timeout=lambda: (deadline.timeout('download', cap=5),
+                                                 deadline.timeout('download', cap=30))),
+                    total, deadline=deadline, progress_callback=progress_callback,
+                    on_first_bytes=on_first_bytes)
+                audio = decode_stream(stream, offset=offset, max_duration=max_duration, deadline=deadline)
+                stage.bytes = stream.bytes
+            scratch.release(temp_dir)
+            print(f"✅ Decoded while downloading: {audio.duration:.1f}s from {stream.bytes / (1024 * 1024):.2f} MB")
+            get_metrics().download_attempt('yt_dlp', True)
+            _remember(video_id, audio, duration, title)
+            return audio, duration, title
+        
+        # ignoreerrors swallows hook exceptions - re-check the budget here
+        deadline.check('download')
+        
+        # Find the downloaded file
+        print("🔍 Looking for downloaded audio file...")
+        for file in os.listdir(temp_dir):
+            if file.endswith(('.part', '.ytdl')):
+                continue
+            audio_path = os.path.join(temp_dir, file)
+            print(f"✅ Audio file found: {audio_path}")
+            if not ffmpeg_available():
+                get_metrics().download_attempt('yt_dlp', True)
+                return audio_path, duration, title
+            # Decode the container once, in the same pass as the resample
+            with timed_stage('decode'), open(audio_path, 'rb') as f:
+                audio = decode_stream(iter(lambda: f.read(CHUNK_SIZE), b''), deadline=deadline,
+                                      offset=0.0 if ranged else offset, max_duration=max_duration)
+            if ranged and offset:
+                # The file already starts at offset - place the signal in the song
+                audio = AudioSignal(audio.samples, audio.sr, offset=offset)
+            scratch.release(temp_dir)
+            get_metrics().download_attempt('yt_dlp', True)
+            _remember(video_id, audio, duration, title)
+            return audio, duration, title
+        
+        print("❌ No audio file found after download")
+        scratch.release(temp_dir)
+        get_metrics().download_attempt('yt_dlp', False)
         return None, 0, "Download failed"
         
+    except (DeadlineExceeded, ScratchQuotaExceeded) as e:
+        print(f"⏱️ {e} - removing partial download")
+        scratch.release(temp_dir)
+        if not getattr(e, 'cancelled', False):
+            get_metrics().download_attempt('yt_dlp', False)
+        raise
     except Exception as e:
+        get_metrics().download_attempt('yt_dlp', False)
         print(f"❌ Error downloading audio: {e}")
         import traceback
         traceback.print_exc()
+        scratch.release(temp_dir)
         return None, 0, f"Error: {str(e)}"
 
 def clean_temp_files(temp_dir):
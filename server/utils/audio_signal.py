@@ -0,0 +1,84 @@
+"""
+Audio Signal
+A decoded, mono audio buffer shared by every chord detection engine
+
+Decoding is the most expensive step that every engine repeats, so the
+pipeline decodes once into an AudioSignal and hands the same object to
+Basic Pitch and librosa. The buffer is read-only so concurrent engines (the
+hedged mode runs both at once) can safely share it.
+
+A signal may cover only part of the song (a time-window analysis): offset
+is where its first sample sits in the source, so engines work on the
+excerpt and results are shifted back to song time afterwards.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+# Basic Pitch's native rate and librosa's default - neither engine resamples
+ANALYSIS_SAMPLE_RATE = 22050
+
+
+class AudioSignal:
+    """Mono float32 samples plus where they came from"""
+
+    __slots__ = ('samples', 'sr', 'duration', 'source_hash', 'path', 'offset')
+
+    def __init__(self, samples: np.ndarray, sr: int, source_hash: Optional[str] = None,
+                 path: Optional[str] = None, offset: float = 0.0):
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        samples.flags.writeable = False
+        self.samples = samples
+        self.sr = int(sr)
+        self.duration = len(samples) / float(sr) if sr else 0.0
+        self.source_hash = source_hash
+        self.path = path
+        self.offset = float(offset or 0.0)
+
+    @property
+    def nbytes(self) -> int:
+        return self.samples.nbytes
+
+    def limited(self, seconds: Optional[float]) -> np.ndarray:
+        """The first `seconds` of samples (a view, no copy)"""
+        if not seconds or seconds >= self.duration:
+            return self.samples
+        return self.samples[:int(seconds * self.sr)]
+
+    def window(self, start: float, end: Optional[float] = None) -> 'AudioSignal':
+        """The [start, end) seconds of this signal as a new signal (a view, no copy)"""
+        first = int(max(0.0, start) * self.sr)
+        last = len(self.samples) if end is None else int(end * self.sr)
+        return AudioSignal(self.samples[first:last], self.sr, source_hash=self.source_hash,
+                           path=self.path, offset=self.offset + first / self.sr)
+
+    def resampled(self, sr: int) -> 'AudioSignal':
+        """This signal at another sample rate (self when it already matches)"""
+        if sr == self.sr:
+            return self
+        import librosa
+        samples = librosa.resample(self.samples, orig_sr=self.sr, target_sr=sr)
+        return AudioSignal(samples, sr, source_hash=self.source_hash, path=self.path, offset=self.offset)
+
+    def __repr__(self):
+        at = f" from {self.offset:.1f}s" if self.offset else ""
+        return f"AudioSignal({self.duration:.1f}s{at} @ {self.sr}Hz, {self.nbytes / 1e6:.1f}MB)"
+
+
+def decode_audio(path: str, sr: int = ANALYSIS_SAMPLE_RATE, max_duration: Optional[float] = None,
+                 source_hash: Optional[str] = None, offset: float = 0.0) -> AudioSignal:
+    """
+    Decode an audio file once into a shared AudioSignal
+
+    Args:
+        path: audio file (anything librosa/soundfile/audioread can read)
+        sr: target sample rate
+        max_duration: decode at most this many seconds
+        source_hash: content hash of the source, carried along for cache keys
+        offset: start decoding this many seconds in (seeks instead of decoding
+                and discarding the skipped audio where the format allows)
+    """
+    import librosa
+    samples, sr = librosa.load(path, sr=sr, mono=True, offset=offset or 0.0, duration=max_duration)
+    return AudioSignal(samples, sr, source_hash=source_hash, path=path, offset=offset)
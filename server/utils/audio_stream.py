@@ -0,0 +1,259 @@
+"""
+Audio Stream
+Compressed audio from the network decoded on the fly by ffmpeg
+
+Downloads no longer land on disk to be converted to WAV and decoded again:
+the bytes are piped into ffmpeg as they arrive and mono float32 PCM at the
+analysis rate is read from its stdout straight into the AudioSignal the
+engines share. Download and decode overlap, nothing is written to the
+scratch directory and the song is decoded exactly once.
+
+    transfer = StreamTransfer(response.iter_content(CHUNK_SIZE), total, max_bytes, deadline)
+    signal = decode_stream(transfer, deadline=deadline)
+
+Only the part that will be analyzed is moved: with max_duration ffmpeg
+stops after that much audio, the feeder stops pulling and the HTTP body is
+closed early, so the rest of the song never crosses the network.
+
+Without an ffmpeg binary (ffmpeg_available() is False) downloaders fall back
+to writing the file and letting decode_audio() read it.
+"""
+
+import logging
+import shutil
+import subprocess
+import threading
+from collections import deque
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+
+from utils.audio_signal import ANALYSIS_SAMPLE_RATE, AudioSignal
+from utils.deadline import NO_DEADLINE
+from utils.stage_timings import in_current_context
+
+logger = logging.getLogger(__name__)
+
+# Bytes per network read / per write into ffmpeg
+CHUNK_SIZE = 64 * 1024
+# Bytes per Range request for providers that throttle long single transfers
+RANGE_SIZE = 10 * 1024 * 1024
+# Bytes per read of decoded PCM from ffmpeg
+PCM_READ_SIZE = 256 * 1024
+
+
+class DownloadTooLarge(Exception):
+    """The download is bigger than the provider's size cap"""
+
+
+class StreamDecodeError(RuntimeError):
+    """ffmpeg could not decode the stream"""
+
+
+_ffmpeg_path = None
+_ffmpeg_checked = False
+
+
+def ffmpeg_available() -> bool:
+    """True when an ffmpeg binary is on PATH (checked once)"""
+    global _ffmpeg_path, _ffmpeg_checked
+    if not _ffmpeg_checked:
+        _ffmpeg_path = shutil.which('ffmpeg')
+        _ffmpeg_checked = True
+    return _ffmpeg_path is not None
+
+
+class StreamTransfer:
+    """
+    Iterable of downloaded chunks with a size cap, deadline checks and progress
+    bytes holds how much has come through so far; on_first_bytes is called
+    once when the first data arrives (download races watch for it).
+    stop_after ends the transfer early once that many bytes have arrived.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], total: Optional[int] = None, max_bytes: Optional[int] = None,
+                 deadline=NO_DEADLINE, progress_callback: Optional[Callable[[float], None]] = None,
+                 on_first_bytes: Optional[Callable[[], None]] = None, stop_after: Optional[int] = None):
+        self._chunks = chunks
+        self.total = total or None
+        self.max_bytes = max_bytes
+        self.deadline = deadline
+        self.progress_callback = progress_callback
+        self.on_first_bytes = on_first_bytes
+        self.stop_after = stop_after
+        self.bytes = 0
+        self._reported = 0.0
+
+    def __iter__(self) -> Iterator[bytes]:
+        chunks = iter(self._chunks)
+        try:
+            for chunk in chunks:
+                # Read timeouts only bound each wait for data - the budget is checked per chunk
+                self.deadline.check('download')
+                if not chunk:
+                    continue
+                if not self.bytes and self.on_first_bytes:
+                    self.on_first_bytes()
+                self.bytes += len(chunk)
+                if self.max_bytes and self.bytes > self.max_bytes:
+                    raise DownloadTooLarge(f"Audio file is larger than {self.max_bytes // (1024 * 1024)} MB")
+                yield chunk
+                self._report()
+                if self.stop_after and self.bytes >= self.stop_after:
+                    return
+        finally:
+            # Stopped early (ffmpeg has enough audio, or stop_after) - close the HTTP body now
+            close = getattr(chunks, 'close', None)
+            if close:
+                close()
+
+    def _report(self):
+        if not (self.progress_callback and self.total):
+            return
+        fraction = min(1.0, self.bytes / self.total)
+        # Whole percents only - callers fan progress out to listeners
+        if fraction - self._reported >= 0.01 or fraction == 1.0:
+            self._reported = fraction
+            self.progress_callback(fraction)
+
+    def save(self, path: str) -> int:
+        """Write the whole stream to path (the no-ffmpeg fallback); returns bytes written"""
+        with open(path, 'wb') as f:
+            for chunk in self:
+                f.write(chunk)
+        return self.bytes
+
+
+def partial_size(total: Optional[int], duration: Optional[float], end: Optional[float]) -> Optional[int]:
+    """
+    Bytes of a total-byte file that cover its first `end` seconds (None when unknown)
+    Proportional with 5% headroom - exact for CBR, close enough for the rest.
+    """
+    if not total or not duration or not end or end >= duration:
+        return total or None
+    return min(total, int(total * end / duration * 1.05) + CHUNK_SIZE)
+
+
+def iter_ranged(url: str, headers: Optional[dict] = None, timeout: Callable[[], object] = lambda: None,
+                proxies: Optional[dict] = None, range_size: int = RANGE_SIZE) -> Iterator[bytes]:
+    """
+    Chunks of url fetched as consecutive Range requests
+    Media CDNs throttle long single transfers; a fresh request per range keeps
+    the rate up (what yt-dlp's http_chunk_size does). timeout() is called for
+    each request so the deadline shrinks as the download goes on.
+    """
+    from services.http_gateway import get_http_gateway
+
+    gateway = get_http_gateway()
+    start = 0
+    while True:
+        request_headers = dict(headers or {})
+        request_headers['Range'] = f"bytes={start}-{start + range_size - 1}"
+        received = 0
+        with gateway.get(url, headers=request_headers, stream=True, timeout=timeout(),
+                         proxies=proxies) as response:
+            if response.status_code == 416:
+                # Asked past the end - the previous range was the last
+                return
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                received += len(chunk)
+                yield chunk
+            if response.status_code != 206:
+                # Server ignored the Range header and sent everything
+                return
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        start += received
+        if not received or (total.isdigit() and start >= int(total)):
+            return
+
+
+def decode_stream(chunks: Iterable[bytes], sr: int = ANALYSIS_SAMPLE_RATE, max_duration: Optional[float] = None,
+                  offset: float = 0.0, deadline=NO_DEADLINE, source_hash: Optional[str] = None) -> AudioSignal:
+    """
+    Pipe compressed audio through ffmpeg into a mono float32 AudioSignal
+
+    A feeder thread writes chunks to ffmpeg's stdin while this thread reads
+    PCM from its stdout, so decoding keeps pace with the download. Errors
+    from the chunk iterator (DeadlineExceeded, DownloadTooLarge, network
+    errors) are re-raised here once ffmpeg has been stopped.
+
+    Args:
+        chunks: compressed bytes in order (e.g. a StreamTransfer)
+        sr: output sample rate
+        max_duration: decode at most this many seconds (ffmpeg stops reading early)
+        offset: skip this many seconds of the source first
+        deadline: request Deadline - ffmpeg is killed when it runs out
+        source_hash: carried along on the signal for cache keys
+    """
+    if not ffmpeg_available():
+        raise StreamDecodeError("ffmpeg is not installed")
+    command = [_ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0']
+    if offset:
+        command += ['-ss', f"{offset:.3f}"]
+    if max_duration:
+        command += ['-t', f"{max_duration:.3f}"]
+    command += ['-vn', '-ac', '1', '-ar', str(sr), '-f', 'f32le', '-acodec', 'pcm_f32le', 'pipe:1']
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    failure = []
+    stderr_tail = deque(maxlen=20)
+
+    def feed():
+        source = iter(chunks)
+        try:
+            for chunk in source:
+                process.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg stopped reading (-t reached, or it failed and said why on stderr)
+            pass
+        except BaseException as e:
+            failure.append(e)
+            process.kill()
+        finally:
+            # Stop pulling from the network as soon as ffmpeg has had enough
+            close = getattr(source, 'close', None)
+            if close:
+                close()
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    def drain_stderr():
+        for line in process.stderr:
+            stderr_tail.append(line.decode('utf-8', 'replace').rstrip())
+
+    # The feeder pulls from the network - keep it in this request's timings
+    feeder = threading.Thread(target=in_current_context(feed), name='ffmpeg-feed', daemon=True)
+    stderr_reader = threading.Thread(target=drain_stderr, name='ffmpeg-stderr', daemon=True)
+    feeder.start()
+    stderr_reader.start()
+
+    pcm = bytearray()
+    try:
+        while True:
+            block = process.stdout.read(PCM_READ_SIZE)
+            if not block:
+                break
+            pcm.extend(block)
+            deadline.check('decode')
+        process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        feeder.join()
+        stderr_reader.join(timeout=1)
+        process.stdout.close()
+
+    if failure:
+        raise failure[0]
+    if process.returncode != 0:
+        detail = '; '.join(stderr_tail) or f"exit status {process.returncode}"
+        raise StreamDecodeError(f"ffmpeg could not decode the audio: {detail}")
+    samples = np.frombuffer(pcm, dtype=np.float32, count=len(pcm) // 4)
+    if not len(samples):
+        raise StreamDecodeError("ffmpeg produced no audio")
+    return AudioSignal(samples, sr, source_hash=source_hash, offset=offset)
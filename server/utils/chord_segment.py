@@ -0,0 +1,96 @@
+"""
+Chord Segment
+Compact slotted record for one detected chord
+
+Engines emit ChordSegment objects instead of one dict per chord. Segments
+still behave like the dicts the rest of the code expects (seg['chord'],
+seg.get('notes'), seg['beat'] = 3), and the app's JSON provider serializes
+them directly (utils/json_provider.py).
+"""
+
+from typing import Any, Dict, Iterator
+
+_MISSING = object()
+
+
+class ChordSegment:
+    """One chord: name, timing, confidence and optional rhythm/voicing info"""
+
+    FIELDS = ('chord', 'time', 'duration', 'confidence', 'beat', 'measure',
+              'beat_in_measure', 'notes', 'intervals')
+
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, chord: str, time: float = 0.0, duration: float = 0.0, confidence: float = 0.0,
+                 beat: int = None, measure: int = None, beat_in_measure: int = None,
+                 notes=None, intervals=None, **extra):
+        self.chord = chord
+        self.time = time
+        self.duration = duration
+        self.confidence = confidence
+        self.beat = beat
+        self.measure = measure
+        self.beat_in_measure = beat_in_measure
+        self.notes = notes
+        self.intervals = intervals
+        # Rare keys (e.g. '_metadata' on the first chord) - no dict until needed
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ChordSegment':
+        return cls(**data)
+
+    # -- dict compatibility -------------------------------------------------
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        if key in ChordSegment.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in ChordSegment.FIELDS:
+            value = getattr(self, key)
+            # Unset optional fields read as absent, like a missing dict key
+            return default if value is None else value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        return default
+
+    def keys(self) -> Iterator[str]:
+        for field in ChordSegment.FIELDS:
+            if getattr(self, field) is not None:
+                yield field
+        if self.extra:
+            yield from self.extra
+
+    def items(self):
+        return ((key, self[key]) for key in self.keys())
+
+    def __iter__(self):
+        return self.keys()
+
+    def copy(self) -> 'ChordSegment':
+        segment = ChordSegment.__new__(ChordSegment)
+        for field in ChordSegment.FIELDS:
+            setattr(segment, field, getattr(self, field))
+        segment.extra = dict(self.extra) if self.extra else None
+        return segment
+
+    def to_dict(self) -> Dict:
+        """Plain dict of the set fields (what the JSON provider emits)"""
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"ChordSegment({self.chord!r} @ {self.time:.2f}s for {self.duration:.2f}s)"
@@ -0,0 +1,95 @@
+"""
+Chord Wire Format
+Compact columnar encoding of chord segments for analysis responses
+
+The default response is a list of segment objects that repeats the same
+keys for every chord. With format=columnar each field becomes one parallel
+array and chord names are replaced by integer codes into a name table:
+
+    {
+        "format": "columnar",
+        "count": 3,
+        "names": ["C", "G", "Am"],
+        "chord": [0, 1, 2],
+        "time": [0.0, 2.0, 4.0],
+        "duration": [2.0, 2.0, 2.0],
+        ...
+    }
+
+Decoding on the client: segment i is {field: columns[field][i]} with
+chord = names[chord[i]].
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+WIRE_FORMATS = ('segments', 'columnar')
+
+# Columns always present, in this order
+CORE_FIELDS = ('time', 'duration', 'confidence', 'beat', 'measure', 'beat_in_measure')
+# Per-segment lists, only included when some segment carries them
+LIST_FIELDS = ('notes', 'intervals')
+
+# Decimal places kept for float columns (1 ms timing is plenty for playback)
+FLOAT_PRECISION = {'time': 3, 'duration': 3, 'confidence': 3}
+
+
+def requested_format(*sources: Optional[Dict]) -> str:
+    """
+    First valid 'format' value among the given mappings (query args, JSON
+    body, form), defaulting to 'segments'
+    """
+    for source in sources:
+        value = source.get('format') if source else None
+        if value and str(value).strip().lower() in WIRE_FORMATS:
+            return str(value).strip().lower()
+    return 'segments'
+
+
+def _native(value, digits: Optional[int] = None):
+    """numpy scalar -> Python scalar, rounding floats when asked"""
+    if value is None:
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if digits is not None and isinstance(value, float):
+        return round(value, digits)
+    return value
+
+
+def to_columnar(chords: Iterable) -> Dict:
+    """Encode chord segments as parallel arrays with a chord-name table"""
+    chords = list(chords)
+    names: List[str] = []
+    codes: Dict[str, int] = {}
+    columns = {'chord': []}
+    columns.update({field: [] for field in CORE_FIELDS})
+    lists = {field: [] for field in LIST_FIELDS}
+
+    for segment in chords:
+        name = segment.get('chord') or 'N'
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        columns['chord'].append(code)
+        for field in CORE_FIELDS:
+            columns[field].append(_native(segment.get(field), FLOAT_PRECISION.get(field)))
+        for field in LIST_FIELDS:
+            value = segment.get(field)
+            lists[field].append([_native(v) for v in value] if value is not None else None)
+
+    encoded = {'format': 'columnar', 'count': len(chords), 'names': names}
+    encoded.update(columns)
+    for field, values in lists.items():
+        if any(v is not None for v in values):
+            encoded[field] = values
+    return encoded
+
+
+def encode_result(body: Dict, wire_format: str) -> Dict:
+    """Response body with its 'chords' in the requested wire format"""
+    if wire_format != 'columnar' or not isinstance(body, dict) or 'chords' not in body:
+        return body
+    encoded = dict(body)
+    encoded['chords'] = to_columnar(body['chords'])
+    return encoded
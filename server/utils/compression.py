@@ -0,0 +1,56 @@
+"""
+Response Compression
+Gzips JSON responses for clients that send Accept-Encoding: gzip
+
+Chord analyses are a few hundred segments of highly repetitive JSON, so gzip
+typically shrinks them 5-10x - a big win for Pi Browser users on mobile data.
+
+Configuration (environment variables):
+    GZIP_MIN_SIZE   smallest body worth compressing, in bytes (default: 1024)
+    GZIP_LEVEL      compression level 1-9 (default: 6)
+"""
+
+import gzip
+import os
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html', 'text/css', 'application/javascript')
+
+
+def _accepts_gzip(request) -> bool:
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            return params.strip().replace(' ', '') not in ('q=0', 'q=0.0')
+    return False
+
+
+def register_gzip(app):
+    """Install an after_request hook that gzips eligible responses"""
+    min_size = int(os.getenv('GZIP_MIN_SIZE', '1024'))
+    level = int(os.getenv('GZIP_LEVEL', '6'))
+
+    @app.after_request
+    def gzip_response(response):
+        from flask import request
+
+        if (response.direct_passthrough
+                or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if not _accepts_gzip(request):
+            return response
+
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+
+        response.set_data(gzip.compress(body, compresslevel=level))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Content-Length'] = str(len(response.get_data()))
+        return response
+
+    return gzip_response
@@ -0,0 +1,113 @@
+"""
+Request Deadlines
+A time budget threaded through download, conversion, decode and detection
+
+Each stage calls deadline.check('<stage>') at its safe points and derives its
+I/O timeouts from deadline.timeout(...), so a request whose client has long
+given up stops cleanly instead of running a full analysis. Deadlines can
+also be cancelled (e.g. the losing engine of a hedged race), which the same
+checks pick up.
+
+Configuration (environment variables):
+    ANALYSIS_DEADLINE_SECONDS   default and maximum budget per analysis
+                                request (default: 300, 0 disables)
+"""
+
+import os
+import threading
+import time
+from typing import Optional
+
+DEFAULT_DEADLINE_SECONDS = 300.0
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request ran out of time (or was cancelled) during a stage"""
+
+    def __init__(self, stage: str, budget: Optional[float] = None, cancelled: bool = False):
+        self.stage = stage
+        self.budget = budget
+        self.cancelled = cancelled
+        if cancelled:
+            message = f"Analysis cancelled during {stage}"
+        else:
+            message = f"Analysis timed out during {stage} (budget {budget:.0f}s)"
+        super().__init__(message)
+
+
+class Deadline:
+    """Absolute expiry time plus a cooperative cancel flag"""
+
+    __slots__ = ('budget', 'expires_at', '_cancelled', '_parent')
+
+    def __init__(self, seconds: Optional[float] = None, _parent: 'Deadline' = None):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self._cancelled = threading.Event()
+        self._parent = _parent
+
+    @classmethod
+    def from_request(cls, requested: Optional[float] = None) -> 'Deadline':
+        """Budget from the request, capped by ANALYSIS_DEADLINE_SECONDS"""
+        try:
+            limit = float(os.getenv('ANALYSIS_DEADLINE_SECONDS', DEFAULT_DEADLINE_SECONDS))
+        except ValueError:
+            limit = DEFAULT_DEADLINE_SECONDS
+        seconds = limit if limit > 0 else None
+        try:
+            if requested is not None and float(requested) > 0:
+                seconds = min(float(requested), seconds) if seconds else float(requested)
+        except (TypeError, ValueError):
+            pass
+        return cls(seconds)
+
+    def child(self) -> 'Deadline':
+        """Same expiry, separately cancellable (cancelling the parent cancels it too)"""
+        child = Deadline(None, _parent=self)
+        child.budget = self.budget
+        child.expires_at = self.expires_at
+        return child
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or (self._parent is not None and self._parent.cancelled)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (None when unlimited)"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return self.cancelled or (remaining is not None and remaining <= 0)
+
+    def check(self, stage: str):
+        """Raise DeadlineExceeded if the budget is spent or the work was cancelled"""
+        if self.cancelled:
+            raise DeadlineExceeded(stage, self.budget, cancelled=True)
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(stage, self.budget)
+
+    def timeout(self, stage: str, cap: Optional[float] = None) -> Optional[float]:
+        """
+        Timeout for one blocking call: the remaining budget, at most `cap`
+        Raises DeadlineExceeded when nothing is left
+        """
+        self.check(stage)
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        return min(remaining, cap) if cap else remaining
+
+    def __repr__(self):
+        remaining = self.remaining()
+        return f"Deadline({'unlimited' if remaining is None else f'{remaining:.1f}s left'})"
+
+
+# Shared "no deadline" for callers that do not pass one
+NO_DEADLINE = Deadline(None)
@@ -0,0 +1,194 @@
+"""
+Download Race
+Hedged audio downloads across providers
+
+download_youtube_audio() normally tries RapidAPI and then yt-dlp strictly
+one after the other, so a slow RapidAPI answer delays the fallback by its
+whole timeout. In race mode the preferred provider starts alone; when it
+has not delivered any audio bytes after DOWNLOAD_HEDGE_DELAY seconds the
+next provider starts alongside it:
+
+    0s   rapidapi ----------- metadata ... (nothing yet)
+    5s   yt_dlp   --- extract --- first bytes  <- keeps going, rapidapi cancelled
+
+The first provider to deliver bytes keeps the download and the others are
+cancelled through their own child Deadline (they stop at their next check
+and clean up their scratch files). A provider that fails outright hands
+over to the next one straight away, and if the stream that was kept fails
+later, any provider not yet tried still gets its turn.
+
+Configuration (environment variables):
+    DOWNLOAD_MODE           sequential (default) or race
+    DOWNLOAD_HEDGE_DELAY    seconds without bytes before the next provider starts (default: 5)
+    DOWNLOAD_RACE_WORKERS   provider downloads running at once across requests (default: 4)
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from utils.deadline import NO_DEADLINE, DeadlineExceeded
+from utils.stage_timings import in_current_context
+
+DOWNLOAD_MODES = ('sequential', 'race')
+DEFAULT_HEDGE_DELAY = 5.0
+
+# Losers may keep a worker busy until their next deadline check (yt-dlp's
+# extraction cannot be interrupted) - bound how many can pile up
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('DOWNLOAD_RACE_WORKERS', '4')),
+    thread_name_prefix='download-race'
+)
+
+
+def get_download_mode(requested: Optional[str] = None) -> str:
+    """Requested mode if valid, else DOWNLOAD_MODE, else sequential"""
+    for mode in (requested, os.getenv('DOWNLOAD_MODE')):
+        if mode and mode.strip().lower() in DOWNLOAD_MODES:
+            return mode.strip().lower()
+    return 'sequential'
+
+
+def get_hedge_delay() -> float:
+    """Seconds the current provider gets to deliver bytes before the next one starts"""
+    try:
+        return max(0.0, float(os.getenv('DOWNLOAD_HEDGE_DELAY', DEFAULT_HEDGE_DELAY)))
+    except ValueError:
+        return DEFAULT_HEDGE_DELAY
+
+
+class _Entrant:
+    """One provider's run in the race"""
+
+    __slots__ = ('name', 'future', 'deadline', 'streaming', 'finished')
+
+    def __init__(self, name: str, deadline):
+        self.name = name
+        self.future = None
+        self.deadline = deadline
+        self.streaming = threading.Event()
+        self.finished = False
+
+    def cancel(self):
+        self.future.cancel()
+        self.deadline.cancel()
+
+
+def race_downloads(providers: List[Tuple[str, Callable]], url: str, video_id: Optional[str],
+                   progress_callback: Optional[Callable[[float], None]] = None, deadline=NO_DEADLINE,
+                   scratch_dir: Optional[str] = None, hedge_delay: Optional[float] = None):
+    """
+    Run providers as a hedged race; returns the winner's (audio, duration, title)
+
+    providers: [(name, fn)] in order of preference, each called as
+        fn(url, video_id, progress_callback, deadline, scratch_dir, on_first_bytes)
+    and returning (audio, duration, title) with audio None on failure.
+    When every provider fails the last failure is returned (or the first
+    error that was not a plain provider failure, e.g. ScratchQuotaExceeded,
+    is raised).
+    """
+    from utils.audio_processor import downloaded
+
+    hedge_delay = get_hedge_delay() if hedge_delay is None else hedge_delay
+    started = time.monotonic()
+    changed = threading.Event()
+    lock = threading.Lock()
+    waiting = list(providers)
+    entrants = []
+    reported = [0.0]
+
+    def forward_progress(fraction):
+        # Several providers report at once - listeners only ever see progress go up
+        if not progress_callback:
+            return
+        with lock:
+            if fraction <= reported[0]:
+                return
+            reported[0] = fraction
+        progress_callback(fraction)
+
+    def launch():
+        name, provider = waiting.pop(0)
+        entrant = _Entrant(name, deadline.child())
+
+        def on_first_bytes():
+            if not entrant.streaming.is_set():
+                entrant.streaming.set()
+                changed.set()
+
+        entrant.future = _executor.submit(in_current_context(provider), url, video_id, forward_progress,
+                                          entrant.deadline, scratch_dir, on_first_bytes)
+        entrant.future.add_done_callback(lambda _: changed.set())
+        entrants.append(entrant)
+        print(f"🏁 Download race: starting {name} at {time.monotonic() - started:.1f}s")
+        return entrant
+
+    def cancel_all(keep=None):
+        for entrant in entrants:
+            if entrant is not keep and not entrant.finished:
+                entrant.cancel()
+
+    launch()
+    next_hedge = time.monotonic() + hedge_delay
+    kept = None
+    failure = (None, 0, "Download failed")
+    error = None
+
+    try:
+        while True:
+            changed.clear()
+            for entrant in entrants:
+                if entrant.finished or not entrant.future.done():
+                    continue
+                entrant.finished = True
+                try:
+                    result = entrant.future.result()
+                except CancelledError:
+                    continue  # cancelled before a worker picked it up
+                except DeadlineExceeded as e:
+                    if not e.cancelled or deadline.cancelled:
+                        raise
+                    continue  # lost the race
+                except Exception as e:
+                    print(f"⚠️ Download race: {entrant.name} raised {type(e).__name__}: {e}")
+                    error = error or e
+                    continue
+                if downloaded(result[0]):
+                    cancel_all(keep=entrant)
+                    print(f"🏁 Download race: {entrant.name} won in {time.monotonic() - started:.1f}s")
+                    return result
+                print(f"⚠️ Download race: {entrant.name} failed: {result[2]}")
+                failure = result
+
+            # The first provider to deliver bytes keeps the download
+            if kept is None or kept.finished:
+                kept = next((e for e in entrants if not e.finished and e.streaming.is_set()), None)
+                if kept is not None:
+                    print(f"🏁 Download race: {kept.name} is delivering audio, cancelling the rest")
+                    cancel_all(keep=kept)
+
+            running = [e for e in entrants if not e.finished and not e.deadline.cancelled]
+            now = time.monotonic()
+            if waiting and (not running or (kept is None and now >= next_hedge)):
+                launch()
+                next_hedge = now + hedge_delay
+                continue
+            if not running and not waiting:
+                # Only cancelled losers may still be winding down
+                break
+
+            timeout = next_hedge - now if waiting and kept is None else None
+            remaining = deadline.remaining()
+            if remaining is not None:
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            changed.wait(timeout)
+            deadline.check('download')
+    except BaseException:
+        cancel_all()
+        raise
+
+    if error is not None:
+        raise error
+    return failure
@@ -0,0 +1,39 @@
+"""
+JSON Provider
+Flask JSON provider that serializes numpy values and chord segments natively
+
+Analysis results carry numpy scalars and arrays straight from librosa and
+Basic Pitch. Instead of walking every result to convert them before
+jsonify() walks it again, the encoder converts them as it meets them.
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+from utils.chord_segment import ChordSegment
+
+
+def json_default(o):
+    """
+    json.dumps default= hook: numpy scalars/arrays and ChordSegments
+    Raises TypeError for anything else, like the json module does
+    """
+    if isinstance(o, ChordSegment):
+        return o.to_dict()
+    # numpy.generic and numpy.ndarray - duck-typed so numpy stays optional here
+    if hasattr(o, 'tolist') and hasattr(o, 'dtype'):
+        return o.tolist()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _default(o):
+    try:
+        return json_default(o)
+    except TypeError:
+        # Dates, UUIDs, dataclasses, ... as Flask normally handles them
+        return DefaultJSONProvider.default(o)
+
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """DefaultJSONProvider plus numpy and ChordSegment support"""
+
+    default = staticmethod(_default)
@@ -1,9 +1,10 @@
 import os
-import requests
 import json
 from typing import Dict, List, Optional
 import urllib.parse
 
+from services.http_gateway import get_http_gateway
+
 class MusicSearchService:
     """
     Service to search for songs by name using various music APIs
@@ -67,7 +68,7 @@ class MusicSearchService:
                 'key': self.youtube_api_key
             }
             
-            response = requests.get(url, params=params)
+            response = get_http_gateway().get(url, params=params)
             data = response.json()
             
             if 'items' in data and len(data['items']) > 0:
@@ -104,7 +105,7 @@ class MusicSearchService:
                 'limit': 1
             }
             
-            response = requests.get(url, params=params)
+            response = get_http_gateway().get(url, params=params)
             data = response.json()
             
             if 'results' in data and 'trackmatches' in data['results']:
@@ -138,7 +139,7 @@ class MusicSearchService:
                 'key': self.youtube_api_key
             }
             
-            response = requests.get(url, params=params)
+            response = get_http_gateway().get(url, params=params)
             data = response.json()
             
             if 'items' in data and len(data['items']) > 0:
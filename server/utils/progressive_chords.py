@@ -0,0 +1,104 @@
+"""
+Progressive Chords
+Chord segments released while the analysis is still running
+
+A request that wants early results (the SSE endpoint) activates a
+ProgressiveChords for its analysis. The engines publish segments into
+whichever one is active as soon as they will not change them any more:
+
+    publish_chords('librosa', segments, offset=signal.offset)
+
+and skip the extra work entirely when none is active (publishing_chords()
+is False). Like stage timings the sink lives in a context variable, so
+engines running on the hedge executors publish into the same request.
+
+Each engine keeps its own cursor: segments at or before the last released
+time are dropped, times are shifted to song time and beats are numbered
+across batches. When an engine gives up (AI failure -> librosa fallback)
+or loses a hedge, the next engine's segments start again from its first
+bar - clients switch to the newest engine they see. The final result
+remains authoritative and may refine the last released durations.
+"""
+
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+_active = contextvars.ContextVar('progressive_chords', default=None)
+
+
+class ProgressiveChords:
+    """Forwards decode and chord events to a progress callback"""
+
+    def __init__(self, progress: Callable):
+        self._progress = progress
+        self._released = {}      # engine -> [last released time, segments released]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """Make this the sink publish_chords() releases into"""
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def decoded(self, signal):
+        """Report that the shared decode finished (first thing an SSE client sees after download)"""
+        self._progress('detect', 'running', None, decoded={
+            'duration': round(signal.duration, 3),
+            'offset': round(signal.offset, 3),
+            'sample_rate': signal.sr,
+        })
+
+    def publish(self, engine: str, segments: Iterable, offset: float = 0.0) -> int:
+        """Release the segments this engine has not released yet; returns how many"""
+        fresh = []
+        with self._lock:
+            cursor = self._released.setdefault(engine, [float('-inf'), 0])
+            for segment in segments:
+                time = round(float(segment['time']) + offset, 3)
+                if time <= cursor[0]:
+                    continue
+                index = cursor[1] + len(fresh)
+                chord = {
+                    'chord': segment['chord'],
+                    'time': time,
+                    'duration': round(float(segment.get('duration', 0.0)), 3),
+                    'confidence': round(float(segment.get('confidence', 0.0)), 3),
+                    'beat': index + 1,
+                    'measure': index // 4 + 1,
+                    'beat_in_measure': index % 4 + 1,
+                }
+                fresh.append(chord)
+            if not fresh:
+                return 0
+            cursor[0] = fresh[-1]['time']
+            cursor[1] += len(fresh)
+        self._progress('detect', 'running', None, engine=engine, chords=fresh)
+        return len(fresh)
+
+
+def publishing_chords() -> bool:
+    """True when someone is listening for early segments"""
+    return _active.get() is not None
+
+
+def publish_decoded(signal):
+    """Report a finished decode to the active sink (no-op when none is active)"""
+    sink = _active.get()
+    if sink is not None:
+        sink.decoded(signal)
+
+
+def publish_chords(engine: str, segments: Iterable, offset: float = 0.0) -> int:
+    """
+    Release final segments (excerpt time) to the active sink
+    offset: the signal's position in the song, added to every time
+    """
+    sink = _active.get()
+    if sink is None:
+        return 0
+    return sink.publish(engine, segments, offset)
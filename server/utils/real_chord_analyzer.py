@@ -8,7 +8,10 @@ import tempfile
 import yt_dlp
 import librosa
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+# Seconds of each song that are analyzed (and downloaded)
+ANALYSIS_SECONDS = 60
 
 def download_and_analyze_song(url: str) -> tuple:
     """
@@ -21,13 +24,13 @@ def download_and_analyze_song(url: str) -> tuple:
         temp_dir = tempfile.mkdtemp()
         
         # Download audio
-        audio_path, duration, title = download_audio_safe(url, temp_dir)
+        audio_path, duration, title = download_audio_safe(url, temp_dir, max_duration=ANALYSIS_SECONDS)
         
         if not audio_path or not os.path.exists(audio_path):
             return [], 0, "Download failed"
         
         # Analyze chords
-        chords = analyze_audio_chords(audio_path, min(duration, 60))  # Limit to 60 seconds
+        chords = analyze_audio_chords(audio_path, min(duration, ANALYSIS_SECONDS))
         
         return chords, duration, title
         
@@ -44,9 +47,10 @@ def download_and_analyze_song(url: str) -> tuple:
             except:
                 pass
 
-def download_audio_safe(url: str, output_dir: str) -> tuple:
+def download_audio_safe(url: str, output_dir: str, max_duration: Optional[float] = None) -> tuple:
     """
     Safely download audio from URL
+    With max_duration only the song's first seconds are downloaded and converted.
     Returns: (audio_path, duration, title)
     """
     try:
@@ -84,6 +88,9 @@ def download_audio_safe(url: str, output_dir: str) -> tuple:
             # Limit duration to avoid long downloads
             'match_filter': lambda info_dict: None if info_dict.get('duration', 0) < 600 else 'Video too long'
         }
+        if max_duration:
+            # yt-dlp fetches and cuts just this range, so the WAV conversion is short too
+            ydl_opts['download_ranges'] = yt_dlp.utils.download_range_func(None, [(0, max_duration)])
         
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             # Extract info
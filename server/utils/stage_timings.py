@@ -0,0 +1,145 @@
+"""
+Stage Timings
+Monotonic wall time and bytes moved per analysis stage
+
+The pipeline activates a StageTimings for each analysis; downloaders, the
+decoder and the engines record into whichever one is active with
+
+    with timed_stage('conversion') as stage:
+        ...
+        stage.bytes = os.path.getsize(wav_path)
+
+and do nothing when none is (scripts, tests). The active timings live in a
+context variable, so work handed to a thread pool must be submitted through
+in_current_context() to keep recording into the same request.
+
+Results end up in analysis_metadata.timings, in the Server-Timing response
+header and in one structured log line per analysis.
+"""
+
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+_active = contextvars.ContextVar('stage_timings', default=None)
+
+
+class StageRecord:
+    """Handle for one running stage - set .bytes to report data moved"""
+
+    __slots__ = ('name', 'bytes')
+
+    def __init__(self, name: str, nbytes: Optional[int] = None):
+        self.name = name
+        self.bytes = nbytes
+
+
+class StageTimings:
+    """Accumulated seconds, call counts and bytes per stage for one analysis"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._stages = {}     # name -> [seconds, count, bytes]; insertion order = first seen
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, nbytes: Optional[int] = None):
+        """Add one run of a stage (stages run more than once accumulate)"""
+        with self._lock:
+            entry = self._stages.setdefault(name, [0.0, 0, None])
+            entry[0] += seconds
+            entry[1] += 1
+            if nbytes is not None:
+                entry[2] = (entry[2] or 0) + int(nbytes)
+
+    @contextmanager
+    def stage(self, name: str, nbytes: Optional[int] = None):
+        """Time the block as stage `name` (recorded even if it raises)"""
+        record = StageRecord(name, nbytes)
+        started = time.monotonic()
+        try:
+            yield record
+        finally:
+            self.record(name, time.monotonic() - started, record.bytes)
+
+    @contextmanager
+    def activate(self):
+        """Make these the timings that timed_stage() records into"""
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def total_seconds(self) -> float:
+        return time.monotonic() - self.started
+
+    def to_dict(self) -> Dict:
+        """{'download': {'ms': 812.4, 'bytes': 3145728}, ..., 'total': {'ms': ...}}"""
+        with self._lock:
+            stages = {name: list(entry) for name, entry in self._stages.items()}
+        result = {}
+        for name, (seconds, count, nbytes) in stages.items():
+            entry = {'ms': round(seconds * 1000, 1)}
+            if count > 1:
+                entry['count'] = count
+            if nbytes is not None:
+                entry['bytes'] = nbytes
+            result[name] = entry
+        result['total'] = {'ms': round(self.total_seconds() * 1000, 1)}
+        return result
+
+
+def current_timings() -> Optional[StageTimings]:
+    """The StageTimings active in this context, if any"""
+    return _active.get()
+
+
+@contextmanager
+def timed_stage(name: str, nbytes: Optional[int] = None):
+    """Time a stage into the active StageTimings (no-op when none is active)"""
+    timings = _active.get()
+    if timings is None:
+        yield StageRecord(name, nbytes)
+        return
+    with timings.stage(name, nbytes) as record:
+        yield record
+
+
+def record_stage(name: str, seconds: float, nbytes: Optional[int] = None):
+    """Record an already measured stage into the active StageTimings"""
+    timings = _active.get()
+    if timings is not None:
+        timings.record(name, seconds, nbytes)
+
+
+def in_current_context(fn):
+    """Wrap fn to run in a copy of the caller's context (for executor.submit)"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+    return run
+
+
+def server_timing_header(timings: Optional[Dict]) -> Optional[str]:
+    """Server-Timing header value for a to_dict() result"""
+    if not timings:
+        return None
+    parts = []
+    for name, entry in timings.items():
+        part = f"{name};dur={entry['ms']}"
+        if entry.get('bytes') is not None:
+            part += f';desc="{entry["bytes"]} bytes"'
+        parts.append(part)
+    return ', '.join(parts)
+
+
+def timings_log_line(key: str, status: str, timings: Dict, **fields) -> str:
+    """One JSON line describing an analysis, for grepping the slow stage"""
+    record = {'event': 'analysis_timings', 'key': key, 'status': status}
+    record.update(fields)
+    record['stages'] = timings
+    return json.dumps(record, sort_keys=False, separators=(',', ':'))
@@ -0,0 +1,218 @@
+"""
+Upload Handler
+Streams uploaded audio to a unique scratch file while hashing and validating it
+
+The container and codec are sniffed from the first bytes, so a file that is
+not audio is rejected before anything is written to disk. The SHA-256 of the
+body is computed during the copy and doubles as the upload's cache key.
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+from typing import Optional
+
+# Bytes copied per read from the upload stream
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Enough of the file to identify every supported container
+SNIFF_BYTES = 64
+
+# Container -> file suffix used for the scratch file (decoders key off it)
+FORMAT_SUFFIXES = {
+    'mp3': '.mp3',
+    'wav': '.wav',
+    'flac': '.flac',
+    'ogg': '.ogg',
+    'm4a': '.m4a',
+}
+
+# WAVE fmt codes we can decode: PCM, IEEE float, WAVE_FORMAT_EXTENSIBLE
+WAV_CODECS = {0x0001: 'pcm', 0x0003: 'float', 0xFFFE: 'extensible'}
+
+
+class UploadRejected(Exception):
+    """The upload is not a supported audio file (or is too large)"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadedAudio:
+    """An upload that has been copied to scratch space"""
+
+    __slots__ = ('path', 'sha256', 'size', 'format', 'codec', 'filename')
+
+    def __init__(self, path, sha256, size, format, codec, filename):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.format = format
+        self.codec = codec
+        self.filename = filename
+
+    @property
+    def cache_key(self) -> str:
+        return f"upload:{self.sha256}"
+
+    def cleanup(self):
+        """Remove the scratch file"""
+        try:
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _skip_id3(head: bytes) -> int:
+    """Offset of the first byte after an ID3v2 tag (0 when there is none)"""
+    if len(head) < 10 or not head.startswith(b'ID3'):
+        return 0
+    # Tag size is a 28-bit syncsafe integer
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    has_footer = head[5] & 0x10
+    return 10 + size + (10 if has_footer else 0)
+
+
+def _is_mpeg_audio_frame(head: bytes, offset: int = 0) -> bool:
+    """MPEG audio frame sync with a valid layer, bitrate and sample rate"""
+    if len(head) < offset + 4:
+        return False
+    b1, b2 = head[offset + 1], head[offset + 2]
+    if head[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return False
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    bitrate = (b2 >> 4) & 0x0F
+    sample_rate = (b2 >> 2) & 0x03
+    # layer 0 is reserved (and is how ADTS AAC looks), 0b01 version is reserved
+    return layer != 0 and version != 1 and bitrate not in (0, 15) and sample_rate != 3
+
+
+def _wav_codec(head: bytes) -> Optional[str]:
+    """Codec named by the fmt chunk of a RIFF/WAVE header, if we can decode it"""
+    offset = 12
+    while offset + 8 <= len(head):
+        chunk_id = head[offset:offset + 4]
+        chunk_size = struct.unpack('<I', head[offset + 4:offset + 8])[0]
+        if chunk_id == b'fmt ':
+            if offset + 10 > len(head):
+                return None
+            format_tag = struct.unpack('<H', head[offset + 8:offset + 10])[0]
+            return WAV_CODECS.get(format_tag)
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def sniff_audio_format(head: bytes):
+    """
+    Identify the container and codec from the first bytes of a file
+
+    Returns (format, codec) or (None, reason) when the bytes are not a
+    supported audio file.
+    """
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        codec = _wav_codec(head)
+        if codec is None:
+            return None, "WAV file uses an unsupported codec"
+        return 'wav', codec
+    if head[:4] == b'fLaC':
+        return 'flac', 'flac'
+    if head[:4] == b'OggS':
+        if b'OpusHead' in head:
+            return 'ogg', 'opus'
+        if b'vorbis' in head:
+            return 'ogg', 'vorbis'
+        if b'FLAC' in head:
+            return 'ogg', 'flac'
+        return None, "Ogg file does not contain Vorbis, Opus or FLAC audio"
+    if head[4:8] == b'ftyp':
+        brand = head[8:12]
+        if brand.startswith(b'qt'):
+            return None, "QuickTime video files are not supported"
+        return 'm4a', 'aac'
+    if head.startswith(b'ID3'):
+        # The tag can be large; the frame after it is checked once it arrives
+        return 'mp3', 'mp3'
+    if _is_mpeg_audio_frame(head):
+        return 'mp3', 'mp3'
+    return None, "File is not a recognised audio format"
+
+
+def stream_upload(file_storage, scratch_dir: str = None, max_bytes: int = None,
+                  chunk_size: int = UPLOAD_CHUNK_SIZE) -> UploadedAudio:
+    """
+    Copy an uploaded file to a unique scratch file in fixed-size chunks
+
+    Args:
+        file_storage: werkzeug FileStorage from request.files
+        scratch_dir: directory for the scratch file, normally the request's
+                     job directory (services/scratch_space.py); default: system temp dir
+        max_bytes: reject bodies larger than this
+        chunk_size: bytes per read
+
+    Returns:
+        UploadedAudio with the scratch path, SHA-256 and detected format
+
+    Raises:
+        UploadRejected when the bytes are not supported audio or too large
+    """
+    stream = file_storage.stream
+
+    # Read just enough to sniff the container before touching the disk
+    head = b''
+    while len(head) < SNIFF_BYTES:
+        chunk = stream.read(SNIFF_BYTES - len(head))
+        if not chunk:
+            break
+        head += chunk
+    if not head:
+        raise UploadRejected("Uploaded file is empty")
+
+    audio_format, codec = sniff_audio_format(head)
+    if audio_format is None:
+        raise UploadRejected(codec, status_code=415)
+
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(prefix='upload_', suffix=FORMAT_SUFFIXES[audio_format], dir=scratch_dir)
+    size = 0
+    # For tagged MP3s the first frame header sits right after the ID3 tag
+    frame_offset = _skip_id3(head) if audio_format == 'mp3' else 0
+    frame_header = bytearray()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            chunk = head
+            while chunk:
+                start = size
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadRejected(
+                        f"File too large (limit {max_bytes // (1024 * 1024)}MB)", status_code=413
+                    )
+                if frame_offset and len(frame_header) < 4 and size > frame_offset:
+                    frame_header += chunk[max(0, frame_offset - start):frame_offset + 4 - start]
+                    if len(frame_header) == 4 and not _is_mpeg_audio_frame(bytes(frame_header)):
+                        raise UploadRejected("ID3-tagged file does not contain MPEG audio", status_code=415)
+                digest.update(chunk)
+                out.write(chunk)
+                chunk = stream.read(chunk_size)
+        if frame_offset and len(frame_header) < 4:
+            raise UploadRejected("ID3-tagged file does not contain MPEG audio", status_code=415)
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+
+    return UploadedAudio(
+        path=path,
+        sha256=digest.hexdigest(),
+        size=size,
+        format=audio_format,
+        codec=codec,
+        filename=file_storage.filename,
+    )
+
@@ -1,13 +1,42 @@
 """
 YouTube Audio Downloader using RapidAPI
 100% reliable, no IP blocking, works with video playback
+
+The MP3 is piped into ffmpeg as it downloads (utils/audio_stream.py) and
+comes back as an AudioSignal - nothing touches the disk and the song is
+decoded once. Without ffmpeg it is streamed to the job's scratch directory
+in fixed-size chunks instead, so memory per download stays constant
+whatever the file size.
+
+Each API call is counted against the monthly allowance
+(services/rapidapi_quota.py); download_youtube_audio() stops calling
+RapidAPI once it is used up.
+
+Configuration (environment variables):
+    RAPIDAPI_CONNECT_TIMEOUT   seconds to establish a connection (default: 5)
+    RAPIDAPI_READ_TIMEOUT      seconds to wait for the next bytes (default: 30)
+    RAPIDAPI_MAX_DOWNLOAD_MB   largest MP3 accepted (default: 50)
 """
 
 import os
 import requests
-import tempfile
 from urllib.parse import urlparse, parse_qs
 
+from services.http_gateway import get_http_gateway
+from services.rapidapi_quota import get_rapidapi_quota
+from services.scratch_space import ScratchQuotaExceeded, get_scratch_space
+from utils.audio_stream import (CHUNK_SIZE, DownloadTooLarge, StreamDecodeError, StreamTransfer,
+                                decode_stream, ffmpeg_available, partial_size)
+from utils.deadline import NO_DEADLINE, DeadlineExceeded
+from utils.stage_timings import timed_stage
+
+
+def _request_timeout(deadline, stage='download'):
+    """(connect, read) timeouts for requests, each within the remaining deadline"""
+    connect = deadline.timeout(stage, cap=float(os.getenv('RAPIDAPI_CONNECT_TIMEOUT', '5')))
+    read = deadline.timeout(stage, cap=float(os.getenv('RAPIDAPI_READ_TIMEOUT', '30')))
+    return connect, read
+
 def extract_video_id(url):
     """Extract YouTube video ID from URL"""
     try:
@@ -27,15 +56,35 @@ def extract_video_id(url):
         print(f"Error extracting video ID: {e}")
         return None
 
-def download_youtube_audio_rapidapi(url):
+def download_youtube_audio_rapidapi(url, deadline=None, scratch_dir=None, progress_callback=None,
+                                    on_first_bytes=None, offset=0.0, max_duration=None):
     """
     Download audio from YouTube using RapidAPI
     
     This downloads ONLY the audio for chord analysis.
     The YouTube video player still works normally!
     
-    Returns: (audio_path, duration, title)
+    deadline (utils.deadline.Deadline) bounds the HTTP calls and the ffmpeg
+    decode; DeadlineExceeded is raised when it runs out.
+    
+    scratch_dir: the caller's job directory (services/scratch_space.py) - used
+    only without ffmpeg, when the MP3 is written to a subdirectory of it.
+    Without one the caller releases the returned file's directory.
+    
+    progress_callback, if given, is called with the downloaded fraction
+    (0.0-1.0) while the MP3 streams in (when the size is known).
+    on_first_bytes, if given, is called once when the MP3 starts arriving.
+    
+    offset/max_duration: only that part of the song is wanted. ffmpeg decodes
+    just that range and the download stops once it has enough; without ffmpeg
+    the MP3 is cut after roughly offset + max_duration seconds of bytes.
+    
+    Returns: (audio, duration, title) - audio is an AudioSignal when ffmpeg
+    decoded the stream, else the MP3's path
     """
+    deadline = deadline or NO_DEADLINE
+    scratch = get_scratch_space()
+    temp_dir = None
     try:
         # Extract video ID
         video_id = extract_video_id(url)
@@ -63,7 +112,13 @@ def download_youtube_audio_rapidapi(url):
         }
         
         print(f"🔄 Requesting audio download link...")
-        response = requests.get(api_url, headers=headers, params=querystring)
+        with timed_stage('rapidapi_request'):
+            response = get_http_gateway().get(api_url, headers=headers, params=querystring,
+                                              timeout=_request_timeout(deadline), deadline=deadline,
+                                              stage='download')
+        # Every answer counts against the monthly allowance (services/rapidapi_quota.py)
+        get_rapidapi_quota().record(response.status_code, response.headers,
+                                    response.text if response.status_code == 429 else '')
         
         if response.status_code != 200:
             print(f"❌ RapidAPI request failed: {response.status_code}")
@@ -86,62 +141,80 @@ def download_youtube_audio_rapidapi(url):
         print(f"📋 Title: {title}")
         print(f"⏱️ Duration: {duration}s")
         
-        # Download the audio file
+        # Stream the audio straight into ffmpeg (or the job's scratch directory)
         print(f"⬇️ Downloading audio file...")
-        audio_response = requests.get(download_link, timeout=60)
-        
-        if audio_response.status_code != 200:
-            print(f"❌ Failed to download audio: {audio_response.status_code}")
-            return None, 0, "Audio download failed"
+        max_bytes = int(float(os.getenv('RAPIDAPI_MAX_DOWNLOAD_MB', '50')) * 1024 * 1024)
+        with timed_stage('download') as stage:
+            with get_http_gateway().get(download_link, stream=True, timeout=_request_timeout(deadline),
+                                        deadline=deadline, stage='download') as audio_response:
+                if audio_response.status_code != 200:
+                    print(f"❌ Failed to download audio: {audio_response.status_code}")
+                    return None, 0, "Audio download failed"
+                
+                expected = int(audio_response.headers.get('Content-Length') or 0)
+                # Only the bytes up to the end of the wanted range will be read
+                end = offset + max_duration if max_duration else None
+                needed = partial_size(expected, duration, end) or 0
+                if needed > max_bytes:
+                    print(f"❌ Audio file too large: {needed / (1024 * 1024):.1f} MB")
+                    return None, 0, "Audio file too large"
+                
+                transfer = StreamTransfer(audio_response.iter_content(chunk_size=CHUNK_SIZE), needed,
+                                          max_bytes, deadline, progress_callback, on_first_bytes)
+                if ffmpeg_available():
+                    # Download and decode overlap; the PCM never touches the disk and
+                    # ffmpeg stops the download once it has max_duration seconds
+                    audio = decode_stream(transfer, offset=offset, max_duration=max_duration, deadline=deadline)
+                else:
+                    # Refused up front if the announced size would blow the quota
+                    scratch.check_quota(needed)
+                    temp_dir = scratch.create_dir('rapidapi', parent=scratch_dir)
+                    audio = os.path.join(temp_dir, f"{video_id}.mp3")
+                    if needed and needed < expected:
+                        transfer.stop_after = needed
+                    transfer.save(audio)
+                stage.bytes = transfer.bytes
         
-        # Save to temporary file
-        temp_dir = tempfile.mkdtemp()
-        audio_path = os.path.join(temp_dir, f"{video_id}.mp3")
-        
-        with open(audio_path, 'wb') as f:
-            f.write(audio_response.content)
+        file_size = stage.bytes / (1024 * 1024)  # MB
+        print(f"✅ Audio downloaded: {file_size:.2f} MB"
+              + (f" of {expected / (1024 * 1024):.2f} MB" if expected and stage.bytes < expected else ""))
+        if temp_dir:
+            print(f"📁 Saved to: {audio}")
+        else:
+            print(f"🎚️ Decoded while downloading: {audio.duration:.1f}s at {audio.sr} Hz")
         
-        file_size = len(audio_response.content) / (1024 * 1024)  # MB
-        print(f"✅ Audio downloaded: {file_size:.2f} MB")
-        print(f"📁 Saved to: {audio_path}")
-        
-        # Convert to WAV if needed (for chord analysis)
-        try:
-            import subprocess
-            wav_path = audio_path.replace('.mp3', '.wav')
-            print(f"🔄 Converting MP3 to WAV for analysis...")
-            
-            subprocess.run([
-                'ffmpeg', '-i', audio_path,
-                '-ar', '22050',  # 22kHz sample rate
-                '-ac', '1',       # Mono
-                wav_path
-            ], check=True, capture_output=True)
-            
-            print(f"✅ Converted to WAV: {wav_path}")
-            
-            # Clean up MP3
-            os.remove(audio_path)
-            
-            return wav_path, duration, title
-            
-        except Exception as e:
-            print(f"⚠️ Could not convert to WAV: {e}")
-            print(f"Using MP3 directly for analysis")
-            return audio_path, duration, title
+        return audio, duration, title
         
+    except (DeadlineExceeded, ScratchQuotaExceeded) as e:
+        print(f"⏱️ {e} - removing partial download")
+        scratch.release(temp_dir)
+        raise
+    
+    except DownloadTooLarge as e:
+        print(f"❌ {e} - removing partial download")
+        scratch.release(temp_dir)
+        return None, 0, "Audio file too large"
+    
+    except StreamDecodeError as e:
+        print(f"❌ {e}")
+        return None, 0, "Audio decode failed"
+    
     except requests.exceptions.Timeout:
         print(f"❌ Request timeout - audio download took too long")
+        scratch.release(temp_dir)
+        deadline.check('download')
         return None, 0, "Download timeout"
     
     except requests.exceptions.RequestException as e:
         print(f"❌ Network error: {e}")
+        scratch.release(temp_dir)
         return None, 0, f"Network error: {str(e)}"
     
     except Exception as e:
         print(f"❌ Unexpected error in RapidAPI downloader: {e}")
         import traceback
         traceback.print_exc()
+        scratch.release(temp_dir)
         return None, 0, f"Error: {str(e)}"
 
 def test_rapidapi_connection():
@@ -157,11 +230,12 @@ def test_rapidapi_connection():
         
         # Test with a known video
         test_url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
-        audio_path, duration, title = download_youtube_audio_rapidapi(test_url)
+        audio, duration, title = download_youtube_audio_rapidapi(test_url)
         
-        if audio_path:
-            # Clean up test file
-            os.remove(audio_path)
+        if audio is not None:
+            if isinstance(audio, str):
+                # Clean up test file (and its scratch directory)
+                get_scratch_space().release(os.path.dirname(audio))
             return {
                 'status': 'success',
                 'message': 'RapidAPI YouTube downloader working!',
@@ -0,0 +1,205 @@
+"""
+yt-dlp Pool
+Configured YoutubeDL instances reused across downloads
+
+Building a YoutubeDL is not free: option parsing, the extractor registry,
+a fresh HTTP director and cookie jar. More importantly every new instance
+starts with empty in-memory caches, so YouTube's player JavaScript (needed
+to decipher format URLs) is fetched and parsed again for each song. Pooled
+instances keep all of that warm between requests:
+
+    with get_ytdlp_pool().lease(proxy_url, outtmpl, progress_hook) as ydl:
+        info = ydl.extract_info(url, download=False)
+
+A YoutubeDL is not thread-safe, so a lease is exclusive; idle instances are
+kept per proxy (the proxy is fixed when the instance is built). The output
+template, progress hook and download ranges are per lease. An instance
+that raised is dropped rather than handed to the next request.
+
+Format choice: audio-only at the lowest bitrate that still analyzes well
+(chords are detected from mono 22.05 kHz audio, which even ~50 kbps Opus
+or AAC carries intact). Smaller formats download and decode faster.
+
+Extraction is retried only YTDLP_EXTRACTOR_RETRIES times: YouTube's bot
+check ("Sign in to confirm you're not a bot") refuses every retry alike, so
+more attempts only delay the fallback. The yt_dlp circuit breaker
+(services/circuit_breaker.py) counts such an attempt as one failure.
+
+Configuration (environment variables):
+    YTDLP_POOL_SIZE           idle instances kept per proxy (default: 4, 0 disables pooling)
+    YTDLP_MIN_AUDIO_KBPS      lowest audio bitrate accepted for analysis (default: 48)
+    YTDLP_EXTRACTOR_RETRIES   extra attempts at extracting video info (default: 1)
+"""
+
+import copy
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BROWSER_USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                      '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+
+# Seconds yt-dlp waits for a socket; the request Deadline is enforced by the progress hook
+SOCKET_TIMEOUT = 30
+
+
+def audio_format(min_kbps: int) -> str:
+    """yt-dlp format selector: smallest audio-only stream of at least min_kbps"""
+    return (f'worstaudio[vcodec=none][abr>={min_kbps}]'
+            '/bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best[height<=480]/worst')
+
+
+def base_options(min_kbps: int, extractor_retries: int = 1) -> Dict:
+    """Options shared by every pooled instance"""
+    return {
+        'format': audio_format(min_kbps),
+        'quiet': True,
+        'no_warnings': True,
+        'http_chunk_size': 10485760,  # 10MB chunks
+        'socket_timeout': SOCKET_TIMEOUT,
+        'retries': 5,
+        'fragment_retries': 5,
+        'extractor_retries': extractor_retries,
+        'ignoreerrors': True,
+        'age_limit': None,
+        'cookiefile': None,
+        'user_agent': BROWSER_USER_AGENT,
+        'skip_unavailable_fragments': True,
+        'abort_on_unavailable_fragment': False,
+        'keep_fragments': False,
+        'headers': {
+            'User-Agent': BROWSER_USER_AGENT,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'en-us,en;q=0.5',
+            'Accept-Encoding': 'gzip, deflate',
+            'DNT': '1',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+        },
+        'extractor_args': {
+            'youtube': {
+                'skip': ['hls', 'dash'],
+                'player_client': ['android', 'web'],
+                'player_skip': ['configs'],
+            }
+        }
+    }
+
+
+class _Hook:
+    """The pooled instance's one progress hook, forwarding to the current lease's"""
+
+    __slots__ = ('target',)
+
+    def __init__(self):
+        self.target = None
+
+    def __call__(self, d):
+        if self.target:
+            self.target(d)
+
+
+class YtdlpPool:
+    """Exclusive leases on configured YoutubeDL instances, kept idle per proxy"""
+
+    def __init__(self, max_idle: int = 4, min_kbps: int = 48, extractor_retries: int = 1):
+        self.max_idle = max(0, max_idle)
+        self.min_kbps = min_kbps
+        self.extractor_retries = max(0, extractor_retries)
+        self._idle: Dict[Optional[str], List] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def _create(self, proxy_url: Optional[str]):
+        # Imported here so app startup does not pay for yt-dlp's extractor registry
+        import yt_dlp
+
+        options = copy.deepcopy(base_options(self.min_kbps, self.extractor_retries))
+        if proxy_url:
+            options['proxy'] = proxy_url
+        hook = _Hook()
+        options['progress_hooks'] = [hook]
+        ydl = yt_dlp.YoutubeDL(options)
+        ydl._chordypi_hook = hook
+        with self._lock:
+            self.created += 1
+        return ydl
+
+    def _acquire(self, proxy_url: Optional[str]):
+        with self._lock:
+            idle = self._idle.get(proxy_url)
+            if idle:
+                self.reused += 1
+                return idle.pop()
+        return self._create(proxy_url)
+
+    def _release(self, proxy_url: Optional[str], ydl):
+        with self._lock:
+            idle = self._idle.setdefault(proxy_url, [])
+            if len(idle) < self.max_idle:
+                idle.append(ydl)
+                return
+        self._close(ydl)
+
+    def _close(self, ydl):
+        try:
+            ydl.close()
+        except Exception as e:
+            logger.debug(f"Closing a yt-dlp instance failed: {e}")
+
+    @contextmanager
+    def lease(self, proxy_url: Optional[str], outtmpl: str, progress_hook: Optional[Callable] = None,
+              download_ranges: Optional[Callable] = None):
+        """A YoutubeDL configured for one download; returned to the pool afterwards"""
+        ydl = self._acquire(proxy_url)
+        ydl.params['outtmpl']['default'] = outtmpl
+        ydl.params['download_ranges'] = download_ranges
+        ydl._chordypi_hook.target = progress_hook
+        try:
+            yield ydl
+        except BaseException:
+            # Half-finished downloads may leave state behind - start the next request clean
+            ydl._chordypi_hook.target = None
+            with self._lock:
+                self.discarded += 1
+            self._close(ydl)
+            raise
+        ydl._chordypi_hook.target = None
+        ydl.params['download_ranges'] = None
+        self._release(proxy_url, ydl)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded,
+                'min_audio_kbps': self.min_kbps,
+                'extractor_retries': self.extractor_retries,
+            }
+
+
+# Singleton instance
+_ytdlp_pool = None
+_ytdlp_pool_lock = threading.Lock()
+
+
+def get_ytdlp_pool() -> YtdlpPool:
+    """Get or create singleton instance"""
+    global _ytdlp_pool
+    if _ytdlp_pool is None:
+        with _ytdlp_pool_lock:
+            if _ytdlp_pool is None:
+                _ytdlp_pool = YtdlpPool(
+                    max_idle=int(os.getenv('YTDLP_POOL_SIZE', '4')),
+                    min_kbps=int(os.getenv('YTDLP_MIN_AUDIO_KBPS', '48')),
+                    extractor_retries=int(os.getenv('YTDLP_EXTRACTOR_RETRIES', '1'))
+                )
+    return _ytdlp_pool